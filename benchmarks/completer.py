@@ -0,0 +1,77 @@
+"""
+Benchmark filename completion over a large directory.
+
+Usage::
+
+    $ python benchmarks/completer.py [NAMES] [PATTERNS]
+"""
+import os
+import re
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from twosheds.completer import Completer  # noqa
+
+EXTENSIONS = [
+    "o", "a", "so", "pyc", "pyo", "class", "swp", "swo", "bak", "tmp", "log",
+    "orig", "rej", "obj", "lib", "dll", "exe", "pdb", "ilk", "exp", "elc",
+    "hi", "dyn_o", "dyn_hi", "beam", "cmo", "cmi", "cmx", "d", "dep", "gcda",
+    "gcno", "lo", "la", "mod", "ko", "pch", "gch", "idb", "tlog",
+]
+OTHERS = [r".*~", r"#.*#", r"\.#.*", r".*\.egg-info", r"__pycache__",
+          r"\.DS_Store", r"\.git", r".*\.sw[a-p]$", r"core\.[0-9]+",
+          r"(?i)thumbs\.db"]
+
+
+def make_patterns(n):
+    patterns = [r".*\.%s$" % re.escape(ext) for ext in EXTENSIONS] + OTHERS
+    return patterns[:n]
+
+
+def naive_exclude_matches(patterns, matches):
+    """The per-match, per-pattern filter this benchmark compares against."""
+    for match in matches:
+        for exclude_pattern in patterns:
+            if re.match(exclude_pattern, match) is not None:
+                break
+        else:
+            yield match
+
+
+def main(n_names=100000, n_patterns=50):
+    path = tempfile.mkdtemp()
+    try:
+        suffixes = EXTENSIONS + ["c", "h", "py", "txt"] * 10
+        for i in range(n_names):
+            name = "file%d.%s" % (i, suffixes[i % len(suffixes)])
+            open(os.path.join(path, name), "w").close()
+        os.chdir(path)
+        patterns = make_patterns(n_patterns)
+        completer = Completer([], exclude=patterns)
+        completer.get_matches("")  # warm the directory index
+        names = list(completer.index.listing("."))
+
+        def naive():
+            return list(naive_exclude_matches(patterns, names))
+
+        def compiled():
+            return list(completer.exclude_matches(names))
+
+        assert naive() == compiled()
+        print("%d names, %d patterns" % (n_names, len(patterns)))
+        for name, f in [("naive filter", naive),
+                        ("compiled filter", compiled),
+                        ("get_matches", lambda: completer.get_matches(""))]:
+            best = min(timeit.repeat(f, number=1, repeat=3))
+            print("%-16s %8.1f ms" % (name, best * 1000))
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
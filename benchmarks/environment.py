@@ -0,0 +1,44 @@
+"""
+Benchmark inverse variable substitution in a large environment.
+
+Usage::
+
+    $ python benchmarks/environment.py [VARIABLES]
+"""
+import os
+import random
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from twosheds.environment import Environment  # noqa
+from twosheds.transform import VariableTransform  # noqa
+
+SENTENCE = "ls -l /home/arthurjackson /usr/local/bin ~ . ..".split()
+
+
+def main(n=300):
+    random.seed(0)
+    variables = {}
+    for i in range(n):
+        # a few variables hold values several kilobytes long
+        length = 4096 if i % 50 == 0 else random.randint(4, 64)
+        variables["VAR%d" % i] = "".join(random.choice(string.ascii_letters)
+                                         for _ in range(length))
+    variables["HOME"] = "/home/arthurjackson"
+    rebuilt = VariableTransform(dict(variables))
+    indexed = VariableTransform(Environment(dict(variables)))
+    assert (list(rebuilt._transform(SENTENCE, inverse=True)) ==
+            list(indexed._transform(SENTENCE, inverse=True)))
+    for name, t in [("rebuilt", rebuilt), ("indexed", indexed)]:
+        best = min(timeit.repeat(
+            lambda: list(t._transform(SENTENCE, inverse=True)),
+            number=1000, repeat=3))
+        print("%-8s %8.1f us per sentence" % (name, best * 1000))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,51 @@
+"""
+Benchmark fuzzy matching over many candidates.
+
+Usage::
+
+    $ python benchmarks/fuzzy.py [CANDIDATES]
+"""
+import os
+import random
+import re
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from twosheds.fuzzy import Candidates  # noqa
+
+QUERIES = ["a", "mkf", "srcmain", "qzx"]
+
+
+def naive_search(strings, query):
+    """The per-string loop this benchmark compares against."""
+    regex = re.compile(".*?".join(re.escape(char) for char in query),
+                       re.IGNORECASE)
+    return [s for s in strings if regex.search(s)]
+
+
+def main(n=100000):
+    random.seed(0)
+    alphabet = string.ascii_lowercase + "._-"
+    strings = ["".join(random.choice(alphabet)
+                       for _ in range(random.randint(4, 32)))
+               for _ in range(n)]
+    best = min(timeit.repeat(lambda: Candidates(strings), number=1, repeat=3))
+    print("%d candidates, prepared in %.1f ms" % (n, best * 1000))
+    candidates = Candidates(strings)
+    for query in QUERIES:
+        found = [s for s, _ in candidates.search(query)]
+        assert found == naive_search(strings, query)
+        indexed = min(timeit.repeat(lambda: list(candidates.search(query)),
+                                    number=1, repeat=3))
+        naive = min(timeit.repeat(lambda: naive_search(strings, query),
+                                  number=1, repeat=3))
+        print("%-8s %6d matches  naive %7.1f ms  indexed %7.1f ms"
+              % (query, len(found), naive * 1000, indexed * 1000))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
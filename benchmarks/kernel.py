@@ -0,0 +1,42 @@
+"""
+Benchmark running commands directly against running them with a new sh each,
+or with one long-lived sh.
+
+Usage::
+
+    $ python benchmarks/kernel.py [COMMANDS]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from twosheds.coprocess import Coprocess  # noqa
+from twosheds.kernel import Kernel  # noqa
+from twosheds.sentence import Sentence  # noqa
+from twosheds.token import Word  # noqa
+
+
+def main(n=500):
+    kernel = Kernel()
+    coprocess = Kernel(coprocess=Coprocess())
+    # sh runs true itself, but must start /bin/true
+    for command in ["true", "/bin/true"]:
+        sentence = Sentence([Word(command)])
+        assert kernel.resolve(sentence) is not None
+        for name, run in [
+                ("sh", lambda: kernel.respond(str(sentence))),
+                ("coprocess", lambda: coprocess.respond(str(sentence))),
+                ("direct", lambda: kernel.execute(sentence))]:
+            start = time.time()
+            for _ in range(n):
+                run()
+            elapsed = time.time() - start
+            print("%-10s %-9s %6.0f commands/s" % (command, name,
+                                                   n / elapsed))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
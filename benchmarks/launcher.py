@@ -0,0 +1,44 @@
+"""
+Benchmark the time taken to start and wait for a command, forking the shell
+against asking the launcher, as the shell holds more and more memory.
+
+Usage::
+
+    $ python benchmarks/launcher.py [SPAWNS] [MEGABYTES]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from twosheds.kernel import Kernel, find_executable  # noqa
+from twosheds.launcher import Launcher  # noqa
+
+
+def time_spawns(kernel, n):
+    path = find_executable("true")
+    start = time.time()
+    for _ in range(n):
+        kernel.spawn(path, ["true"])
+    return (time.time() - start) / n
+
+
+def main(spawns=200, megabytes=1024):
+    launcher = Launcher()
+    try:
+        for size in [0, megabytes // 4, megabytes]:
+            heap = None
+            # every page is touched, so each is mapped when the shell forks
+            heap = b"x" * (size << 20)
+            for name, kernel in [("fork", Kernel()),
+                                 ("launcher", Kernel(launcher=launcher))]:
+                print("%5d MB %-10s %6.2f ms" % (
+                    len(heap) >> 20, name, 1000 * time_spawns(kernel, spawns)))
+    finally:
+        launcher.close()
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
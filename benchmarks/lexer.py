@@ -0,0 +1,132 @@
+"""
+Benchmark the lexer against the character-at-a-time lexer it replaced.
+
+Usage::
+
+    $ python benchmarks/lexer.py [MEGABYTES]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from twosheds import token  # noqa
+from twosheds.lexer import Lexer, gen_tokens  # noqa
+
+LINES = [
+    "cd /usr/local/src; make -j4 && make install\n",
+    "echo 'building twosheds' \"$HOME\" > /tmp/log 2>&1\n",
+    "(cd build || exit 1) | tee -a out\\ file.txt\n",
+    "for f in *.py; do python -m py_compile $f; done\n",
+]
+
+
+def reference_tokens(text):
+    """The lexer which used to be Program.gen_tokens."""
+    metacharacters = {"|", "&", ";", "(", ")", " ", "\t"}
+    current_token = []
+    escape = False
+    quote = None
+    skip = 0
+    for char, peek in zip(text, text[1:] + " "):
+        if skip > 0:
+            skip -= 1
+            continue
+        if quote is None:
+            if escape:
+                current_token.append(char)
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char in ("'", '"'):
+                quote = char
+            elif char in metacharacters:
+                if current_token:
+                    yield token.Word(''.join(current_token))
+                current_token = []
+                if char == "(":
+                    yield token.LParen()
+                elif char == ")":
+                    yield token.RParen()
+                elif char in "|&;":
+                    if peek == char:
+                        yield token.Word(char + peek)
+                        skip += 1
+                    else:
+                        yield token.Word(char)
+            else:
+                current_token.append(char)
+        elif char == quote:
+            if current_token:
+                yield token.DoubleQuote(''.join(current_token))
+            current_token = []
+            quote = None
+        else:
+            current_token.append(char)
+    if quote is not None:
+        raise ValueError("No closing quotation")
+    if escape:
+        raise ValueError("No escaped character")
+    if current_token:
+        yield token.Word(''.join(current_token))
+
+
+def throughput(lexer, text):
+    start = time.time()
+    count = sum(1 for _ in lexer(text))
+    elapsed = time.time() - start
+    return count, len(text) / elapsed / 2 ** 20
+
+
+def relex(lines):
+    """Lex a command spanning ``lines`` by lexing it again from the start
+    whenever a line is added, until it lexes without error."""
+    text = ""
+    for line in lines:
+        text += line
+        try:
+            return list(gen_tokens(text))
+        except ValueError:
+            pass
+
+
+def feed(lines):
+    """Lex a command spanning ``lines`` by feeding each line as it comes."""
+    lexer = Lexer()
+    tokens = []
+    for line in lines:
+        tokens.extend(lexer.feed(line))
+        if lexer.complete:
+            break
+    tokens.extend(lexer.close())
+    return tokens
+
+
+def main(megabytes=4):
+    random.seed(0)
+    lines = []
+    size = 0
+    while size < megabytes * 2 ** 20:
+        line = random.choice(LINES)
+        lines.append(line)
+        size += len(line)
+    text = "".join(lines)
+    for name, lexer in [("reference", reference_tokens),
+                        ("lexer", gen_tokens)]:
+        count, rate = throughput(lexer, text)
+        print("%-10s %d tokens  %6.1f MB/s" % (name, count, rate))
+    # a quotation pasted over many lines
+    lines = ["echo '"] + ["line %d of the quotation" % i
+                          for i in range(2000)] + ["' done"]
+    for name, lexer in [("relex", relex), ("feed", feed)]:
+        start = time.time()
+        lexer(lines)
+        print("%-10s %d lines  %8.1f ms" % (name, len(lines),
+                                            (time.time() - start) * 1000))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,36 @@
+"""
+Benchmark running a command which waits for each of a list of inputs one at
+a time against running them with the ``parallel`` builtin, which overlaps the
+waits. On a machine with several CPUs, a busy command gains as well.
+
+Usage::
+
+    $ python benchmarks/parallel.py [INPUTS [JOBS]]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from twosheds.cli import CommandLineInterface  # noqa
+
+COMMAND = "sleep 0.{}"
+
+
+def main(n=16, jobs=8):
+    cli = CommandLineInterface({}, None)
+    inputs = ["1"] * n
+    for name, text in [
+            ("one at a time", "; ".join(COMMAND.replace("{}", value)
+                                        for value in inputs)),
+            ("parallel", "parallel -j %d %s ::: %s" % (
+                jobs, COMMAND, " ".join(inputs)))]:
+        start = time.time()
+        assert cli.run([text]) == 0
+        print("%-14s %6.2f s" % (name, time.time() - start))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,46 @@
+"""
+Benchmark the throughput of pipelines run by twosheds against the same
+pipelines run with ``sh -c``.
+
+Usage::
+
+    $ python benchmarks/pipeline.py [MEGABYTES]
+"""
+import os
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from twosheds.job import Job, split_pipeline  # noqa
+from twosheds.kernel import Kernel  # noqa
+from twosheds.lexer import gen_tokens  # noqa
+from twosheds.sentence import Sentence  # noqa
+
+
+def copy():
+    shutil.copyfileobj(sys.stdin, sys.stdout, 2 ** 16)
+
+
+def main(megabytes=1024):
+    kernel = Kernel()
+    size = megabytes * 2 ** 20
+    source = "head -c %d /dev/zero" % size
+    for text in ["%s | cat | cat > /dev/null" % source,
+                 "%s | copy | cat > /dev/null" % source]:
+        stages = split_pipeline(Sentence(list(gen_tokens(text))))
+        runs = [("twosheds", Job(stages, {"copy": copy}).run)]
+        if "copy" not in text:
+            runs.append(("sh -c", lambda: kernel.respond(text)))
+        for name, run in runs:
+            start = time.time()
+            assert run() == 0
+            elapsed = time.time() - start
+            print("%-45s %-8s %7.1f MB/s" % (text.replace(source, "head"),
+                                             name, megabytes / elapsed))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
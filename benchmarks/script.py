@@ -0,0 +1,57 @@
+"""
+Benchmark running scripts: the time taken to start twosheds on a command, and
+the number of sentences of a script run per second.
+
+Usage::
+
+    $ python benchmarks/script.py [STARTS] [LINES]
+"""
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from twosheds.cli import CommandLineInterface  # noqa
+from twosheds.script import read_chunks  # noqa
+
+
+def time_starts(argv, n):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    start = time.time()
+    for _ in range(n):
+        subprocess.check_call(argv, env=env)
+    return (time.time() - start) / n
+
+
+def main(starts=50, lines=100000):
+    script = os.path.join(ROOT, "scripts", "twosheds")
+    for name, argv in [
+            ("sh -c true", ["sh", "-c", "true"]),
+            ("twosheds -c true", [sys.executable, script, "-c", "true"]),
+            ("import shell", [sys.executable, "-c",
+                              "import readline, twosheds.shell"])]:
+        print("%-20s %6.1f ms" % (name, 1000 * time_starts(argv, starts)))
+
+    path = os.path.join(ROOT, "benchmarks", ".script.sh")
+    with open(path, "w") as f:
+        for i in range(lines):
+            f.write("export TWOSHEDS_BENCHMARK=%d  # a comment\n" % i)
+    try:
+        cli = CommandLineInterface({}, None)
+        fd = os.open(path, os.O_RDONLY)
+        start = time.time()
+        try:
+            assert cli.run(read_chunks(fd)) == 0
+        finally:
+            os.close(fd)
+        elapsed = time.time() - start
+    finally:
+        os.remove(path)
+    print("%-20s %6.0f sentences/s" % ("script", lines / elapsed))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
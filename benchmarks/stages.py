@@ -0,0 +1,65 @@
+"""
+Benchmark passing records between streaming stages against passing text
+between builtins through pipes.
+
+Usage::
+
+    $ python benchmarks/stages.py [RECORDS]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from twosheds.job import Job, Stage, split_pipeline  # noqa
+from twosheds.lexer import gen_tokens  # noqa
+from twosheds.sentence import Sentence  # noqa
+
+
+def numbers(records, n):
+    return iter(range(int(n)))
+
+
+def double(records):
+    return (2 * record for record in records)
+
+
+def total(records):
+    yield sum(records)
+
+
+def text_numbers(n):
+    for i in range(int(n)):
+        sys.stdout.write("%d\n" % i)
+
+
+def text_double():
+    for line in sys.stdin:
+        sys.stdout.write("%d\n" % (2 * int(line)))
+
+
+def text_total():
+    sys.stdout.write("%d\n" % sum(int(line) for line in sys.stdin))
+
+
+def main(n=10 ** 6):
+    commands = {
+        "numbers": Stage(numbers), "double": Stage(double),
+        "total": Stage(total), "text_numbers": text_numbers,
+        "text_double": text_double, "text_total": text_total,
+    }
+    for name, text in [
+            ("records", "numbers %d | double | total | cat > /dev/null"),
+            ("text", "text_numbers %d | text_double | text_total"
+                     " | cat > /dev/null")]:
+        stages = split_pipeline(Sentence(list(gen_tokens(text % n))))
+        start = time.time()
+        assert Job(stages, commands).run() == 0
+        elapsed = time.time() - start
+        print("%-8s %10.0f records/s" % (name, n / elapsed))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
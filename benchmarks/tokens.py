@@ -0,0 +1,91 @@
+"""
+Benchmark the memory and speed of token streams against token objects.
+
+Usage::
+
+    $ python benchmarks/tokens.py [MEGABYTES]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from twosheds.lexer import gen_tokens, lex  # noqa
+
+LINES = [
+    "cd /usr/local/src; make -j4 && make install\n",
+    "echo 'building twosheds' \"$HOME\" > /tmp/log 2>&1\n",
+    "(cd build || exit 1) | tee -a out\\ file.txt\n",
+    "for f in *.py; do python -m py_compile $f; done\n",
+]
+
+
+class DictToken(object):
+    """A token as it was before tokens had slots."""
+    def __init__(self, text):
+        self.text = text
+
+    def __str__(self):
+        return self.text.replace(" ", "\\ ")
+
+
+def sizeof_objects(tokens):
+    size = sys.getsizeof(tokens)
+    for t in tokens:
+        size += sys.getsizeof(t)
+        if hasattr(t, "__dict__"):
+            size += sys.getsizeof(t.__dict__)
+        text = getattr(t, "_text", None) or getattr(t, "text", None)
+        if text is not None:
+            size += sys.getsizeof(text)
+    return size
+
+
+def sizeof_stream(stream):
+    return (sys.getsizeof(stream) + sys.getsizeof(stream.kinds) +
+            sys.getsizeof(stream.starts) + sys.getsizeof(stream.ends) +
+            sys.getsizeof(stream.quotes))
+
+
+def timed(func):
+    start = time.time()
+    result = func()
+    return result, (time.time() - start) * 1000
+
+
+def main(megabytes=4):
+    random.seed(0)
+    lines = []
+    size = 0
+    while size < megabytes * 2 ** 20:
+        line = random.choice(LINES)
+        lines.append(line)
+        size += len(line)
+    text = "".join(lines)
+    print("%d bytes of source" % len(text))
+
+    objects, elapsed = timed(lambda: list(gen_tokens(text)))
+    print("objects   lex %7.1f ms" % elapsed)
+    old = [DictToken(getattr(t, "text", "")) for t in objects]
+    stream, elapsed = timed(lambda: lex(text))
+    print("stream    lex %7.1f ms" % elapsed)
+    _, elapsed = timed(lambda: [str(t) for t in old])
+    print("dict      str %7.1f ms" % elapsed)
+    views, elapsed = timed(lambda: list(stream))
+    print("stream   view %7.1f ms" % elapsed)
+    _, elapsed = timed(lambda: [str(t) for t in views])
+    print("views     str %7.1f ms" % elapsed)
+
+    print("%d tokens" % len(stream))
+    print("dict tokens     %6.1f MB" % (sizeof_objects(old) / 2. ** 20))
+    print("slot tokens     %6.1f MB" % (sizeof_objects(objects) / 2. ** 20))
+    print("stream          %6.1f MB" % (sizeof_stream(stream) / 2. ** 20))
+    print("stream + views  %6.1f MB" % (
+        (sizeof_stream(stream) + sizeof_objects(list(stream))) / 2. ** 20))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,55 @@
+"""
+Benchmark fused and unfused transform pipelines.
+
+Usage::
+
+    $ python benchmarks/transform.py
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from twosheds.environment import Environment  # noqa
+from twosheds.sentence import Sentence  # noqa
+from twosheds.token import Word  # noqa
+from twosheds.transform import (Pipeline, TildeTransform,  # noqa
+                                VariableTransform)
+
+HOME = "/home/arthurjackson"
+SIZES = [10, 1000, 100000]
+
+
+def unfused(sentence, transforms):
+    """The transform-by-transform loop this benchmark compares against."""
+    for t in transforms:
+        sentence = t(sentence)
+    return sentence
+
+
+def main():
+    random.seed(0)
+    env = Environment({"HOME": HOME, "EDITOR": "vim", "PAGER": "less"})
+    transforms = [VariableTransform(env), TildeTransform(HOME)]
+    words = ["ls", "-l", "$HOME", "~/src", "file.txt", "$EDITOR", "x~"]
+    for n, kind in [(n, kind) for kind in (Word, str) for n in SIZES]:
+        tokens = [kind(random.choice(words)) for _ in range(n)]
+        number = max(1, 100000 // n)
+        pipeline = Pipeline(transforms)
+        results = []
+        for name, func in [
+                ("unfused", lambda: unfused(Sentence(tokens), transforms)),
+                ("fused", lambda: pipeline(Sentence(tokens))),
+                ]:
+            best = min(timeit.repeat(func, number=number, repeat=7))
+            results.append("%s %10.1f us" % (name, best / number * 1e6))
+        assert ([str(t) for t in pipeline(Sentence(tokens)).tokens] ==
+                [str(t) for t in unfused(Sentence(tokens), transforms).tokens])
+        print("%6d %-5s tokens  %s" % (n, kind.__name__, "  ".join(results)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import pytest
+
+from twosheds.alias import Aliases, DictAliases
+from twosheds.program import Program
+
+
+def expand(aliases, name):
+    return [str(t) for t in aliases.expansion(name)]
+
+
+def test_nested():
+    aliases = Aliases({"ll": "la -l", "la": "ls -a", "ls": "ls -G"})
+    assert expand(aliases, "ll") == ["ls", "-G", "-a", "-l"]
+    aliases["ls"] = "ls --color"
+    assert expand(aliases, "ll") == ["ls", "--color", "-a", "-l"]
+
+
+def test_lexed_once(monkeypatch):
+    aliases = Aliases({"ls": "ls -G"})
+    monkeypatch.setattr("twosheds.alias.gen_tokens", None)
+    assert expand(aliases, "ls") == ["ls", "-G"]
+
+
+def test_loop_is_refused():
+    aliases = Aliases({"a": "b -x", "b": "c"})
+    version = aliases.version
+    with pytest.raises(ValueError):
+        aliases["c"] = "a"
+    assert "c" not in aliases
+    with pytest.raises(ValueError):
+        aliases["b"] = "a"
+    assert aliases["b"] == "c"
+    assert expand(aliases, "a") == ["c", "-x"]
+    assert aliases.version == version
+    assert Aliases(aliases).version != version
+
+
+def test_unknown():
+    with pytest.raises(KeyError):
+        Aliases().expansion("ls")
+
+
+def test_program_expands_aliases():
+    aliases = Aliases({"ll": "ls -l", "ls": "ls -G"})
+    program = Program("ll /; echo ll")
+    sentences = program.expand_aliases(program.gen_tokens(), aliases)
+    assert [[str(t) for t in s] for s in sentences] == \
+        [["ls", "-G", "-l", "/"], ["echo", "ll"]]
+
+
+def test_dict_follows_changes():
+    table = {"ls": "ls -G"}
+    aliases = DictAliases(table)
+    version = aliases.version
+    table["la"] = "ls -a"
+    assert "la" in aliases
+    assert aliases.version != version
+    assert expand(aliases, "la") == ["ls", "-G", "-a"]
+    table["la"] = "ls -A"
+    assert expand(aliases, "la") == ["ls", "-G", "-A"]
+    # through the alias it expands to
+    table["ls"] = "ls --color"
+    assert expand(aliases, "la") == ["ls", "--color", "-A"]
+    del table["la"]
+    with pytest.raises(KeyError):
+        aliases.expansion("la")
+
+
+def test_dict_written_through():
+    table = {"ls": "ls -G"}
+    aliases = DictAliases(table)
+    version = aliases.version
+    aliases["la"] = "ls -a"
+    assert table == {"ls": "ls -G", "la": "ls -a"}
+    assert aliases.version != version
+    with pytest.raises(ValueError):
+        aliases["ls"] = "la"
+    assert table["ls"] == "ls -G"
+    del aliases["la"]
+    assert table == {"ls": "ls -G"}
+
+
+def test_dict_version_is_cheap(monkeypatch):
+    table = dict(("a%d" % i, "ls") for i in range(100))
+    aliases = DictAliases(table)
+    version = aliases.version
+    monkeypatch.setattr("twosheds.alias.gen_tokens", None)
+    # neither lexes nor looks over the dictionary again
+    monkeypatch.setattr(aliases, "_sync", None)
+    assert aliases.version == version
+    assert expand(aliases, "a1") == ["ls"]
+
+
+def test_dict_loop_expands_one_level():
+    aliases = DictAliases({"a": "b -x", "b": "a -y", "ll": "la -l",
+                           "la": "ls -a"})
+    assert expand(aliases, "a") == ["b", "-x"]
+    assert expand(aliases, "ll") == ["ls", "-a", "-l"]
+    program = Program("a; ll")
+    sentences = program.expand_aliases(program.gen_tokens(), {"a": "b -x",
+                                                              "b": "a -y",
+                                                              "ll": "la -l",
+                                                              "la": "ls -a"})
+    assert [[str(t) for t in s] for s in sentences] == \
+        [["b", "-x"], ["ls", "-a", "-l"]]
+
+
+def test_program_lexes_dict_once(monkeypatch):
+    table = {"ls": "ls -G", "ll": "ls -l"}
+    program = Program("ls")
+    list(program.expand_aliases(program.gen_tokens(), table))
+    monkeypatch.setattr("twosheds.alias.gen_tokens", None)
+    sentences = program.expand_aliases(program.gen_tokens(), table)
+    assert [[str(t) for t in s] for s in sentences] == [["ls", "-G"]]
@@ -0,0 +1,31 @@
+from twosheds.cache import ParseCache
+
+
+def test_lru():
+    cache = ParseCache(maxsize=2)
+    cache.put("a", 0, "A")
+    cache.put("b", 0, "B")
+    assert cache.get("a", 0) == "A"
+    cache.put("c", 0, "C")
+    assert cache.get("b", 0) is None
+    assert cache.get("a", 0) == "A"
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_maxchars():
+    cache = ParseCache(maxchars=5)
+    cache.put("abc", 0, 1)
+    cache.put("de", 0, 2)
+    cache.put("f", 0, 3)
+    assert "abc" not in cache
+    assert cache.chars == 3
+    cache.put("too long", 0, 4)
+    assert "too long" not in cache
+
+
+def test_new_version_invalidates():
+    cache = ParseCache()
+    cache.put("ls", 0, "ls")
+    assert cache.get("ls", 1) is None
+    assert cache.invalidations == 1
+    assert len(cache) == 0
@@ -0,0 +1,94 @@
+from twosheds.cli import CommandLineInterface
+
+
+class FakeTerminal(object):
+    def __init__(self, lines):
+        self.lines = lines
+        self.errors = []
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def error(self, msg):
+        self.errors.append(msg)
+
+
+def make_cli(lines, calls):
+    cli = CommandLineInterface({}, FakeTerminal(lines))
+    cli.commands = {"say": lambda *args: calls.append(args)}
+    return cli
+
+
+def test_interact_continues_quotation():
+    calls = []
+    cli = make_cli(["say 'a", "b", "c' d", "say never"], calls)
+    cli.interact()
+    assert calls == [('"abc"', "d")]
+
+
+def test_interact_runs_each_sentence_once():
+    calls = []
+    cli = make_cli(["say 1; say '2", "'"], calls)
+    cli.interact()
+    assert calls == [("1",), ('"2"',)]
+
+
+def test_interact_reports_errors():
+    cli = make_cli(["say 1", "say 2"], [])
+    cli.commands = {"say": lambda *args: 1 / 0}
+    cli.interact()
+    assert "ZeroDivisionError" in cli.terminal.errors[0]
+
+
+def test_parse_cache():
+    calls = []
+    cli = make_cli(["say hi"] * 2, calls)
+    cli.interact()
+    cli.interact()
+    assert calls == [("hi",), ("hi",)]
+    assert (cli.parse_cache.hits, cli.parse_cache.misses) == (1, 1)
+
+
+def test_parse_cache_follows_aliases():
+    calls = []
+    cli = make_cli(["hi"], calls)
+    cli.aliases = {"hi": "say hello"}
+    cli.interact()
+    cli.aliases["hi"] = "say goodbye"
+    cli.interact()
+    assert calls == [("hello",), ("goodbye",)]
+
+
+def test_aliases_follow_their_dictionary():
+    calls = []
+    table = {}
+    cli = CommandLineInterface(table, FakeTerminal(["hi", "hi"]))
+    cli.commands = {"say": lambda *args: calls.append(args)}
+    table["hi"] = "say hello"
+    assert "hi" in cli.aliases
+    cli.interact()
+    # the parse cache is dropped once the dictionary changes size
+    table["bye"] = "say goodbye"
+    table["hi"] = "bye"
+    cli.interact()
+    assert calls == [("hello",), ("goodbye",)]
+
+
+def test_eval_here_document(capfd):
+    cli = CommandLineInterface({}, None)
+    cli.eval("cat <<EOF\n$TWOSHEDS_UNSET  ~\nEOF\necho after")
+    assert capfd.readouterr()[0] == "  ~\nafter\n"
+
+
+def test_loop_runs_while_a_command_does():
+    ticks = []
+
+    def ticker():
+        while True:
+            ticks.append(None)
+            yield 0.01
+
+    cli = make_cli(["sleep 0.2"], [])
+    cli.loop.spawn(ticker())
+    cli.interact()
+    assert len(ticks) > 5
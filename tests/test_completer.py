@@ -1,4 +1,8 @@
 import os
+import threading
+import time
+
+from twosheds.frecency import FrecencyIndex
 
 
 class TestCompleter():
@@ -40,3 +44,174 @@ class TestCompleter():
         assert file1 == completer.complete("a", 0)
         assert file1 == completer.complete("a-", 0)
         assert file1 == completer.complete("a-b", 0)
+
+    def test_gen_filename_completions_cached(self, completer, tmpdir,
+                                             monkeypatch):
+        completer.use_suffix = False
+        os.chdir(str(tmpdir))
+        tmpdir.join('foo').write('')
+        assert completer.get_matches('f') == ['foo']
+
+        def scandir(path):
+            raise AssertionError("directory should not be listed again")
+        monkeypatch.setattr('twosheds.index.scandir', scandir)
+        assert completer.get_matches('fo') == ['foo']
+
+    def test_inflect_without_stat(self, completer, tmpdir, monkeypatch):
+        os.chdir(str(tmpdir))
+        tmpdir.mkdir('dir')
+        tmpdir.join('file').write('')
+        tmpdir.join('link').mksymlinkto(tmpdir.join('dir'))
+        stats = []
+
+        def isdir(path):
+            stats.append(path)
+            return os.path.lexists(path)
+        monkeypatch.setattr(os.path, 'isdir', isdir)
+        matches = completer.get_matches('')
+        assert sorted(matches) == ['dir/', 'file ', 'link/']
+        assert stats == ['link']
+
+    def test_exclude_matches(self, completer):
+        completer.exclude_patterns = [r'.*\.o$', r'.*~', r'.*\.py[co]$',
+                                      r'(?i)readme', r'(a)\1']
+        names = ['main.c', 'main.o', 'main.c~', 'x.pyc', 'x.py', 'README',
+                 'aa', 'ab', 'main.o\n']
+        assert list(completer.exclude_matches(names)) == ['main.c', 'x.py',
+                                                          'ab']
+
+    def test_exclude_matches_recompiles(self, completer):
+        completer.exclude_patterns = [r'.*\.o$']
+        exclude_filter = completer.exclude_filter
+        assert completer.exclude_filter is exclude_filter
+        completer.exclude_patterns.append(r'.*\.c$')
+        assert completer.exclude_filter is not exclude_filter
+        assert list(completer.exclude_matches(['a.c', 'a.o', 'a.h'])) == [
+            'a.h']
+
+    def test_gen_command_completions(self, completer, tmpdir, monkeypatch):
+        completer.use_suffix = False
+        os.chdir(str(tmpdir))
+        tmpdir.mkdir('bin').join('twosheds').write('')
+        tmpdir.join('bin', 'twosheds').chmod(0o755)
+        monkeypatch.setenv('PATH', str(tmpdir.join('bin')))
+        assert completer.get_matches('two', command=True) == ['twosheds']
+        assert completer.get_matches('bi', command=True) == []
+        assert completer.get_matches('./bi', command=True) == ['./bin']
+
+    def test_gen_extension_completions(self, completer):
+        unblocked = threading.Event()
+
+        def fast(word):
+            yield word + 'fast'
+
+        def slow(word):
+            unblocked.wait()
+            yield word + 'slow'
+
+        completer.extensions = [slow, fast]
+        completer.extension_budget = 0.05
+        try:
+            matches = list(completer.gen_extension_completions('$QX'))
+        finally:
+            unblocked.set()
+        assert matches == ['$QXfast']
+        assert completer.extension_stats[fast].calls == 1
+        assert completer.extension_stats[fast].overruns == 0
+        assert completer.extension_stats[slow].overruns == 1
+
+    def test_gen_extension_completions_one_at_a_time(self, completer):
+        unblocked = threading.Event()
+        calls = []
+
+        def slow(word):
+            calls.append(word)
+            unblocked.wait()
+            yield word + 'slow'
+
+        completer.extensions = [slow]
+        completer.extension_budget = 0.05
+        try:
+            for _ in range(10):
+                assert list(completer.gen_extension_completions('$QX')) == []
+        finally:
+            unblocked.set()
+        assert calls == ['$QX']
+        assert completer.extension_stats[slow].overruns == 10
+        # and once it has finished it runs again
+        while completer.extension_stats[slow].calls == 0:
+            time.sleep(0.01)
+        completer.extension_budget = 1
+        assert list(completer.gen_extension_completions('$QY')) == [
+            '$QYslow']
+
+    def test_gen_extension_completions_merged(self, completer):
+        def branches(word):
+            for branch in ['$QXmaster', '$QXdevelop']:
+                yield branch
+
+        completer.use_suffix = False
+        completer.extensions = [branches]
+        assert completer.get_matches('$QX') == ['$QXmaster', '$QXdevelop']
+
+    def test_get_session_narrows(self, completer, tmpdir):
+        os.chdir(str(tmpdir))
+        for name in ['fodder', 'foo', 'food', 'bar']:
+            tmpdir.join(name).write('')
+        session = completer.get_session('fo')
+        assert session.matches == ['fodder', 'foo', 'food']
+        narrowed = completer.get_session('foo')
+        assert narrowed.key == session.key
+        assert narrowed.completions is session.completions
+        assert narrowed.matches == ['foo', 'food']
+        assert completer.get_session('f').key is not session.key
+
+    def test_get_session_invalidated(self, completer, tmpdir):
+        os.chdir(str(tmpdir))
+        tmpdir.join('foo').write('')
+        session = completer.get_session('f')
+        tmpdir.join('food').write('')
+        st = os.stat(str(tmpdir))
+        os.utime(str(tmpdir), (st.st_atime, st.st_mtime + 1))
+        assert completer.get_session('fo').key != session.key
+        assert completer.get_session('fo').matches == ['foo', 'food']
+
+    def test_complete_caches_completions(self, completer, tmpdir):
+        os.chdir(str(tmpdir))
+        tmpdir.join('foo').write('')
+        assert completer.complete('f', 0) == 'foo '
+        assert completer.session.completions == {'foo ': 'foo '}
+        assert completer.complete('f', 1) is None
+
+    def test_get_matches_fuzzy(self, completer, tmpdir):
+        completer.use_suffix = False
+        os.chdir(str(tmpdir))
+        for name in ['Makefile', 'main.c', 'README']:
+            tmpdir.join(name).write('')
+        assert completer.get_matches('mc') == []
+        completer.fuzzy = True
+        assert completer.get_matches('ma') == ['main.c']
+        assert completer.get_matches('mc') == ['main.c']
+        assert completer.get_matches('me') == ['Makefile', 'README']
+        assert completer.session.fuzzy
+        assert completer.get_matches('mef') == ['Makefile']
+
+    def test_get_matches_fuzzy_typed(self, completer, tmpdir):
+        completer.use_suffix = False
+        completer.fuzzy = True
+        os.chdir(str(tmpdir))
+        for name in ['Makefile', 'main.c']:
+            tmpdir.join(name).write('')
+        typed = [completer.get_matches(word) for word in ['m', 'ma', 'mak']]
+        assert typed[-1] == ['Makefile']
+        assert completer.session.fuzzy
+
+    def test_get_matches_frecency(self, completer, tmpdir):
+        completer.use_suffix = False
+        os.chdir(str(tmpdir))
+        for name in ['foo', 'food', 'fool']:
+            tmpdir.join(name).write('')
+        completer.frecency = FrecencyIndex()
+        assert completer.get_matches('f') == ['foo', 'food', 'fool']
+        completer.frecency.add(str(tmpdir.join('fool')))
+        assert completer.get_matches('f') == ['fool', 'foo', 'food']
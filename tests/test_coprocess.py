@@ -0,0 +1,120 @@
+import os
+import signal
+
+import pytest
+
+from twosheds.cli import CommandLineInterface
+from twosheds.coprocess import Coprocess
+from twosheds.kernel import Kernel, use_coprocess
+from twosheds.lexer import gen_tokens
+from twosheds.sentence import Sentence
+
+
+def sentence(text):
+    return Sentence(list(gen_tokens(text)))
+
+
+@pytest.fixture
+def coprocess():
+    coprocess = Coprocess()
+    yield coprocess
+    coprocess.close()
+
+
+def test_statuses(coprocess):
+    assert coprocess.run("true") == 0
+    pid = coprocess.process.pid
+    assert coprocess.run("false") == 1
+    # neither ends the coprocess
+    assert coprocess.run("exit 3") == 3
+    assert coprocess.run("if") == 2
+    assert coprocess.process.pid == pid
+    # $$ is the coprocess, which dies as a new sh would, and is restarted
+    assert coprocess.run("kill -TERM $$") == -signal.SIGTERM
+    assert coprocess.run("true") == 0
+    assert coprocess.process.pid != pid
+
+
+def test_output(coprocess, capfd):
+    assert coprocess.run("printf '%s\\n' \"it's\" | tr a-z A-Z") == 0
+    assert coprocess.run("cat <<EOF\nline 1\nline 2\nEOF") == 0
+    assert capfd.readouterr()[0] == "IT'S\nline 1\nline 2\n"
+
+
+def test_directory_and_environment(coprocess, tmpdir):
+    cwd = os.getcwd()
+    assert coprocess.run("true") == 0
+    os.chdir(str(tmpdir))
+    os.environ["TWOSHEDS_COPROCESS"] = "a 'b' $c"
+    try:
+        assert coprocess.run('test "$(pwd)" = "%s"' % os.getcwd()) == 0
+        assert coprocess.run(
+            'test "$TWOSHEDS_COPROCESS" = "a \'b\' \\$c"') == 0
+        del os.environ["TWOSHEDS_COPROCESS"]
+        assert coprocess.run('test -z "${TWOSHEDS_COPROCESS+set}"') == 0
+        # a command does not change the coprocess
+        assert coprocess.run("cd /; export TWOSHEDS_COPROCESS=1") == 0
+        assert coprocess.run('test "$(pwd)" = "%s"' % os.getcwd()) == 0
+        assert coprocess.run('test -z "${TWOSHEDS_COPROCESS+set}"') == 0
+    finally:
+        os.chdir(cwd)
+        os.environ.pop("TWOSHEDS_COPROCESS", None)
+
+
+def test_busy(coprocess):
+    command = coprocess.submit("sleep 0.2")
+    assert command.poll() is None
+    assert coprocess.submit("true") is None
+    # the kernel starts a new sh instead
+    assert Kernel(coprocess=coprocess).respond("exit 4") == 4
+    assert command.wait() == 0
+    assert coprocess.run("exit 5") == 5
+
+
+def test_restarts(coprocess):
+    assert coprocess.run("true") == 0
+    coprocess.process.kill()
+    coprocess.process.wait()
+    assert coprocess.run("exit 6") == 6
+
+
+def test_kernel(coprocess):
+    kernel = Kernel(coprocess=coprocess)
+    assert kernel.execute(sentence("exit 3")) == 3
+    assert kernel.respond("exit 4") == 4
+    pid = coprocess.process.pid
+    # pipelines of processes, and commands which need no sh, do not use it
+    assert kernel.execute(sentence("true")) == 0
+    assert kernel.execute(sentence("true | false")) == 1
+    assert coprocess.process.pid == pid
+
+
+def test_builtins_change_it(coprocess, tmpdir):
+    cwd = os.getcwd()
+    use_coprocess(coprocess)
+    try:
+        tmpdir.join("marker").write("")
+        cli = CommandLineInterface({}, None)
+        assert cli.run(["cd %s; export TWOSHEDS_COPROCESS=1\n" % tmpdir,
+                        "test -f marker && printenv TWOSHEDS_COPROCESS > out"
+                        ]) == 0
+        assert tmpdir.join("out").read() == "1\n"
+        assert coprocess.command is not None
+    finally:
+        use_coprocess(None)
+        os.chdir(cwd)
+        os.environ.pop("TWOSHEDS_COPROCESS", None)
+
+
+def test_stress(coprocess):
+    pid = None
+    for i in range(10000):
+        if i % 1000 == 0:
+            os.environ["TWOSHEDS_COPROCESS"] = str(i)
+            assert coprocess.run(
+                'test "$TWOSHEDS_COPROCESS" = %d' % i) == 0
+        assert coprocess.run("exit %d" % (i % 256)) == i % 256
+        if pid is None:
+            pid = coprocess.process.pid
+    del os.environ["TWOSHEDS_COPROCESS"]
+    assert coprocess.process.pid == pid
@@ -0,0 +1,56 @@
+from twosheds.environment import Environment
+from twosheds.sentence import Sentence
+from twosheds.transform import VariableTransform
+
+
+def test_write_through():
+    backing = {"HOME": "/home/a"}
+    env = Environment(backing)
+    env["EDITOR"] = "vim"
+    del env["HOME"]
+    assert backing == {"EDITOR": "vim"}
+    assert dict(env) == backing
+    assert env.version == 2
+
+
+def test_unchanged_value_keeps_version():
+    env = Environment({"EDITOR": "vim"})
+    env["EDITOR"] = "vim"
+    assert env.version == 0
+
+
+def test_name_of_is_updated():
+    env = Environment({"HOME": "/home/a", "PWD": "/tmp"})
+    assert env.name_of("/home/a") == "HOME"
+    env["HOME"] = "/home/b"
+    assert env.name_of("/home/a") is None
+    assert env.name_of("/home/b") == "HOME"
+    env["OLDPWD"] = "/tmp"
+    assert env.name_of("/tmp") == "OLDPWD"
+    del env["OLDPWD"]
+    assert env.name_of("/tmp") == "PWD"
+
+
+def test_refresh():
+    backing = {"HOME": "/home/a"}
+    env = Environment(backing)
+    assert env.name_of("/home/a") == "HOME"
+    env.refresh()
+    assert env.version == 0
+    backing["HOME"] = "/home/b"
+    env.refresh()
+    assert env.version == 1
+    assert env["HOME"] == "/home/b"
+    assert env.name_of("/home/b") == "HOME"
+
+
+def test_variable_transform_follows_changes():
+    env = Environment({"HOME": "/home/a"})
+    t = VariableTransform(env)
+
+    def tokens(text, inverse=False):
+        return t(Sentence(text.split()), inverse).tokens
+    assert tokens("cd /home/a", inverse=True) == ["cd", "$HOME"]
+    env["HOME"] = "/home/b"
+    assert tokens("cd /home/a", inverse=True) == ["cd", "/home/a"]
+    assert tokens("cd $HOME") == ["cd", "/home/b"]
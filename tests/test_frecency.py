@@ -0,0 +1,55 @@
+from twosheds.frecency import FrecencyIndex
+
+NOW = 1000000000.0
+
+
+def test_score():
+    index = FrecencyIndex()
+    index.add("/usr", now=NOW - 7200)
+    index.add("/usr", now=NOW - 7200)
+    index.add("/tmp", now=NOW)
+    assert index.score("/usr", now=NOW) == 4
+    assert index.score("/tmp", now=NOW) == 4
+    assert index.score("/var", now=NOW) == 0
+
+
+def test_save_and_load(tmpdir):
+    filename = str(tmpdir.join("frecency"))
+    index = FrecencyIndex(filename)
+    index.add("ls", now=NOW)
+    index.add("/home", now=NOW)
+    index.save()
+    index.add("ls", now=NOW + 1)
+    index.save()
+    assert len(tmpdir.join("frecency").readlines()) == 3
+    loaded = FrecencyIndex(filename)
+    assert loaded.entries == {"ls": [2.0, NOW + 1], "/home": [1.0, NOW]}
+
+
+def test_compact(tmpdir):
+    filename = str(tmpdir.join("frecency"))
+    index = FrecencyIndex(filename, maxrank=100)
+    for i in range(200):
+        index.add("ls", now=NOW)
+    index.add("cd", now=NOW)
+    index.save()
+    assert len(tmpdir.join("frecency").readlines()) == 1
+    assert FrecencyIndex(filename).entries == {"ls": [180.0, NOW]}
+
+
+def test_compact_keeps_other_shells_uses(tmpdir):
+    filename = str(tmpdir.join("frecency"))
+    index = FrecencyIndex(filename)
+    other = FrecencyIndex(filename)
+    index.add("ls", now=NOW)
+    index.save()
+    other.add("cd", now=NOW + 1)
+    other.save()
+    index.add("ls", now=NOW + 2)
+    index.compact()
+    assert index.entries == {"ls": [2.0, NOW + 2], "cd": [1.0, NOW + 1]}
+    assert len(tmpdir.join("frecency").readlines()) == 2
+    other.add("cd", now=NOW + 3)
+    other.save()
+    loaded = FrecencyIndex(filename)
+    assert loaded.entries == {"ls": [2.0, NOW + 2], "cd": [2.0, NOW + 3]}
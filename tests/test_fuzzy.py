@@ -0,0 +1,20 @@
+from twosheds.fuzzy import Candidates
+
+
+def test_search():
+    candidates = Candidates(["Makefile", "main.c", "README", "mac"])
+    assert [s for s, _ in candidates.search("mc")] == ["main.c", "mac"]
+    assert [s for s, _ in candidates.search("ME")] == ["README"]
+    assert [s for s, _ in candidates.search("me")] == ["Makefile", "README"]
+    assert len(list(candidates.search(""))) == 4
+
+
+def test_search_stays_within_candidates():
+    candidates = Candidates(["ab", "cd"])
+    assert list(candidates.search("bc")) == []
+
+
+def test_search_quality():
+    candidates = Candidates(["xfoo", "f_o_o", "foo"])
+    found = sorted(candidates.search("foo"), key=lambda entry: entry[1])
+    assert [s for s, _ in found] == ["foo", "f_o_o", "xfoo"]
@@ -0,0 +1,151 @@
+import os
+import threading
+import time
+
+import pytest
+
+from twosheds.pool import Pool
+from twosheds.index import CommandIndex, DirectoryIndex, Listing
+
+
+def test_listing_startingwith():
+    listing = Listing(["fodder", "foo", "food", "foonly", "bar"])
+    assert list(listing.startingwith("foo")) == ["foo", "food", "foonly"]
+    assert list(listing.startingwith("fox")) == []
+    assert len(list(listing.startingwith(""))) == 5
+
+
+def test_directory_index_reuses_listing(tmpdir):
+    tmpdir.join("a").write("")
+    index = DirectoryIndex()
+    listing = index.listing(str(tmpdir))
+    assert index.listing(str(tmpdir)) is listing
+
+
+def test_directory_index_invalidates_on_change(tmpdir):
+    tmpdir.join("a").write("")
+    index = DirectoryIndex()
+    listing = index.listing(str(tmpdir))
+    tmpdir.join("b").write("")
+    # ensure the modification time moves even on coarse filesystems
+    st = os.stat(str(tmpdir))
+    os.utime(str(tmpdir), (st.st_atime, st.st_mtime + 1))
+    assert list(index.listing(str(tmpdir))) == ["a", "b"]
+    assert list(listing) == ["a"]
+
+
+def test_directory_index_maxsize(tmpdir):
+    index = DirectoryIndex(maxsize=1)
+    index.listing(str(tmpdir.mkdir("x")))
+    listing = index.listing(str(tmpdir.mkdir("y")))
+    assert list(index._listings.values()) == [listing]
+
+
+def make_executable(path):
+    path.write("")
+    path.chmod(0o755)
+
+
+def test_command_index(tmpdir):
+    bin1, bin2 = tmpdir.mkdir("bin1"), tmpdir.mkdir("bin2")
+    make_executable(bin1.join("python"))
+    make_executable(bin2.join("pydoc"))
+    bin2.join("pyfile").write("")
+    bin2.mkdir("pydir")
+    bin2.join("pylink").mksymlinkto(bin1.join("python"))
+    bin2.join("pydirlink").mksymlinkto(bin2.join("pydir"))
+    bin2.join("pybroken").mksymlinkto(tmpdir.join("missing"))
+    index = CommandIndex()
+    missing = tmpdir.join("missing")
+    search_path = os.pathsep.join([str(bin1), str(bin2), str(missing)])
+    listing = index.listing(search_path)
+    assert list(listing.startingwith("py")) == ["pydoc", "pylink", "python"]
+    assert listing.isdir("python") is False
+    assert index.listing(search_path) is listing
+
+
+def test_command_index_changes_incrementally(tmpdir, monkeypatch):
+    bin1, bin2 = tmpdir.mkdir("bin1"), tmpdir.mkdir("bin2")
+    make_executable(bin1.join("ls"))
+    make_executable(bin2.join("cat"))
+    index = CommandIndex()
+    monkeypatch.setenv("PATH", str(bin1))
+    assert list(index.listing()) == ["ls"]
+    executables = index.directories.listing(str(bin1))
+    monkeypatch.setenv("PATH", os.pathsep.join([str(bin1), str(bin2)]))
+    assert list(index.listing()) == ["cat", "ls"]
+    assert index.directories.listing(str(bin1)) is executables
+
+
+def test_directory_index_deadline(tmpdir):
+    path = str(tmpdir)
+    unblocked = threading.Event()
+
+    class StuckIndex(DirectoryIndex):
+        def gen_entries(self, path):
+            yield "first", False
+            unblocked.wait()
+            yield "second", True
+
+    index = StuckIndex(pool=Pool(), deadline=0.05)
+    listing = index.listing(path)
+    assert list(listing) == ["first"]
+    assert path in index.slow
+    start = time.time()
+    assert list(index.listing(path)) == ["first"]
+    assert time.time() - start < 0.05
+    unblocked.set()
+    index._pending[path].wait()
+    listing = index.listing(path)
+    assert list(listing) == ["first", "second"]
+    assert listing.isdir("second")
+    assert path not in index.slow
+
+
+def test_directory_index_rereads_finished_directory(tmpdir):
+    path = str(tmpdir)
+    unblocked = threading.Event()
+
+    class StuckIndex(DirectoryIndex):
+        def gen_entries(self, path):
+            unblocked.wait()
+            return super(StuckIndex, self).gen_entries(path)
+
+    index = StuckIndex(pool=Pool(), deadline=0.05)
+    assert list(index.listing(path)) == []
+    unblocked.set()
+    index._pending[path].wait()
+    # the read finished unseen, and the directory changed after it
+    tmpdir.join("new").write("")
+    os.utime(path, (0, 0))
+    assert list(index.listing(path)) == ["new"]
+
+
+def test_directory_index_reads_slow_directory_once(tmpdir):
+    slow = tmpdir.mkdir("slow")
+    tmpdir.mkdir("fast").join("a").write("")
+    unblocked = threading.Event()
+    reads = []
+
+    class StuckIndex(DirectoryIndex):
+        def gen_entries(self, path):
+            reads.append(path)
+            if path == str(slow):
+                unblocked.wait()
+            return super(StuckIndex, self).gen_entries(path)
+
+    index = StuckIndex(pool=Pool(size=2), deadline=0.05)
+    try:
+        for _ in range(10):
+            assert list(index.listing(str(slow))) == []
+        assert reads == [str(slow)]
+        # which leaves the other threads to read other directories
+        assert list(index.listing(str(tmpdir.join("fast")))) == ["a"]
+    finally:
+        unblocked.set()
+
+
+def test_directory_index_pool_errors(tmpdir):
+    index = DirectoryIndex(pool=Pool(), deadline=1)
+    with pytest.raises(OSError):
+        index.listing(str(tmpdir.join("missing")))
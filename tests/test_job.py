@@ -0,0 +1,189 @@
+import itertools
+import os
+import signal
+import sys
+import threading
+import time
+
+from twosheds import builtins
+from twosheds.job import (Job, JobTable, Stage, job_table, read_records,
+                          split_pipeline)
+from twosheds.lexer import gen_tokens
+from twosheds.program import Program
+from twosheds.sentence import Sentence
+
+
+def sentence(text):
+    return Sentence(list(gen_tokens(text)))
+
+
+def upper():
+    for line in sys.stdin:
+        sys.stdout.write(line.upper())
+
+
+def test_split_pipeline():
+    stages = split_pipeline(sentence("ls -a | grep x|wc 'a | b'"))
+    assert [str(stage) for stage in stages] == ["ls -a", "grep x",
+                                                'wc "a | b"']
+    assert len(split_pipeline(sentence("ls -a"))) == 1
+    for text in ["a || b", "a | b && c", "a | (b)", "a | | b", "| a",
+                 "a; b", "a &"]:
+        assert split_pipeline(sentence(text)) is None, text
+
+
+def test_processes(capfd):
+    job = Job(split_pipeline(sentence("printf 'a\\nb\\n' | sort -r | wc -l")))
+    assert job.run() == 0
+    assert capfd.readouterr()[0].strip() == "2"
+
+
+def test_status_of_last_stage():
+    assert Job(split_pipeline(sentence("true | false"))).run() == 1
+    assert Job(split_pipeline(sentence("false | true"))).run() == 0
+
+
+def test_builtin_stages(capfd):
+    commands = {"upper": upper}
+    job = Job(split_pipeline(sentence("echo abc | upper | tr B X")), commands)
+    assert job.run() == 0
+    assert capfd.readouterr()[0] == "AXC\n"
+
+
+def test_builtin_stops_when_reader_does():
+    def yes():
+        while True:
+            sys.stdout.write("y\n" * 1024)
+    job = Job(split_pipeline(sentence("yes | head -n 1")), {"yes": yes})
+    job.start()
+    assert [p.wait() for p in job.processes] == [-signal.SIGPIPE, 0]
+
+
+def test_interpret_pipeline(capfd):
+    program = Program("echo abc | upper")
+    program.run(environ={"upper": upper})
+    assert capfd.readouterr()[0] == "ABC\n"
+
+
+def test_redirected_last_stage(capfd):
+    commands = {"numbers": Stage(numbers), "take": Stage(take)}
+    for text, expected in [("echo hi | sed s/h/H/", "Hi\n"),
+                           ("numbers | take 2 | sed s/^/x/", "x0\nx1\n"),
+                           ("echo hi | numbers 2", "0\n1\n")]:
+        r, w = os.pipe()
+        job = Job(split_pipeline(sentence(text)), commands)
+        job.start(stdout=w)
+        os.close(w)
+        with os.fdopen(r) as stream:
+            output = stream.read()
+        assert job.wait() == 0
+        assert output == expected
+    # and nothing reaches the shell's own output
+    assert capfd.readouterr()[0] == ""
+
+
+def test_background_job():
+    table = JobTable()
+    job = Job([sentence("sleep 5")])
+    job.start(background=True)
+    assert os.getpgid(job.processes[0].pid) == job.pgid != os.getpgrp()
+    assert table.add(job) == 1
+    assert table.notify() == []
+    job.signal(signal.SIGTERM)
+    job.wait()
+    assert table.notify() == ["[1]  Terminated   sleep 5"]
+    assert len(table) == 0
+
+
+def test_jobs_are_reaped_on_sigchld():
+    job = Job([sentence("true")])
+    job.start(background=True)
+    job_table.add(job)
+    try:
+        for _ in range(100):
+            if job.processes[0].returncode is not None:
+                break
+            time.sleep(0.01)
+        assert job.processes[0].returncode == 0
+    finally:
+        job_table.jobs.clear()
+
+
+def test_background_sentences(capsys):
+    program = Program("a 2>&1 & b>&2; c")
+    sentences = list(program.expand_aliases(program.gen_tokens()))
+    assert [" ".join(str(t) for t in s) for s in sentences] == [
+        "a 2> & 1 &", "b> & 2", "c"]
+    program = Program("sh -c 'exit 3' & false | true &")
+    try:
+        program.run()
+        assert len(job_table) == 2
+        assert builtins.wait("%1") == 3
+        assert builtins.wait() == 0
+        assert len(job_table) == 0
+    finally:
+        job_table.jobs.clear()
+    assert capsys.readouterr()[0].startswith("[1] ")
+
+
+def test_fg(capsys):
+    job = Job([sentence("sh -c 'exit 4'")])
+    job.start(background=True)
+    try:
+        number = job_table.add(job)
+        assert builtins.fg("%%%d" % number) == 4
+        assert builtins.fg() == 1
+    finally:
+        job_table.jobs.clear()
+    out, err = capsys.readouterr()
+    assert out == 'sh -c "exit 4"\n'
+    assert err == "fg: current: no such job\n"
+
+
+def numbers(records, n=None):
+    return itertools.count() if n is None else iter(range(int(n)))
+
+
+def take(records, n):
+    return itertools.islice(records, int(n))
+
+
+def total(records):
+    yield sum(records)
+
+
+def test_streaming_stages_pass_records(capfd):
+    commands = {"numbers": Stage(numbers), "take": Stage(take),
+                "total": Stage(total)}
+    job = Job(split_pipeline(sentence("numbers | take 1000 | total")),
+              commands)
+    # the stages run as one thread, and the records stay numbers
+    assert len(job._units()) == 1
+    assert job.run() == 0
+    assert capfd.readouterr()[0] == "499500\n"
+
+
+def test_records_read_as_needed():
+    r, w = os.pipe()
+    os.write(w, b"a\n")
+    timer = threading.Timer(2, os.close, [w])
+    timer.start()
+    try:
+        records = read_records(os.fdopen(r, "r"))
+        started = time.time()
+        assert next(records) == "a"
+        # without waiting for the rest of the stream
+        assert time.time() - started < 1
+    finally:
+        timer.join()
+    assert list(records) == []
+
+
+def test_streaming_stages_meet_processes(capfd):
+    commands = {"numbers": Stage(numbers), "take": Stage(take),
+                "upper": upper}
+    text = "numbers 5 | sed s/^/x/ | upper | take 2 | cat"
+    job = Job(split_pipeline(sentence(text)), commands)
+    assert len(job._units()) == 5
+    assert job.run() == 0
+    assert capfd.readouterr()[0] == "X0\nX1\n"
@@ -0,0 +1,99 @@
+import os
+import signal
+
+import pytest
+
+from twosheds.environment import environ
+from twosheds.kernel import CommandHash, Kernel, Process, find_executable
+from twosheds.lexer import gen_tokens
+from twosheds.sentence import Sentence
+
+
+def sentence(text):
+    return Sentence(list(gen_tokens(text)))
+
+
+def test_resolve_simple():
+    path, argv = Kernel().resolve(sentence("ls -l 'a b' c\\ d"))
+    assert path == find_executable("ls")
+    assert argv == ["ls", "-l", "a b", "c d"]
+
+
+def test_resolve_needs_sh():
+    kernel = Kernel()
+    for text in ["ls | wc", "ls > out", "ls *.py", "echo $HOME",
+                 "echo \"`id`\"", "X=1 env", "exit 1", "ls; ls",
+                 "no-such-command-twosheds"]:
+        assert kernel.resolve(sentence(text)) is None, text
+
+
+def test_resolve_transformed_strings():
+    kernel = Kernel()
+    assert kernel.resolve(Sentence(["ls", "/tmp"]))[1] == ["ls", "/tmp"]
+    # sh would split a string with blanks, as it came from a variable
+    assert kernel.resolve(Sentence(["ls", "a b"])) is None
+
+
+def test_execute_status():
+    kernel = Kernel()
+    assert kernel.execute(sentence("true")) == 0
+    assert kernel.execute(sentence("false")) == 1
+    assert kernel.execute(sentence("exit 3")) == 3
+
+
+def test_command_hash(monkeypatch):
+    monkeypatch.setitem(environ, "PATH", os.defpath)
+    table = CommandHash()
+    path = table.find("ls")
+    assert table.find("ls") == path
+    assert table.hits == {"ls": 2}
+    assert table.find("no-such-command-twosheds") is None
+    assert table.find("/bin/sh") == "/bin/sh"
+    assert list(table.paths) == ["ls"]
+
+
+def test_command_hash_follows_path(tmpdir, monkeypatch):
+    monkeypatch.setitem(environ, "PATH", os.defpath)
+    table = CommandHash()
+    table.find("ls")
+    monkeypatch.setitem(environ, "PATH", str(tmpdir))
+    assert table.find("ls") is None
+    assert table.paths == {}
+
+
+def test_exec_failure_forgets(monkeypatch):
+    table = CommandHash()
+    table.paths["true"] = "/no/such/true"
+    table.hits["true"] = 1
+    table._search_path = environ.get("PATH", os.defpath)
+    assert Kernel(table).execute(sentence("true")) == 0
+    assert "true" not in table.paths
+
+
+@pytest.mark.skipif(not hasattr(os, "posix_spawn"),
+                    reason="os.posix_spawn is new in Python 3.8")
+def test_start_posix_spawn():
+    kernel = Kernel()
+    r, w = os.pipe()
+    r2, w2 = os.pipe()
+    os.write(w, b"a\nb\n")
+    os.close(w)
+    process = kernel.start(find_executable("sort"), ["sort", "-r"], r, w2)
+    os.close(r)
+    os.close(w2)
+    assert isinstance(process, Process)
+    assert os.read(r2, 100) == b"b\na\n"
+    os.close(r2)
+    assert process.wait() == 0
+    # in a group of its own, and killed by SIGPIPE as a new sh would be
+    process = kernel.start("/bin/sleep", ["sleep", "10"], pgroup=0)
+    assert process.poll() is None
+    assert os.getpgid(process.pid) == process.pid
+    os.killpg(process.pid, signal.SIGTERM)
+    assert process.wait() == -signal.SIGTERM
+    r, w = os.pipe()
+    os.close(r)
+    process = kernel.start("/bin/sh", ["sh", "-c", "echo x; sleep 1"],
+                           stdout=w)
+    os.close(w)
+    assert process.wait() == -signal.SIGPIPE
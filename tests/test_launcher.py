@@ -0,0 +1,117 @@
+import os
+import signal
+
+import pytest
+
+from twosheds import builtins
+from twosheds.job import Job, job_table, split_pipeline
+from twosheds.kernel import Kernel, find_executable
+from twosheds.launcher import Launcher
+from twosheds.lexer import gen_tokens
+from twosheds.sentence import Sentence
+
+
+def sentence(text):
+    return Sentence(list(gen_tokens(text)))
+
+
+@pytest.fixture(scope="module")
+def launcher():
+    launcher = Launcher()
+    yield launcher
+    launcher.close()
+
+
+def read_all(fd):
+    chunks = []
+    while True:
+        chunk = os.read(fd, 4096)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    os.close(fd)
+    return b"".join(chunks)
+
+
+def test_status(launcher):
+    kernel = Kernel(launcher=launcher)
+    assert kernel.execute(sentence("true")) == 0
+    assert kernel.execute(sentence("false")) == 1
+    assert kernel.execute(sentence("exit 3")) == 3
+    assert kernel.respond("exit 4") == 4
+
+
+def test_file_descriptors(launcher):
+    r, w = os.pipe()
+    os.write(w, b"a\nb\n")
+    # the writer is gone before the launcher opens the reader
+    os.close(w)
+    r2, w2 = os.pipe()
+    process = launcher.start(find_executable("sort"), ["sort", "-r"], r, w2)
+    os.close(r)
+    os.close(w2)
+    assert read_all(r2) == b"b\na\n"
+    assert process.wait() == 0
+
+
+def test_environment_and_directory(launcher, tmpdir):
+    cwd = os.getcwd()
+    os.environ["TWOSHEDS_LAUNCHER"] = "yes"
+    os.chdir(str(tmpdir))
+    try:
+        r, w = os.pipe()
+        process = launcher.start("/bin/sh", [
+            "sh", "-c", "echo $TWOSHEDS_LAUNCHER; pwd"], stdout=w)
+        os.close(w)
+        output = read_all(r).decode().split()
+    finally:
+        os.chdir(cwd)
+        del os.environ["TWOSHEDS_LAUNCHER"]
+    assert process.wait() == 0
+    assert output == ["yes", os.path.realpath(str(tmpdir))]
+
+
+def test_not_executable(launcher, tmpdir):
+    with pytest.raises(OSError):
+        launcher.start(str(tmpdir), ["x"])
+    # sh says so instead
+    kernel = Kernel(launcher=launcher)
+    assert kernel.execute(sentence("no-such-command-twosheds")) == 127
+
+
+def test_signals_and_groups(launcher):
+    process = launcher.start("/bin/sleep", ["sleep", "10"], pgroup=0)
+    assert process.poll() is None
+    assert os.getpgid(process.pid) == process.pid
+    os.killpg(process.pid, signal.SIGTERM)
+    assert process.wait() == -signal.SIGTERM
+
+
+def test_jobs(launcher, capfd):
+    # commands not given a file descriptor share those of the launcher
+    captured = Launcher()
+    try:
+        job = Job(split_pipeline(sentence("printf 'a\\nb\\n' | sort -r")),
+                  kernel=Kernel(launcher=captured))
+        assert job.run() == 0
+    finally:
+        captured.close()
+    assert capfd.readouterr()[0] == "b\na\n"
+    kernel = Kernel(launcher=launcher)
+    job = Job([sentence("sleep 10"), sentence("cat")], kernel=kernel)
+    job.start(background=True)
+    assert all(os.getpgid(process.pid) == job.pgid
+               for process in job.processes)
+    job.signal(signal.SIGTERM)
+    assert job.wait() == -signal.SIGTERM
+
+
+def test_reaped_by_signal_handler(launcher):
+    # the shell is sent SIGCHLD, and polls, while it waits
+    job = Job([sentence("sleep 0.1")], kernel=Kernel(launcher=launcher))
+    job.start(background=True)
+    number = job_table.add(job)
+    try:
+        assert builtins.wait("%%%d" % number) == 0
+    finally:
+        job_table.remove(number)
@@ -0,0 +1,195 @@
+import random
+
+import pytest
+
+from twosheds import token
+from twosheds.lexer import Lexer, gen_tokens, lex
+
+
+def reference_tokens(text):
+    """The character-at-a-time lexer which gen_tokens replaced."""
+    metacharacters = {"|", "&", ";", "(", ")", " ", "\t", "\n"}
+    current_token = []
+    escape = False
+    quote = None
+    comment = False
+    skip = 0
+    for char, peek in zip(text, text[1:] + " "):
+        if skip > 0:
+            skip -= 1
+            continue
+        if comment:
+            if char != "\n":
+                continue
+            comment = False
+        if quote is None:
+            if escape:
+                if char != "\n":  # a line continuation
+                    current_token.append(char)
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char in ("'", '"'):
+                quote = char
+            elif char == "#" and not current_token:
+                comment = True
+            elif char in metacharacters:
+                if current_token:
+                    yield token.Word(''.join(current_token))
+                current_token = []
+                if char == "(":
+                    yield token.LParen()
+                elif char == ")":
+                    yield token.RParen()
+                elif char == "\n":
+                    yield token.Word(char)
+                elif char in "|&;":
+                    if peek == char:
+                        yield token.Word(char + peek)
+                        skip += 1
+                    else:
+                        yield token.Word(char)
+            else:
+                current_token.append(char)
+        elif char == quote:
+            if current_token:
+                yield token.DoubleQuote(''.join(current_token))
+            current_token = []
+            quote = None
+        else:
+            current_token.append(char)
+    if quote is not None:
+        raise ValueError("No closing quotation")
+    if escape:
+        raise ValueError("No escaped character")
+    if current_token:
+        yield token.Word(''.join(current_token))
+
+
+def describe(tokens):
+    """Describe tokens and any error, so that they can be compared."""
+    described = []
+    try:
+        for t in tokens:
+            described.append((type(t), getattr(t, "text", None)))
+    except ValueError as e:
+        described.append(str(e))
+    return described
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "ls -a",
+    "cd /; pwd",
+    "a;;b&&c||d|||e",
+    "(cd /tmp) & wait",
+    "echo 'a b' \"c d\"",
+    "x'y'z",
+    "''",
+    r"a\ b\;c",
+    "'\\n' \"it's\"",
+    "line\nnext\r\n",
+    "ls # a comment\npwd",
+    "a#b '#' \\#c #d",
+    "\t ls \t",
+    "echo 'unclosed",
+    "trailing\\",
+    "echo a\\\nb \\\n c\\\n",
+    "a\\\n#b \\\n#c\nd",
+])
+def test_same_tokens(text):
+    assert describe(gen_tokens(text)) == describe(reference_tokens(text))
+
+
+def test_same_tokens_random():
+    random.seed(0)
+    alphabet = "ab \t\n#|&;()'\"\\"
+    for _ in range(2000):
+        text = "".join(random.choice(alphabet)
+                       for _ in range(random.randint(0, 12)))
+        expected = describe(reference_tokens(text))
+        assert describe(gen_tokens(text)) == expected, text
+
+
+def test_tokens_before_error_are_generated():
+    tokens = gen_tokens("echo a; echo 'b")
+    assert [str(t) for t in [next(tokens) for _ in range(4)]] == \
+        ["echo", "a", ";", "echo"]
+    with pytest.raises(ValueError):
+        next(tokens)
+
+
+def feed_pieces(pieces):
+    lexer = Lexer()
+    for piece in pieces:
+        for t in lexer.feed(piece):
+            yield t
+    for t in lexer.close():
+        yield t
+
+
+def test_pieces_same_tokens_random():
+    random.seed(1)
+    alphabet = "ab \t\n#|&;()'\"\\"
+    for _ in range(2000):
+        text = "".join(random.choice(alphabet)
+                       for _ in range(random.randint(0, 12)))
+        cuts = sorted(random.randint(0, len(text)) for _ in range(3))
+        pieces = [text[i:j] for i, j in zip([0] + cuts, cuts + [len(text)])]
+        expected = describe(reference_tokens(text))
+        assert describe(feed_pieces(pieces)) == expected, pieces
+
+
+def test_line_continuation_between_pieces():
+    for pieces in [["echo a\\", "\nb"], ["echo a", "\\\n", " b"],
+                   ["echo \\", "\n#c\nd"]]:
+        assert [str(t) for t in feed_pieces(pieces)] == \
+            [str(t) for t in gen_tokens("".join(pieces))], pieces
+    assert [str(t) for t in feed_pieces(["echo a\\", "\nb"])] == \
+        ["echo", "ab"]
+    assert [str(t) for t in feed_pieces(["echo a", "\\\n", " b"])] == \
+        ["echo", "a", "b"]
+
+
+def test_here_documents():
+    text = "cat <<A; cat <<- B\nit's \\ $x\nA\n\tB\necho 'after'\n"
+    expected = ["cat", "<<A", ";", "cat", "<<-", "B",
+                "\nit's \\ $x\nA\n\tB", "\n", "echo", '"after"', "\n"]
+    assert [str(t) for t in gen_tokens(text)] == expected
+    assert [str(t) for t in lex(text)] == expected
+    for i in range(len(text) + 1):
+        pieces = [text[:i], text[i:i + 3], text[i + 3:]]
+        assert [str(t) for t in feed_pieces(pieces)] == expected, pieces
+    # the end of the text ends a here-document
+    assert [str(t) for t in gen_tokens("cat <<A\nb")] == ["cat", "<<A", "\nb"]
+    assert [str(t) for t in lex("cat <<A\nb")] == ["cat", "<<A", "\nb"]
+    lexer = Lexer()
+    list(lexer.feed("cat <<A\nb\n"))
+    assert not lexer.complete
+    list(lexer.feed("A\n"))
+    assert lexer.complete
+
+
+def test_complete():
+    lexer = Lexer()
+    assert list(lexer.feed("echo 'a")) and not lexer.complete
+    assert lexer.quote == "'"
+    assert [str(t) for t in lexer.feed("b'")] == ['"ab"']
+    assert lexer.complete
+    list(lexer.feed("x\\"))
+    assert lexer.escape and not lexer.complete
+
+
+def test_stream_same_tokens_random():
+    random.seed(2)
+    alphabet = "ab \t\n#|&;()'\"\\"
+    for _ in range(2000):
+        text = "".join(random.choice(alphabet)
+                       for _ in range(random.randint(0, 12)))
+        expected = describe(reference_tokens(text))
+        try:
+            stream = lex(text)
+        except ValueError as e:
+            assert expected[-1] == str(e), text
+        else:
+            assert describe(stream) == expected, text
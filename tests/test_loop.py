@@ -0,0 +1,69 @@
+import pytest
+
+from twosheds.kernel import Kernel
+from twosheds.loop import EventLoop, Return
+
+
+def test_sleeps():
+    loop = EventLoop()
+    events = []
+
+    def sleeper(name, seconds):
+        yield seconds
+        events.append(name)
+
+    loop.spawn(sleeper("slow", 0.05))
+    loop.run_until_complete(sleeper("fast", 0.01))
+    assert events == ["fast"]
+    loop.run_until_complete(sleeper("last", 0.1))
+    assert events == ["fast", "slow", "last"]
+
+
+def test_results_and_errors():
+    def inner(x):
+        yield
+        if x is None:
+            raise ValueError("no x")
+        raise Return(x + 1)
+
+    def outer():
+        y = yield inner(1)
+        try:
+            yield inner(None)
+        except ValueError as e:
+            raise Return((y, str(e)))
+
+    assert EventLoop().run_until_complete(outer()) == (2, "no x")
+    with pytest.raises(ValueError):
+        EventLoop().run_until_complete(inner(None))
+
+
+def test_waits_for_processes():
+    def run():
+        status = yield Kernel().start("/bin/sh", ["sh", "-c", "exit 3"])
+        raise Return(status)
+
+    assert EventLoop().run_until_complete(run()) == 3
+
+
+def test_interrupt_is_raised_where_the_task_waits():
+    loop = EventLoop()
+    cleaned = []
+
+    def inner():
+        try:
+            yield 10
+        except KeyboardInterrupt:
+            cleaned.append(True)
+            raise
+
+    def outer():
+        yield inner()
+
+    def interrupt():
+        raise KeyboardInterrupt()
+
+    loop.call_later(0.01, interrupt)
+    with pytest.raises(KeyboardInterrupt):
+        loop.run_until_complete(outer())
+    assert cleaned == [True]
@@ -0,0 +1,146 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+from twosheds.alias import Aliases
+from twosheds.cli import CommandLineInterface
+from twosheds.environment import environ
+from twosheds.parallel import parse_args, read_inputs, substitute
+from twosheds.token import DoubleQuote, Word
+
+
+def make_parallel(aliases=None, commands=None):
+    cli = CommandLineInterface(Aliases(aliases or {}), None)
+    cli.commands.update(commands or {})
+    return cli.commands["parallel"]
+
+
+def test_parse_args():
+    assert parse_args(["echo", "{}", ":::", "a"])[2:] == (["echo", "{}"],
+                                                          ["a"])
+    assert parse_args(["-k", "gzip"])[1:] == (True, ["gzip"], None)
+    for args in [[], ["-j", "0", "ls"], ["-x", "ls"], [":::", "a"]]:
+        with pytest.raises(ValueError):
+            parse_args(args)
+
+
+def test_substitute():
+    tokens = [Word("cp"), Word("{}"), DoubleQuote("{}.bak")]
+    assert [str(t) for t in substitute(tokens, "a b")] == \
+        ["cp", "a\\ b", '"a b.bak"']
+    assert [str(t) for t in substitute([Word("ls")], "x")] == ["ls", "x"]
+    assert [str(t) for t in substitute(tokens, "$x")] == \
+        ["cp", "'$x'", "'$x.bak'"]
+    assert [str(t) for t in substitute([Word("ls")], "it's")] == \
+        ["ls", "'it'\\''s'"]
+
+
+def test_keeps_order(capfd):
+    parallel = make_parallel()
+    status = parallel("-k", "-j", "3", "sh", "-c", "'sleep 0.0{}; echo {}'",
+                      ":::", "3", "1", "2")
+    assert status == 0
+    assert capfd.readouterr()[0] == "3\n1\n2\n"
+
+
+def test_runs_at_once(capfd):
+    parallel = make_parallel()
+    start = time.time()
+    assert parallel("-j", "4", "sleep", ":::", "0.2", "0.2", "0.2",
+                    "0.2") == 0
+    assert time.time() - start < 0.6
+
+
+def test_counts_failures(capfd):
+    parallel = make_parallel()
+    assert parallel("sh", "-c", "'exit {}'", ":::", "0", "1", "2") == 2
+
+
+def test_aliases_transforms_and_builtins(capfd):
+    environ["TWOSHEDS_GREETING"] = "hello"
+    try:
+        parallel = make_parallel({"greet": "echo $TWOSHEDS_GREETING"},
+                                 {"upper": lambda: upper()})
+        assert parallel("-k", "greet", "{}", "|", "upper", ":::",
+                        "a", "b") == 0
+    finally:
+        del environ["TWOSHEDS_GREETING"]
+    assert capfd.readouterr()[0] == "HELLO A\nHELLO B\n"
+
+
+def test_follows_the_shell(capfd):
+    transformed = []
+
+    def transform(sentence, inverse=False):
+        transformed.append(sentence.command)
+        return sentence
+
+    parallel = make_parallel()
+    # each is replaced after the builtin is made
+    parallel.cli.aliases = {"greet": "echo hello"}
+    parallel.cli.transforms = [transform]
+    parallel.cli.commands = {"upper": lambda: upper()}
+    assert parallel("greet", "{}", "|", "upper", ":::", "a") == 0
+    assert capfd.readouterr()[0] == "HELLO A\n"
+    assert transformed == ["echo"]
+
+
+def test_inputs_taken_as_they_are(capfd):
+    environ["TWOSHEDS_INPUT"] = "expanded"
+    try:
+        parallel = make_parallel({"ll": "echo aliased"})
+        assert parallel("-k", "echo", ":::", "~", "$TWOSHEDS_INPUT", "ll",
+                        "a b", "*") == 0
+        assert parallel("-k", "ll", "{}", ":::", "~") == 0
+    finally:
+        del environ["TWOSHEDS_INPUT"]
+    assert capfd.readouterr()[0] == \
+        "~\n$TWOSHEDS_INPUT\nll\na b\n*\naliased ~\n"
+
+
+def test_inputs_read_as_needed():
+    r, w = os.pipe()
+    os.write(w, b"a\n")
+    timer = threading.Timer(2, os.close, [w])
+    timer.start()
+    try:
+        inputs = read_inputs(os.fdopen(r, "r"))
+        started = time.time()
+        assert next(inputs) == "a"
+        # without waiting for the rest of the stream
+        assert time.time() - started < 1
+    finally:
+        timer.join()
+    assert list(inputs) == []
+
+
+def test_commands_do_not_take_inputs(capfd, monkeypatch):
+    # more inputs than are read at once, which a command reading the
+    # standard input would otherwise take
+    r, w = os.pipe()
+    lines = [str(i) * 8000 + "\n" for i in range(10)]
+    writer = threading.Thread(target=lambda: (os.write(w, "".join(lines)),
+                                              os.close(w)))
+    writer.start()
+    saved = os.dup(0)
+    os.dup2(r, 0)
+    os.close(r)
+    try:
+        monkeypatch.setattr(sys, "stdin", os.fdopen(os.dup(0), "r"))
+        parallel = make_parallel()
+        assert parallel("-j", "1", "sh", "-c",
+                        "'cat > /dev/null; echo ran'") == 0
+    finally:
+        os.dup2(saved, 0)
+        os.close(saved)
+        writer.join()
+    assert capfd.readouterr()[0] == "ran\n" * 10
+
+
+def upper():
+    import sys
+    for line in sys.stdin:
+        sys.stdout.write(line.upper())
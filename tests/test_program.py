@@ -17,3 +17,10 @@ def test_gen_tokens_double_quotes():
     program = Program('git commit -m "test"')
     tokens = list(program.gen_tokens())
     assert len(tokens) == 4
+
+
+def test_run_here_document(capfd):
+    # the lines of a here-document reach sh as they were written
+    Program("cat <<EOF\nit's  a\n\tb\nEOF\necho after").run()
+    Program("cat <<-EOF\n\tc\n\tEOF").run()
+    assert capfd.readouterr()[0] == "it's  a\n\tb\nafter\nc\n"
@@ -0,0 +1,112 @@
+import os
+import subprocess
+import sys
+
+from twosheds.cli import CommandLineInterface
+from twosheds.script import main, read_chunks
+
+
+def make_cli(calls):
+    cli = CommandLineInterface({}, None)
+    cli.commands = {"say": lambda *args: calls.append(args),
+                    "fail": lambda: 1 / 0}
+    return cli
+
+
+def test_run_chunks():
+    calls = []
+    chunks = ["say 1; sa", "y '2\n", "3' # not ", "said\n\nsay a &&\n",
+              "say b"]
+    assert make_cli(calls).run(chunks) == 0
+    assert calls == [("1",), ('"2\n3"',), ("a", "&&", "say", "b")]
+
+
+def test_sentences_run_as_they_are_read():
+    calls = []
+
+    def chunks():
+        yield "say 1\n"
+        assert calls == [("1",)]
+        yield "say 2"
+
+    assert make_cli(calls).run(chunks()) == 0
+    assert calls == [("1",), ("2",)]
+
+
+def test_run_errors(capsys):
+    calls = []
+    cli = make_cli(calls)
+    assert cli.run(["fail; say after"]) == 0
+    assert calls == [("after",)]
+    assert "ZeroDivisionError" in capsys.readouterr()[1]
+    assert cli.run(["fail"]) == 1
+    capsys.readouterr()
+    assert cli.run(["say 'unclosed"]) == 2
+    assert capsys.readouterr()[1] == "twosheds: No closing quotation\n"
+
+
+def test_read_chunks(tmpdir):
+    path = tmpdir.join("script")
+    path.write("a" * 10)
+    fd = os.open(str(path), os.O_RDONLY)
+    try:
+        assert list(read_chunks(fd, 4)) == ["aaaa", "aaaa", "aa"]
+    finally:
+        os.close(fd)
+
+
+def test_main(tmpdir, capfd):
+    script = tmpdir.join("script.sh")
+    script.write("echo one\n# a comment\nsh -c 'exit 3'\n")
+    assert main(["-c", "echo two; false"]) == 1
+    assert main([str(script)]) == 3
+    assert main([str(tmpdir.join("missing"))]) == 127
+    assert main(["-c"]) == 2
+    out, err = capfd.readouterr()
+    assert out == "two\none\n"
+    assert "missing: No such file or directory" in err
+
+
+def test_exit(tmpdir, capfd):
+    assert main(["-c", "exit 1; echo still-running"]) == 1
+    assert main(["-c", "false; exit"]) == 1
+    assert main(["-c", "exit 256"]) == 0
+    script = tmpdir.join("script.sh")
+    script.write("echo one\nexit 3\necho two\n")
+    assert main([str(script)]) == 3
+    assert main(["-c", "exit x; echo still-running"]) == 2
+    out, err = capfd.readouterr()
+    assert out == "one\n"
+    assert err == "exit: Illegal number: x\n"
+
+
+def test_extra_arguments(tmpdir, capfd):
+    script = tmpdir.join("script.sh")
+    script.write("echo ran\n")
+    assert main(["-c", "echo ran", "extra"]) == 2
+    assert main([str(script), "extra"]) == 2
+    assert main(["-", "extra"]) == 2
+    out, err = capfd.readouterr()
+    assert out == ""
+    assert "twosheds: extra: unexpected argument\n" in err
+
+
+def test_line_continuation(tmpdir, capfd):
+    script = tmpdir.join("script.sh")
+    script.write("echo a\\\nb \\\n  c\n")
+    assert main([str(script)]) == 0
+    assert capfd.readouterr()[0] == "ab c\n"
+    # the escape and the newline in different pieces
+    calls = []
+    assert make_cli(calls).run(["say a\\", "\nb \\", "\n c"]) == 0
+    assert calls == [("ab", "c")]
+
+
+def test_main_skips_readline():
+    # in a new interpreter, as anything else may have imported readline
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.check_call([
+        sys.executable, "-c",
+        "import sys; from twosheds.script import main; "
+        "main(['-c', 'true']); assert 'readline' not in sys.modules"],
+        cwd=root)
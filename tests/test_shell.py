@@ -0,0 +1,23 @@
+from twosheds import Shell
+from twosheds.frecency import FrecencyIndex
+from twosheds.lexer import gen_tokens
+from twosheds.sentence import Sentence
+
+
+def sentence(text):
+    return Sentence(list(gen_tokens(text)))
+
+
+def test_learn_unescaped_paths(tmpdir):
+    tmpdir.mkdir("my dir")
+    tmpdir.mkdir("quoted dir")
+    # without the completer, which needs rl
+    shell = Shell.__new__(Shell)
+    shell.frecency = FrecencyIndex()
+    shell.sentences = [
+        (str(tmpdir), sentence('ls my\\ dir "quoted dir" missing')),
+        (str(tmpdir), sentence("")),
+    ]
+    shell._learn()
+    assert sorted(shell.frecency.entries) == sorted([
+        "ls", str(tmpdir.join("my dir")), str(tmpdir.join("quoted dir"))])
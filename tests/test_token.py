@@ -0,0 +1,27 @@
+from twosheds.lexer import lex
+from twosheds.sentence import Sentence
+from twosheds.token import DoubleQuote, Word
+
+
+def test_views_are_lazy():
+    stream = lex(r"echo a\ b 'c d'")
+    echo, word, quotation = stream
+    assert echo._text is None
+    assert (type(word), word.text) == (Word, "a b")
+    assert (type(quotation), quotation.text) == (DoubleQuote, "c d")
+    assert word._stream is None
+    assert echo._text is None
+
+
+def test_no_instance_dicts():
+    assert not hasattr(Word("ls"), "__dict__")
+    assert not hasattr(Sentence([]), "__dict__")
+
+
+def test_sentence_strings_follow_tokens():
+    sentence = Sentence([Word("ls"), Word("-a")])
+    assert sentence.args == ["-a"]
+    assert str(sentence) == "ls -a"
+    sentence.tokens = [Word("ls"), Word("-l")]
+    assert sentence.args == ["-l"]
+    assert str(sentence) == "ls -l"
@@ -0,0 +1,62 @@
+from twosheds.sentence import Sentence
+from twosheds.token import Word
+from twosheds.transform import (Pipeline, TildeTransform, Transform,
+                                VariableTransform, transform)
+
+
+class Upper(Transform):
+    """A transform which does not describe itself token by token."""
+    def __call__(self, sentence, inverse=False):
+        sentence.tokens = [token.lower() if inverse else token.upper()
+                           for token in sentence.tokens]
+        return sentence
+
+
+def unfused(sentence, transforms, inverse=False):
+    if inverse:
+        transforms = reversed(transforms)
+    for t in transforms:
+        sentence = t(sentence, inverse)
+    return sentence
+
+
+def test_fused_matches_unfused(transforms):
+    for text in ["cd ~", "ls $HOME ~/x y", "echo $NOPE x~ $EDITOR"]:
+        expected = unfused(Sentence(text.split()), transforms).tokens
+        fused = transform(Sentence(text.split()), transforms).tokens
+        assert fused == expected
+
+
+def test_fused_inverse_matches_unfused(transforms, environment):
+    home = environment["HOME"]
+    for text in ["cd %s" % home, "ls %s/x vim" % home]:
+        expected = unfused(Sentence(text.split()), transforms, True).tokens
+        fused = transform(Sentence(text.split()), transforms,
+                          inverse=True).tokens
+        assert fused == expected
+
+
+def test_variable_then_tilde():
+    transforms = [VariableTransform({"X": "~/src"}), TildeTransform("/home")]
+    assert transform("$X", transforms, word=True) == "/home/src"
+
+
+def test_tokens_are_kept():
+    word = Word("ls")
+    sentence = transform(Sentence([word, Word("~")]),
+                         [TildeTransform("/home")])
+    assert sentence.tokens == [word, "/home"]
+    assert sentence.tokens[0] is word
+
+
+def test_unfusable_transforms_are_called():
+    transforms = [VariableTransform({"X": "a"}), Upper(),
+                  TildeTransform("/home")]
+    pipeline = Pipeline(transforms)
+    assert len(pipeline.stages) == 3
+    assert pipeline(Sentence(["$X", "~"])).tokens == ["A", "/home"]
+
+
+def test_one_stage_when_fused(transforms):
+    assert len(Pipeline(transforms).stages) == 1
+    assert len(Pipeline(transforms, inverse=True).stages) == 1
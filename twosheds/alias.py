@@ -0,0 +1,247 @@
+"""
+twosheds.alias
+~~~~~~~~~~~~~~
+
+This module implements the table of aliases, which are compiled into tokens
+when they are defined rather than each time they are used.
+"""
+import itertools
+try:
+    from collections.abc import MutableMapping
+except ImportError:  # Python 2
+    from collections import MutableMapping
+
+from .lexer import gen_tokens
+
+# the versions of every table of aliases, so that no two tables share one
+_versions = itertools.count(1)
+
+
+class Aliases(MutableMapping):
+    """A dictionary of aliases, from names to the text they stand for.
+
+    The text of each alias is lexed once, when it is defined. An alias whose
+    command is itself an alias is expanded in full, and the expansion is
+    remembered until an alias is changed. An alias may use its own name as
+    its command, but an alias which would expand into itself through others
+    is refused.
+
+    >>> aliases = Aliases({"ls": "ls -G", "la": "ls -a"})
+    >>> [str(t) for t in aliases.expansion("la")]
+    ['ls', '-G', '-a']
+    >>> aliases["ls"] = "la -l"
+    Traceback (most recent call last):
+      ...
+    ValueError: alias loop: ls -> la -> ls
+
+    :param aliases: (optional) dictionary of aliases to start with
+    """
+    def __init__(self, aliases=None):
+        self._version = next(_versions)
+        self._texts = {}
+        self._tokens = {}
+        self._expansions = {}
+        if aliases:
+            self.update(aliases)
+
+    def _expand(self, name, tokens, chain):
+        if not tokens:
+            return ()
+        command = str(tokens[0])
+        if command == name or command not in self._tokens:
+            return tuple(tokens)
+        if command in chain:
+            loop = chain[chain.index(command):] + [command]
+            raise ValueError("alias loop: %s" % " -> ".join(loop))
+        try:
+            head = self._expansions[command]
+        except KeyError:
+            head = self._expand(command, self._tokens[command],
+                                chain + [command])
+            self._expansions[command] = head
+        return head + tuple(tokens[1:])
+
+    @property
+    def version(self):
+        """A number which changes whenever the aliases do, and which no
+        other table of aliases has had."""
+        return self._version
+
+    def _expansion(self, name):
+        try:
+            return self._expansions[name]
+        except KeyError:
+            expansion = self._expand(name, self._tokens[name], [name])
+            self._expansions[name] = expansion
+            return expansion
+
+    def expansion(self, name):
+        """Get the tokens which ``name`` expands to in full.
+
+        Raises :class:`KeyError` if ``name`` is not an alias.
+
+        :param name: the name of the alias
+        """
+        return self._expansion(name)
+
+    def __getitem__(self, name):
+        return self._texts[name]
+
+    def __setitem__(self, name, text):
+        tokens = list(gen_tokens(text))
+        previous = self._tokens.get(name)
+        expansions, self._expansions = self._expansions, {}
+        self._tokens[name] = tokens
+        try:
+            # any loop must pass through the new alias
+            self._expansion(name)
+        except ValueError:
+            if previous is None:
+                del self._tokens[name]
+            else:
+                self._tokens[name] = previous
+            self._expansions = expansions
+            raise
+        self._texts[name] = text
+        self._version = next(_versions)
+
+    def __delitem__(self, name):
+        del self._texts[name]
+        del self._tokens[name]
+        self._expansions = {}
+        self._version = next(_versions)
+
+    def __iter__(self):
+        return iter(self._texts)
+
+    def __len__(self):
+        return len(self._texts)
+
+
+class DictAliases(Aliases):
+    """The aliases in a plain dictionary, compiled as :class:`Aliases`, which
+    go on following the dictionary if it is changed directly.
+
+    Aliases are expanded in full, as :class:`Aliases` are. An alias which
+    the dictionary gives a loop is not refused, since nothing could be done
+    about it part way through running a command, but is expanded one level
+    instead. Changing an alias through this table, rather than the
+    dictionary, writes it to the dictionary and refuses a loop.
+
+    The dictionary is not looked over in full for changes each time a line
+    is parsed. An alias which is added to it or removed is noticed by the
+    change in its size, which changes :attr:`version`, and the text of an
+    alias which is replaced is noticed the next time it is expanded. Text
+    which was parsed with the old text of an alias is kept in a
+    :class:`ParseCache <twosheds.cache.ParseCache>` until the version
+    changes, so an alias which is replaced rather than added or removed
+    should be set through this table to take effect at once.
+
+    >>> table = {"ls": "ls -G"}
+    >>> aliases = DictAliases(table)
+    >>> table["la"] = "ls -a"
+    >>> [str(t) for t in aliases.expansion("la")]
+    ['ls', '-G', '-a']
+
+    :param aliases: the dictionary of aliases
+    """
+    def __init__(self, aliases):
+        super(DictAliases, self).__init__()
+        self.aliases = aliases
+        self._length = None
+        self._sync()
+
+    def _sync(self):
+        """Compile the aliases in the dictionary, lexing only those whose
+        text has changed."""
+        texts, tokens = self._texts, self._tokens
+        self._texts = dict(self.aliases)
+        self._tokens = {}
+        for name, text in self._texts.items():
+            if texts.get(name) is text:
+                self._tokens[name] = tokens[name]
+            else:
+                self._tokens[name] = list(gen_tokens(text))
+        self._expansions = {}
+        self._length = len(self._texts)
+        self._version = next(_versions)
+
+    def _changed(self, name):
+        """Check whether the dictionary has changed any alias which
+        ``name`` expands through."""
+        aliases, texts = self.aliases, self._texts
+        if len(aliases) != self._length:
+            return True
+        # an alias is passed through at most once, unless they loop
+        steps = len(texts)
+        while steps:
+            steps -= 1
+            text = texts.get(name)
+            if text is None:
+                break
+            if aliases.get(name) is not text:
+                return True
+            tokens = self._tokens[name]
+            if not tokens:
+                return False
+            command = str(tokens[0])
+            if command == name:
+                return False
+            name = command
+        return name in aliases and name not in texts
+
+    @property
+    def version(self):
+        """A number which changes whenever the aliases are changed through
+        this table, or the dictionary changes its size."""
+        if len(self.aliases) != self._length:
+            self._sync()
+        return self._version
+
+    def expansion(self, name):
+        """Get the tokens which ``name`` expands to in full, or one level if
+        it loops.
+
+        Raises :class:`KeyError` if ``name`` is not an alias.
+
+        :param name: the name of the alias
+        """
+        if self._changed(name):
+            self._sync()
+        try:
+            return self._expansion(name)
+        except ValueError:  # an alias loop, given by the dictionary
+            return tuple(self._tokens[name])
+
+    def __getitem__(self, name):
+        return self.aliases[name]
+
+    def __setitem__(self, name, text):
+        if self._changed(name):
+            self._sync()
+        super(DictAliases, self).__setitem__(name, text)
+        self.aliases[name] = text
+        self._length = len(self.aliases)
+
+    def __delitem__(self, name):
+        del self.aliases[name]
+        if name in self._texts:
+            super(DictAliases, self).__delitem__(name)
+        self._length = len(self.aliases)
+
+    def __iter__(self):
+        return iter(self.aliases)
+
+    def __len__(self):
+        return len(self.aliases)
+
+
+def as_aliases(aliases):
+    """Get ``aliases`` as :class:`Aliases` or, if it is a plain dictionary,
+    compiled into a :class:`DictAliases`, which follows changes made to it.
+
+    :param aliases: a dictionary of aliases, or ``None`` for none
+    """
+    if isinstance(aliases, Aliases):
+        return aliases
+    return DictAliases({} if aliases is None else aliases)
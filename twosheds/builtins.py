@@ -1,4 +1,10 @@
 import os
+import signal
+import sys
+
+from .environment import environ
+from .job import describe_status, job_table
+from .kernel import command_hash
 
 
 def cd(*args):
@@ -9,18 +15,137 @@ def cd(*args):
     """
     if args[0] == "-":
         try:
-            newpwd, os.environ["OLDPWD"] = os.environ["OLDPWD"], os.getcwd()
+            newpwd, environ["OLDPWD"] = environ["OLDPWD"], os.getcwd()
         except KeyError as e:  # $OLDPWD initially not set
             raise e
         else:
             os.chdir(newpwd)
             print(newpwd)
     else:
-        os.environ["OLDPWD"] = os.getcwd()
+        environ["OLDPWD"] = os.getcwd()
         os.chdir(*args)
 
 
 def export(*args):
     for arg in args:
         k, v = arg.split("=", 1)
-        os.environ[k] = v
+        environ[k] = v
+
+
+def exit_(*args):
+    """
+    Stop running the script or reading commands, with the exit status given,
+    or with that of the last command if none is.
+    """
+    if not args:
+        raise SystemExit(None)
+    try:
+        status = int(args[0])
+    except ValueError:
+        sys.stderr.write("exit: Illegal number: %s\n" % args[0])
+        raise SystemExit(2)
+    raise SystemExit(status & 0xFF)
+
+
+def hash_(*args):
+    """
+    Without arguments, write the commands which have been found and the
+    number of times each has been used to the standard output. With -r,
+    forget every command. Otherwise, find each command given and remember
+    where it was found.
+    """
+    if not args:
+        if not command_hash.paths:
+            print("hash: hash table empty")
+        for command, path in sorted(command_hash.paths.items()):
+            print("%4d\t%s" % (command_hash.hits[command], path))
+        return
+    for arg in args:
+        if arg == "-r":
+            command_hash.clear()
+        elif command_hash.find(arg) is None:
+            sys.stderr.write("hash: %s: not found\n" % arg)
+
+
+def rehash(*args):
+    """Forget every command which has been found, so that each is searched
+    for again the next time it is used."""
+    command_hash.clear()
+
+
+def _get_job(name, args):
+    """Get the number and the job given by ``args``, or ``None`` if there is
+    no such job, which is reported."""
+    spec = args[0] if args else None
+    try:
+        return job_table.get(spec)
+    except KeyError:
+        sys.stderr.write("%s: %s: no such job\n" % (name, spec or "current"))
+        return None
+
+
+def jobs(*args):
+    """
+    Write the number, state and command of each job in the background to the
+    standard output. Jobs which have finished are reported once and then
+    forgotten.
+    """
+    for number, job in list(job_table):
+        status = job.poll()
+        print("[%d]  %-12s %s" % (number, describe_status(status), job.text))
+        if status is not None:
+            job_table.remove(number)
+
+
+def fg(*args):
+    """
+    Wait for a job in the background, as though it had been run in the
+    foreground. An interrupt is passed on to the job. Defaults to the most
+    recent job.
+    """
+    found = _get_job("fg", args)
+    if found is None:
+        return 1
+    number, job = found
+    print(job.text)
+    job.signal(signal.SIGCONT)
+    try:
+        status = job.wait()
+    except KeyboardInterrupt:
+        job.signal(signal.SIGINT)
+        raise
+    job_table.remove(number)
+    return status
+
+
+def bg(*args):
+    """
+    Let a job in the background which has been stopped carry on. Defaults to
+    the most recent job.
+    """
+    found = _get_job("bg", args)
+    if found is None:
+        return 1
+    number, job = found
+    job.signal(signal.SIGCONT)
+    print("[%d] %s &" % (number, job.text))
+
+
+def wait(*args):
+    """
+    Wait for each job given, or for every job in the background if none is,
+    and return the exit status of the last.
+    """
+    if args:
+        found = [_get_job("wait", [arg]) for arg in args]
+    else:
+        found = list(job_table)
+    status = 0
+    for item in found:
+        if item is None:
+            status = 127
+            continue
+        number, job = item
+        status = job.wait()
+        job_table.remove(number)
+    return status
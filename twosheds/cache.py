@@ -0,0 +1,95 @@
+"""
+twosheds.cache
+~~~~~~~~~~~~~~
+
+This module implements a cache of parsed commands, so that commands which are
+run again need not be parsed again.
+"""
+import collections
+
+
+class ParseCache(object):
+    """A least recently used cache of the sentences parsed from text.
+
+    Entries are only valid for the version of the aliases they were parsed
+    with, so every entry is dropped when a different version is asked for.
+    The cache is bounded both in the number of entries and in the total
+    length of the text they were parsed from.
+
+    >>> cache = ParseCache()
+    >>> cache.get("ls", 1) is None
+    True
+    >>> cache.put("ls", 1, [["ls", "-G"]])
+    >>> cache.get("ls", 1)
+    [['ls', '-G']]
+    >>> cache.hits, cache.misses
+    (1, 1)
+
+    :param maxsize: (optional) the maximum number of entries
+    :param maxchars: (optional) the maximum total length of the text of the
+                     entries. Text longer than this is never cached.
+    """
+    def __init__(self, maxsize=256, maxchars=2 ** 20):
+        self.maxsize = maxsize
+        self.maxchars = maxchars
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.chars = 0
+        self._entries = collections.OrderedDict()
+
+    def _validate(self, version):
+        if version != self.version:
+            if self._entries:
+                self.clear()
+                self.invalidations += 1
+            self.version = version
+
+    def get(self, text, version):
+        """Get the sentences parsed from ``text``, or ``None`` if they are not
+        cached.
+
+        :param text: the text which was parsed
+        :param version: the version of the aliases to parse it with
+        """
+        self._validate(version)
+        try:
+            sentences = self._entries.pop(text)
+        except KeyError:
+            self.misses += 1
+            return None
+        self._entries[text] = sentences
+        self.hits += 1
+        return sentences
+
+    def put(self, text, version, sentences):
+        """Remember the sentences parsed from ``text``.
+
+        :param text: the text which was parsed
+        :param version: the version of the aliases it was parsed with
+        :param sentences: what was parsed from it
+        """
+        if len(text) > self.maxchars:
+            return
+        self._validate(version)
+        if text in self._entries:
+            del self._entries[text]
+            self.chars -= len(text)
+        self._entries[text] = sentences
+        self.chars += len(text)
+        while (len(self._entries) > self.maxsize or
+               self.chars > self.maxchars):
+            evicted, _ = self._entries.popitem(last=False)
+            self.chars -= len(evicted)
+
+    def clear(self):
+        """Forget every entry."""
+        self._entries.clear()
+        self.chars = 0
+
+    def __contains__(self, text):
+        return text in self._entries
+
+    def __len__(self):
+        return len(self._entries)
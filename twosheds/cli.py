@@ -1,28 +1,69 @@
 import os
+import sys
 import traceback
 
 from program import Program
-from builtins import cd, export
-from .transform import TildeTransform, VariableTransform
+from builtins import bg, cd, exit_, export, fg, hash_, jobs, rehash, wait
+from .alias import as_aliases
+from .cache import ParseCache
+from .environment import environ
+from .job import job_table
+from .lexer import Lexer, gen_chunked_tokens, lex
+from .loop import EventLoop
+from .parallel import Parallel
+from .sentence import Sentence
+from .transform import Pipeline, TildeTransform, VariableTransform
 
 
 class CommandLineInterface(object):
     """
     Basic read-eval-print loop.
+
+    The loop is run by an :class:`EventLoop <twosheds.loop.EventLoop>`, so
+    that other work can go on while the shell waits for the user or for a
+    command to finish. Each of :meth:`eval`, :meth:`interact` and
+    :meth:`serve_forever` runs the coroutine of the same name with ``_async``
+    added until it is done.
     """
     commands = {
+        'bg': bg,
         'cd': cd,
+        'exit': exit_,
         'export': export,
+        'fg': fg,
+        'hash': hash_,
+        'jobs': jobs,
+        'rehash': rehash,
+        'wait': wait,
     }
 
     def __init__(self, aliases, terminal, echo=False):
         self.aliases = aliases
         self.terminal = terminal
         self.echo = echo
+        self.sentences = []
+        self.parse_cache = ParseCache()
+        #: the :class:`EventLoop <twosheds.loop.EventLoop>` of the shell
+        self.loop = EventLoop()
         self.transforms = [
-            VariableTransform(os.environ),
-            TildeTransform(os.environ['HOME']),
+            VariableTransform(environ),
+            TildeTransform(environ['HOME']),
         ]
+        self.commands = dict(self.commands)
+        self.commands['parallel'] = Parallel(self)
+
+    @property
+    def aliases(self):
+        """The aliases of the shell, as :class:`Aliases
+        <twosheds.alias.Aliases>` or, if they were given as a plain
+        dictionary, compiled into a :class:`DictAliases
+        <twosheds.alias.DictAliases>` which follows changes made to the
+        dictionary."""
+        return self._aliases
+
+    @aliases.setter
+    def aliases(self, aliases):
+        self._aliases = as_aliases(aliases)
 
     def read(self):
         """
@@ -33,37 +74,152 @@ class CommandLineInterface(object):
         for line in self.terminal:
             yield line
 
-    def eval(self, text):
-        """Respond to text entered by the user.
+    def parse(self, text, tokens=None):
+        """Get the tokens of each sentence of ``text``, with aliases expanded.
+
+        What is parsed is kept in :attr:`parse_cache`, so text which is
+        entered again is not parsed again unless the aliases have changed.
+        Variables are expanded by the transforms later, when each sentence
+        is run.
 
         :param text: the user's input
+        :param tokens: (optional) the tokens of ``text``, if it has already
+                       been lexed
+        """
+        version = self.aliases.version
+        sentences = self.parse_cache.get(text, version)
+        if sentences is None:
+            if tokens is None:
+                tokens = lex(text)
+            program = Program(text)
+            sentences = tuple(tuple(sentence) for sentence
+                              in program.expand_aliases(tokens, self.aliases))
+            self.parse_cache.put(text, version, sentences)
+        return sentences
+
+    def eval_async(self, text, tokens=None):
+        """Respond to text entered by the user, as a coroutine which waits
+        for each command run in the foreground to finish.
+
+        Each sentence is added to :attr:`sentences`, along with the directory
+        it was run in.
+
+        :param text: the user's input
+        :param tokens: (optional) the tokens of ``text``, if it has already
+                       been lexed
         """
         program = Program(text, echo=self.echo, transforms=self.transforms)
-        tokens = program.gen_tokens()
-        for sentence in program.gen_sentences(tokens, self.aliases):
+        pipeline = Pipeline(self.transforms)
+        for tokens in self.parse(text, tokens):
+            sentence = pipeline(Sentence(list(tokens)))
             if self.echo:
                 self.terminal.debug(str(sentence))
-            program.interpret(sentence, self.commands)
+            self.sentences.append((os.getcwd(), sentence))
+            job = program.job(sentence, self.commands)
+            if job is None:
+                program.interpret(sentence, self.commands)
+                continue
+            job.start()
+            try:
+                yield job
+            except KeyboardInterrupt:
+                # the job was interrupted along with the shell
+                job.wait()
+                raise
 
-    def interact(self):
-        """Get a command from the user and respond to it."""
-        lines = ""
-        for line in self.read():
-            lines += line
+    def eval(self, text, tokens=None):
+        """Respond to text entered by the user.
+
+        :param text: the user's input
+        :param tokens: (optional) the tokens of ``text``, if it has already
+                       been lexed
+        """
+        self.loop.run_until_complete(self.eval_async(text, tokens))
+
+    def run(self, chunks):
+        """Run text which is not typed by a user, such as a script.
+
+        The text is lexed a chunk at a time, and each sentence is run as soon
+        as it has been read, so the whole text is never held at once. An
+        error in a sentence is reported, and the next sentence is run. The
+        ``exit`` builtin stops the text from being run any further.
+
+        Returns the exit status of the last sentence, that given to ``exit``,
+        or 2 if the text could not be lexed.
+
+        :param chunks: an iterable of the pieces of the text
+        """
+        tokens = gen_chunked_tokens(chunks)
+        program = Program("", echo=self.echo, transforms=self.transforms)
+        pipeline = Pipeline(self.transforms)
+        status = 0
+        sentences = program.expand_aliases(tokens, self.aliases)
+        while True:
             try:
-                self.eval(lines)
-            except ValueError:
-                pass
-            except KeyboardInterrupt as e:
-                raise e
-            except:
-                self.terminal.error(traceback.format_exc())
+                tokens = next(sentences)
+            except StopIteration:
+                return status
+            except ValueError as e:
+                sys.stderr.write("twosheds: %s\n" % e)
+                return 2
+            if not tokens:
+                continue
+            sentence = pipeline(Sentence(tokens))
+            if self.echo:
+                sys.stderr.write("+ %s\n" % sentence)
+            try:
+                status = program.interpret(sentence, self.commands)
+            except SystemExit as e:  # the exit builtin
+                return status if e.code is None else e.code
+            except Exception:
+                sys.stderr.write(traceback.format_exc())
+                status = 1
+            if not isinstance(status, int):
+                status = 0
+
+    def interact_async(self):
+        """Get a command from the user and respond to it, as a coroutine.
+
+        :attr:`sentences` holds the sentences of the command afterwards.
+        """
+        # take in any changes made to os.environ since the last interaction
+        environ.refresh()
+        for notice in job_table.notify():
+            self.terminal.write(notice + "\n")
+        self.sentences = []
+        # each line is lexed as it is read, carrying on from the last
+        lexer = Lexer()
+        lines = []
+        tokens = []
+        for line in self.read():
+            lines.append(line)
+            if len(lines) == 1 and line in self.parse_cache:
+                # it was parsed before, so it is complete
+                tokens = None
                 break
-            else:
+            tokens.extend(lexer.feed(line))
+            if lexer.complete:
                 break
+        else:
+            return
+        try:
+            if tokens is not None:
+                tokens.extend(lexer.close())
+            yield self.eval_async("".join(lines), tokens)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            self.terminal.error(traceback.format_exc())
 
-    def serve_forever(self, banner=None):
-        """Handle one interaction at a time until shutdown.
+    def interact(self):
+        """Get a command from the user and respond to it.
+
+        :attr:`sentences` holds the sentences of the command afterwards.
+        """
+        self.loop.run_until_complete(self.interact_async())
+
+    def serve_forever_async(self, banner=None):
+        """Handle one interaction at a time until shutdown, as a coroutine.
 
         :param banner: (optional) the banner to print before the first
                        interaction. Defaults to ``None``.
@@ -72,9 +228,25 @@ class CommandLineInterface(object):
             print(banner)
         while True:
             try:
-                self.interact()
+                yield self.interact_async()
             except KeyboardInterrupt:  # program interrupted by the user
                 print  # do not print on the same line as ^C
                 pass
             except SystemExit:  # exit from the interpreter
                 break
+
+    def serve_forever(self, banner=None):
+        """Handle one interaction at a time until shutdown.
+
+        While the shell waits for the user to type a line, the loop is run
+        from readline, so that other work goes on.
+
+        :param banner: (optional) the banner to print before the first
+                       interaction. Defaults to ``None``.
+        """
+        hooked = self.loop.install_input_hook()
+        try:
+            self.loop.run_until_complete(self.serve_forever_async(banner))
+        finally:
+            if hooked:
+                self.loop.remove_input_hook()
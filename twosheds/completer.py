@@ -4,14 +4,225 @@ twosheds.completer
 
 This module implements command completion.
 """
+import itertools
+import operator
 import os
+import Queue
 import re
 import sys
+import threading
+import time
 import traceback
 
-import pygtrie
+from environment import environ
+from fuzzy import compile_query, is_case_sensitive
+from index import CommandIndex, DirectoryIndex, ExecutableIndex
+from pool import Pool
+from transform import Pipeline, transform
 
-from transform import transform
+
+class Match(str):
+    """A possible completion.
+
+    :attr:`isdir` is ``True`` if the match is known to name a directory,
+    ``False`` if it is known not to, and ``None`` if it is unknown.
+    """
+    isdir = None
+
+    @classmethod
+    def make(cls, text, isdir):
+        match = cls(text)
+        match.isdir = isdir
+        return match
+
+
+# the number of seconds to wait for a directory to be read
+DEFAULT_DEADLINE = 0.15
+
+# the number of seconds each extension has to generate its matches
+DEFAULT_EXTENSION_BUDGET = 0.15
+
+# characters after which a word is in command position
+COMMAND_SEPARATORS = ";|&("
+
+
+def is_command_position(line):
+    """Check if the next word in ``line`` would be a command.
+
+    >>> is_command_position("ls; ")
+    True
+    >>> is_command_position("ls ")
+    False
+
+    :param line: the text preceding the word
+    """
+    line = line.rstrip()
+    return not line or line[-1] in COMMAND_SEPARATORS
+
+
+# matches a pattern which excludes names ending or containing a literal, like
+# r".*\.pyc$" or r".*~"
+LITERAL_PATTERN = re.compile(
+    r"^\.\*((?:\\[^A-Za-z0-9]|[^\\.^$*+?{}\[\]|()])+)(\$|\\Z)?$")
+# matches a pattern which would change meaning if combined with others, because
+# it has inline flags or refers to groups by number
+UNCOMBINABLE_PATTERN = re.compile(r"\(\?[aiLmsux]|\\[1-9]")
+
+
+class ExcludeFilter(object):
+    r"""Checks names against a list of exclude patterns in a single pass.
+
+    A name is excluded if any pattern matches at its start, as with
+    :func:`re.match`. Patterns that only look for a literal suffix, like
+    ``r".*\.o$"``, are checked with a set lookup on the end of the name.
+    Patterns that only look for a literal, like ``r".*~"``, are checked with a
+    single search for any of them. The remaining patterns are combined into
+    one regular expression.
+
+    >>> excluded = ExcludeFilter([r".*\.o$", r".*~", r"#.*#"])
+    >>> [name for name in ["a.o", "a.c", "a.c~", "#a#"] if not excluded(name)]
+    ['a.c']
+
+    :param patterns: a sequence of regular expression patterns
+    """
+    def __init__(self, patterns):
+        self.patterns = tuple(patterns)
+        self.suffixes = {}
+        literals, others = [], []
+        for pattern in self.patterns:
+            m = LITERAL_PATTERN.match(pattern)
+            if m is None:
+                others.append(pattern)
+                continue
+            literal = re.sub(r"\\(.)", r"\1", m.group(1))
+            if m.group(2):
+                self.suffixes.setdefault(len(literal), set()).add(literal)
+            else:
+                literals.append(literal)
+        self.search_literals = None
+        if literals:
+            self.search_literals = re.compile(
+                "|".join(re.escape(literal) for literal in literals)
+            ).search
+        self.match_others = self._compile(others)
+        # ``.*`` and ``$`` treat newlines specially, so names which contain
+        # them are checked against the patterns as given
+        self.match_all = self._compile(self.patterns)
+
+    def _compile(self, patterns):
+        if not patterns:
+            return None
+        combinable, matchers = [], []
+        for pattern in patterns:
+            if UNCOMBINABLE_PATTERN.search(pattern) is None:
+                combinable.append(pattern)
+            else:
+                matchers.append(re.compile(pattern).match)
+        if combinable:
+            try:
+                combined = "|".join("(?:%s)" % p for p in combinable)
+                matchers.append(re.compile(combined).match)
+            except re.error:
+                # e.g. a group name is reused
+                matchers.extend(re.compile(p).match for p in combinable)
+        if len(matchers) == 1:
+            return matchers[0]
+        return lambda name: any(match(name) for match in matchers)
+
+    def __call__(self, name):
+        """Check if ``name`` is excluded.
+
+        :param name: the name to check
+        """
+        if "\n" in name:
+            return bool(self.match_all and self.match_all(name))
+        for length, suffixes in self.suffixes.items():
+            if name[-length:] in suffixes:
+                return True
+        if self.search_literals and self.search_literals(name):
+            return True
+        return bool(self.match_others and self.match_others(name))
+
+
+class ExtensionStats(object):
+    """Latency statistics for a completion extension.
+
+    :attr:`calls`, :attr:`total` and :attr:`worst` are updated whenever the
+    extension finishes, whether or not it was in time. :attr:`overruns`
+    counts the completions which its matches were dropped from for being
+    late.
+    """
+    def __init__(self):
+        self.calls = 0
+        self.overruns = 0
+        self.total = 0.0
+        self.worst = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def mean(self):
+        """The mean number of seconds the extension takes."""
+        return self.total / self.calls if self.calls else 0.0
+
+    def record(self, elapsed):
+        with self._lock:
+            self.calls += 1
+            self.total += elapsed
+            self.worst = max(self.worst, elapsed)
+
+    def overrun(self):
+        with self._lock:
+            self.overruns += 1
+
+    def __repr__(self):
+        return ("ExtensionStats(calls=%d, overruns=%d, mean=%.4f, "
+                "worst=%.4f)" % (self.calls, self.overruns, self.mean,
+                                 self.worst))
+
+
+class Session(object):
+    """The matches found for a word.
+
+    Matches for a longer word are always among the matches for a shorter one,
+    so a session can be narrowed to the longer word rather than searching
+    again.
+
+    :param key: identifies what was searched, besides the search term
+    :param term: the name, or the start of the name, that was searched for
+    :param entries: ``(name, match)`` pairs for the names that start with
+                    ``term``
+    :param completions: (optional) a cache of the completion for each match
+    :param fuzzy: (optional) ``True`` if the names contain the characters of
+                  ``term`` in order, rather than starting with it
+    """
+    def __init__(self, key, term, entries, completions=None, fuzzy=False):
+        self.key = key
+        self.term = term
+        self.entries = entries
+        self.completions = {} if completions is None else completions
+        self.fuzzy = fuzzy
+
+    @property
+    def matches(self):
+        """The matches, in the order they were found."""
+        return [match for _, match in self.entries]
+
+    def narrow(self, term):
+        """Make a session for a longer search term.
+
+        :param term: the new search term, which must start with :attr:`term`
+        """
+        if term == self.term:
+            return self
+        if self.fuzzy:
+            flags = 0 if is_case_sensitive(term) else re.IGNORECASE
+            search = compile_query(term, flags).search
+            entries = [(name, match) for name, match in self.entries
+                       if search(name)]
+        else:
+            entries = [(name, match) for name, match in self.entries
+                       if name.startswith(term)]
+        return Session(self.key, term, entries, self.completions, self.fuzzy)
 
 
 class Completer(object):
@@ -59,6 +270,12 @@ class Completer(object):
     the completion completes on ``foo``, even though ``food`` and ``foonly``
     also match.
 
+    The first word of a sentence is completed from the commands on the
+    search path instead, unless it contains a ``/``::
+
+        $ pyth[tab]
+        python    python2   python2.7
+
     .. note::
 
         ``excludes_patterns`` can be set to a list of regular expression
@@ -85,14 +302,50 @@ class Completer(object):
         the completer. Generators must accept a string "word" as the sole
         argument, representing the word that the user is trying to complete,
         and use it to generate possible matches.
+    :param deadline: the number of seconds to wait for a directory to be read
+                     before completing from what is known of it so far.
+                     Directories which miss the deadline are read in the
+                     background, and are not waited on again until that
+                     finishes. Defaults to ``DEFAULT_DEADLINE``.
+    :param extension_budget:
+        The number of seconds each extension has to generate its matches.
+        Extensions run at once, in their own threads, and the matches of any
+        which take longer are dropped. Defaults to
+        ``DEFAULT_EXTENSION_BUDGET``. :attr:`extension_stats` maps each
+        extension to its :class:`ExtensionStats`.
+    :param fuzzy: if ``True``, a word which no filename or command starts
+                  with is completed to those which contain its characters in
+                  order. Defaults to ``False``.
+    :param frecency:
+        A :class:`FrecencyIndex <twosheds.frecency.FrecencyIndex>`, by which
+        to rank filenames and commands so that those used more frequently
+        and recently come first. Defaults to ``None``, which leaves them in
+        order.
     """
     def __init__(self, transforms, use_suffix=True, exclude=None,
-                 extensions=None):
+                 extensions=None, deadline=DEFAULT_DEADLINE,
+                 extension_budget=DEFAULT_EXTENSION_BUDGET, fuzzy=False,
+                 frecency=None):
         self.transforms = transforms
         self.use_suffix = use_suffix
         self.exclude_patterns = exclude or []
+        self._exclude_filter = ExcludeFilter(())
         self.extensions = extensions or []
+        self.fuzzy = fuzzy
+        self.frecency = frecency
+        self.extension_budget = extension_budget
+        self.extension_stats = {}
+        self.extension_pool = Pool()
+        self._running_extensions = set()
+        self._extensions_lock = threading.Lock()
+        self.pool = Pool()
+        self.index = DirectoryIndex(pool=self.pool, deadline=deadline)
+        self.commands = CommandIndex(
+            ExecutableIndex(pool=self.pool, deadline=deadline)
+        )
         self.matches = None
+        self.session = None
+        self._inverse = None
 
     def complete(self, word, state):
         """Return the next possible completion for ``word``.
@@ -112,64 +365,178 @@ class Completer(object):
             rl.completion.suppress_append = True
         except ImportError:
             pass
-        word = transform(word, self.transforms, word=True)
-
         if state == 0:
-            self.matches = self.get_matches(word)
+            self._inverse = Pipeline(self.transforms, inverse=True)
+            word = transform(word, self.transforms, word=True)
+            self.matches = self.get_matches(word,
+                                            self._in_command_position())
 
         try:
             match = self.matches[state]
         except IndexError:
             return None
-        else:
-            return transform(match, self.transforms, word=True, inverse=True)
+        completions = self.session.completions
+        try:
+            return completions[match]
+        except KeyError:
+            completion = transform(match, self._inverse, word=True)
+            completions[match] = completion
+            return completion
+
+    @property
+    def exclude_filter(self):
+        """The :class:`ExcludeFilter` for :attr:`exclude_patterns`.
+
+        It is only recompiled when the patterns change.
+        """
+        patterns = tuple(self.exclude_patterns)
+        if patterns != self._exclude_filter.patterns:
+            self._exclude_filter = ExcludeFilter(patterns)
+        return self._exclude_filter
+
+    def _in_command_position(self):
+        try:
+            import rl
+        except ImportError:
+            return False
+        line = rl.completion.line_buffer[:rl.completion.begidx]
+        return is_command_position(line)
 
     def exclude_matches(self, matches):
         """Filter any matches that match an exclude pattern.
 
         :param matches: a list of possible completions
         """
-        for match in matches:
-            for exclude_pattern in self.exclude_patterns:
-                if re.match(exclude_pattern, match) is not None:
-                    break
-            else:
-                yield match
+        excluded = self.exclude_filter
+        if not excluded.patterns:
+            return matches
+        return (match for match in matches if not excluded(match))
 
     def _is_hidden_file(self, filename):
         return filename.startswith('.')
 
-    def gen_filename_completions(self, word, filenames):
+    def gen_filename_completions(self, word, listing):
         """Generate a sequence of filenames that match ``word``.
 
         :param word: the word to complete
+        :param listing: the :class:`Listing <twosheds.index.Listing>` of the
+                        directory to search
         """
-        if not word:
-            return filenames
-        else:
-            trie = pygtrie.CharTrie()
-            for filename in filenames:
-                trie[filename] = filename
-            return trie.iterkeys(prefix=word)
+        return listing.startingwith(word)
 
-    def gen_matches(self, word):
-        """Generate a sequence of possible completions for ``word``.
+    def _run_extension(self, extension, word, cancelled, finished):
+        start = time.time()
+        matches, error = [], None
+        try:
+            for match in extension(word):
+                if cancelled.is_set():
+                    break
+                matches.append(match)
+        except Exception:
+            error = traceback.format_exc()
+        finally:
+            with self._extensions_lock:
+                self._running_extensions.discard(extension)
+        self.extension_stats[extension].record(time.time() - start)
+        finished.put((extension, matches, error))
+
+    def _gen_finished_extensions(self, pending, finished, cancelled, end):
+        try:
+            while pending:
+                timeout = max(0, end - time.time())
+                try:
+                    extension, matches, error = finished.get(timeout=timeout)
+                except Queue.Empty:
+                    for extension in pending:
+                        self.extension_stats[extension].overrun()
+                    break
+                pending.remove(extension)
+                if error is not None:
+                    sys.stderr.write(error)
+                    continue
+                for match in matches:
+                    yield match
+        finally:
+            cancelled.set()
+
+    def gen_extension_completions(self, word):
+        """Generate a sequence of completions for ``word`` from the
+        extensions.
+
+        The extensions are started at once, and their matches are generated in
+        the order in which they finish. Any which are not finished within
+        :attr:`extension_budget` seconds are dropped. An extension which is
+        still running from an earlier completion is not started again, so
+        that one which hangs cannot take every thread, and counts as an
+        overrun.
 
         :param word: the word to complete
         """
-
+        finished = Queue.Queue()
+        cancelled = threading.Event()
+        pending = set()
+        for extension in self.extensions:
+            stats = self.extension_stats.setdefault(extension,
+                                                    ExtensionStats())
+            with self._extensions_lock:
+                running = extension in self._running_extensions
+                self._running_extensions.add(extension)
+            if running:
+                stats.overrun()
+                continue
+            pending.add(extension)
+            self.extension_pool.submit(self._run_extension, extension, word,
+                                       cancelled, finished)
+        end = time.time() + self.extension_budget
+        return self._gen_finished_extensions(pending, finished, cancelled,
+                                             end)
+
+    def _search(self, word, command):
+        """Get where to search for ``word`` and what to search for there.
+
+        Returns the listing to search, or ``None`` for variables, the head of
+        the word, the name to search for, and the directory by which names
+        are known to the frecency index.
+        """
         if word.startswith("$"):
-            for match in self.gen_variable_completions(word, os.environ):
-                yield match
+            # ignore the first character, which is a dollar sign
+            return None, "$", word[1:], None
+        head, tail = os.path.split(word)
+        if command and not head:
+            return self.commands.listing(), head, tail, ""
+        path = head or '.'
+        return self.index.listing(path), head, tail, os.path.abspath(path)
+
+    def _gen_entries(self, listing, head, term, fuzzy=False):
+        if listing is None:
+            for match in self.gen_variable_completions("$" + term, environ):
+                yield match[1:], Match.make(match, False)
+            return
+        if fuzzy:
+            found = sorted(listing.candidates.search(term),
+                           key=operator.itemgetter(1))
+            names = [name for name, _ in found]
         else:
-            head, tail = os.path.split(word)
-            filenames = os.listdir(head or '.')
-            completions = self.gen_filename_completions(tail, filenames)
-            for match in completions:
-                yield os.path.join(head, match)
-        for extension in self.extensions:
-            for match in extension(word):
-                yield match
+            names = self.gen_filename_completions(term, listing)
+        for name in names:
+            match = os.path.join(head, name)
+            yield name, Match.make(match, listing.isdir(name))
+
+    def gen_matches(self, word, command=False):
+        """Generate a sequence of possible completions for ``word``.
+
+        :param word: the word to complete
+        :param command: (optional) ``True`` if ``word`` is in command
+                        position, so it should be completed from the
+                        commands on the search path. Defaults to ``False``.
+        """
+        # let the extensions run while the filesystem is searched
+        extensions = self.gen_extension_completions(word)
+        listing, head, term, _ = self._search(word, command)
+        for _, match in self._gen_entries(listing, head, term):
+            yield match
+        for match in extensions:
+            yield match
 
     def gen_variable_completions(self, word, env):
         """Generate a sequence of possible variable completions for ``word``.
@@ -183,31 +550,89 @@ class Completer(object):
             if k.startswith(var):
                 yield "$" + k
 
-    def get_matches(self, word):
+    def get_session(self, word, command=False):
+        """Get a :class:`Session` for ``word``.
+
+        If the current session was for a shorter word in the same place, and
+        nothing it depends on has changed, it is narrowed rather than
+        searching again.
+
+        :param word: the word to complete
+        :param command: (optional) ``True`` if ``word`` is in command
+                        position. Defaults to ``False``.
+        """
+        listing, head, term, root = self._search(word, command)
+        frecency = self.frecency
+        key = (listing, head, self.exclude_filter, self.fuzzy,
+               frecency and frecency.version, environ.version)
+        session = self.session
+        if (session is None or session.key != key or
+                not term.startswith(session.term)):
+            session = self._new_session(key, listing, head, term, root)
+        else:
+            session = session.narrow(term)
+            if (not session.entries and not session.fuzzy and self.fuzzy and
+                    term and listing is not None):
+                # nothing starts with the longer term, so search again as a
+                # new session would, for names which contain it
+                session = self._new_session(key, listing, head, term, root)
+        self.session = session.narrow(term)
+        return self.session
+
+    def _new_session(self, key, listing, head, term, root):
+        entries = self._get_entries(listing, head, term)
+        fuzzy = not entries and self.fuzzy and term and listing is not None
+        if fuzzy:
+            entries = self._get_entries(listing, head, term, fuzzy=True)
+        frecency = self.frecency
+        if frecency is not None and root is not None:
+            now = time.time()
+            entries.sort(key=lambda entry: -frecency.score(
+                os.path.join(root, entry[0]), now))
+        return Session(key, term, entries, fuzzy=bool(fuzzy))
+
+    def _get_entries(self, listing, head, term, fuzzy=False):
+        entries = self._gen_entries(listing, head, term, fuzzy)
+        excluded = self.exclude_filter
+        if excluded.patterns:
+            return [(name, match) for name, match in entries
+                    if not excluded(match)]
+        return list(entries)
+
+    def get_matches(self, word, command=False):
         """
         Get a list of filenames with match *word*.
+
+        :param word: the word to complete
+        :param command: (optional) ``True`` if ``word`` is in command
+                        position. Defaults to ``False``.
         """
-        matches = self.gen_matches(word)
+        extensions = self.gen_extension_completions(word)
         # defend this against bad user input for regular expression patterns
         try:
-            matches = self.exclude_matches(matches)
-        except Exception:
+            session = self.get_session(word, command)
+            extensions = self.exclude_matches(extensions)
+        except re.error:
             sys.stderr.write(traceback.format_exc())
             return None
-        else:
-            if self.use_suffix:
-                matches = [self.inflect(match) for match in matches]
-            return list(matches)
+        matches = itertools.chain(session.matches, extensions)
+        if self.use_suffix:
+            matches = [self.inflect(match) for match in matches]
+        return list(matches)
 
     def inflect(self, filename):
         """Inflect a filename to indicate its type.
 
         If the file is a directory, the suffix "/" is appended, otherwise
-        a space is appended.
+        a space is appended. The file is only stat'd if ``filename`` is not a
+        :class:`Match` of known type.
 
         :param filename: the name of the file to inflect
         """
-        suffix = ("/" if os.path.isdir(filename) else " ")
+        isdir = getattr(filename, "isdir", None)
+        if isdir is None:
+            isdir = os.path.isdir(filename)
+        suffix = ("/" if isdir else " ")
         return self._escape(filename) + suffix
 
     def _escape(self, path):
@@ -215,7 +640,8 @@ class Completer(object):
         return path.replace(" ", "\\ ")
 
 
-def make_completer(transforms, use_suffix=True, exclude=None):
+def make_completer(transforms, use_suffix=True, exclude=None, fuzzy=False,
+                   frecency=None):
     try:
         import rl
     except ImportError:
@@ -225,7 +651,8 @@ def make_completer(transforms, use_suffix=True, exclude=None):
         pprint.pprint(os.environ["PYTHONPATH"])
         return None
     else:
-        completer = Completer(transforms, use_suffix, exclude)
+        completer = Completer(transforms, use_suffix, exclude, fuzzy=fuzzy,
+                              frecency=frecency)
         rl.completer.completer = completer.complete
         rl.completer.parse_and_bind('TAB: complete')
         # rl.completion.filename_completion_desired = True
@@ -0,0 +1,275 @@
+"""
+twosheds.coprocess
+~~~~~~~~~~~~~~~~~~
+
+This module implements the coprocess, a long-lived sh which runs the commands
+that need sh, so that a new sh need not be started and set up for each one.
+
+The coprocess reads each command from a pipe, and runs it in a subshell of
+its own, so that a command which exits or changes sh does not change the
+coprocess, as though it had been given a new sh. After each command, it
+writes a line of a sentinel and the exit status to another pipe, and sends
+the shell ``SIGCHLD``, so the shell is woken as it would be for a child of
+its own. Before each command, the shell sends along whatever changes have
+been made to its working directory and environment, such as by the ``cd``
+and ``export`` builtins, so the coprocess runs the command where a new sh
+would.
+"""
+import binascii
+import errno
+import fcntl
+import os
+import re
+import select
+import subprocess
+import threading
+
+from .kernel import default_sigpipe
+
+# the file descriptors the coprocess reads commands from and writes exit
+# statuses to
+COMMAND_FD = 3
+STATUS_FD = 4
+# the highest file descriptor to close in the coprocess, which subprocess
+# only gives on Python 2
+MAXFD = getattr(subprocess, "MAXFD", None) or os.sysconf("SC_OPEN_MAX")
+# the names sh can give variables
+NAME_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*\Z")
+
+# reads the number of lines of each command and the lines, runs them, and
+# writes the sentinel, given as $1, and the exit status
+DRIVER = r"""
+trap '' INT QUIT
+while IFS= read -r _twosheds_n <&3; do
+    _twosheds_text=
+    while [ "$_twosheds_n" -gt 0 ]; do
+        IFS= read -r _twosheds_line <&3 || exit
+        _twosheds_text="$_twosheds_text$_twosheds_line
+"
+        _twosheds_n=$((_twosheds_n - 1))
+    done
+    eval "$_twosheds_text" 3<&- 4>&-
+    printf '%s %d\n' "$1" "$?" >&4
+    kill -CHLD $PPID 2>/dev/null
+done
+"""
+
+
+def quote(text):
+    """Quote ``text`` for sh.
+
+    >>> print(quote("it's"))
+    'it'\\''s'
+    """
+    return "'%s'" % text.replace("'", "'\\''")
+
+
+def gen_changes(old, new):
+    """Generate the sh commands which change the environment ``old`` into
+    ``new``.
+
+    >>> list(gen_changes({"A": "1", "B": "2"}, {"A": "1", "C": "x y"}))
+    ["export C='x y'", 'unset B']
+
+    :param old: the environment sh has
+    :param new: the environment it should have
+    """
+    for name in sorted(new):
+        if old.get(name) != new[name] and NAME_PATTERN.match(name):
+            yield "export %s=%s" % (name, quote(new[name]))
+    for name in sorted(old):
+        if name not in new and NAME_PATTERN.match(name):
+            yield "unset %s" % name
+
+
+class CoprocessCommand(object):
+    """A command run by a :class:`Coprocess`, which can be waited for like a
+    :class:`subprocess.Popen`.
+
+    :param coprocess: the :class:`Coprocess`
+    """
+    pid = None
+
+    def __init__(self, coprocess):
+        self.coprocess = coprocess
+        #: the exit status, once the command has finished
+        self.returncode = None
+
+    def poll(self):
+        """Get the exit status, or ``None`` if the command is running."""
+        if self.returncode is None:
+            self.returncode = self.coprocess.poll()
+        return self.returncode
+
+    def wait(self):
+        """Wait for the command to finish, and get the exit status."""
+        if self.returncode is None:
+            self.returncode = self.coprocess.wait()
+        return self.returncode
+
+
+class Coprocess(object):
+    """A long-lived sh which runs one command at a time.
+
+    The coprocess is started when the first command is sent to it, and
+    started again if it has died.
+
+    :param path: (optional) the path of sh. Defaults to ``/bin/sh``.
+    """
+    def __init__(self, path="/bin/sh"):
+        self.path = path
+        #: the sh process
+        self.process = None
+        #: the :class:`CoprocessCommand` which is running, if any
+        self.command = None
+        self._lock = threading.Lock()
+        self._commands = None
+        self._statuses = None
+        self._buffer = b""
+        self._sentinel = None
+        self._cwd = None
+        self._environ = None
+
+    def start(self):
+        """Start sh."""
+        self.close()
+        self._sentinel = binascii.hexlify(os.urandom(8)).decode()
+        command_r, command_w = os.pipe()
+        status_r, status_w = os.pipe()
+        # keep them clear of where they are going
+        fds = [fcntl.fcntl(fd, fcntl.F_DUPFD, STATUS_FD + 1)
+               for fd in (command_r, status_w)]
+        for fd in (command_r, status_w):
+            os.close(fd)
+
+        def preexec():
+            default_sigpipe()
+            os.dup2(fds[0], COMMAND_FD)
+            os.dup2(fds[1], STATUS_FD)
+            os.closerange(STATUS_FD + 1, MAXFD)
+
+        try:
+            self.process = subprocess.Popen(
+                [self.path, "-c", DRIVER, "sh", self._sentinel],
+                close_fds=False, preexec_fn=preexec)
+        except BaseException:
+            for fd in fds + [command_w, status_r]:
+                os.close(fd)
+            raise
+        for fd in fds:
+            os.close(fd)
+        for fd in (command_w, status_r):
+            flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+            fcntl.fcntl(fd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+        self._commands = os.fdopen(command_w, "w")
+        self._statuses = status_r
+        self._buffer = b""
+        self._cwd = os.getcwd()
+        self._environ = dict(os.environ)
+
+    def _sync(self):
+        """Get the sh commands which bring the coprocess up to date with the
+        working directory and environment of the shell."""
+        changes = []
+        cwd = os.getcwd()
+        if cwd != self._cwd:
+            changes.append("cd -- %s" % quote(cwd))
+            self._cwd = cwd
+        environ = dict(os.environ)
+        if environ != self._environ:
+            changes.extend(gen_changes(self._environ, environ))
+            self._environ = environ
+        return changes
+
+    def _send(self, text):
+        lines = self._sync()
+        # in a subshell with the terminal's signals, as a new sh would be
+        lines.append("(trap - INT QUIT; eval %s)" % quote(text))
+        script = "\n".join(lines)
+        self._commands.write("%d\n%s\n" % (script.count("\n") + 1, script))
+        self._commands.flush()
+
+    def submit(self, text):
+        """Send the command ``text`` to be run.
+
+        Returns the :class:`CoprocessCommand`, or ``None`` if the coprocess
+        is busy with another.
+
+        :param text: the command
+        """
+        if not self._lock.acquire(False):
+            return None
+        try:
+            if self.command is not None:
+                if self.command.poll() is None:
+                    return None
+            if self.process is None or self.process.poll() is not None:
+                self.start()
+            try:
+                self._send(text)
+            except IOError as e:
+                if e.errno != errno.EPIPE:
+                    raise
+                # it has died since it was last looked at
+                self.start()
+                self._send(text)
+            self.command = CoprocessCommand(self)
+            return self.command
+        finally:
+            self._lock.release()
+
+    def _read(self, timeout):
+        """Get the next exit status, waiting up to ``timeout`` seconds for
+        it, or ``None`` if there is none yet."""
+        while True:
+            while b"\n" in self._buffer:
+                line, self._buffer = self._buffer.split(b"\n", 1)
+                sentinel, _, status = line.decode().partition(" ")
+                if sentinel == self._sentinel:
+                    return int(status)
+            try:
+                readable = select.select([self._statuses], [], [],
+                                         timeout)[0]
+            except (select.error, OSError) as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+                continue
+            if not readable:
+                return None
+            data = os.read(self._statuses, 4096)
+            if not data:  # it died
+                return self.process.wait() or 1
+            self._buffer += data
+
+    def poll(self):
+        """Get the exit status of the running command, or ``None`` if it is
+        still running."""
+        return self._read(0)
+
+    def wait(self):
+        """Wait for the running command to finish, and get its exit
+        status."""
+        return self._read(None)
+
+    def run(self, text):
+        """Run the command ``text``.
+
+        Returns the exit status, or ``None`` if the coprocess is busy with
+        another command.
+
+        :param text: the command
+        """
+        command = self.submit(text)
+        if command is None:
+            return None
+        return command.wait()
+
+    def close(self):
+        """Stop sh, once it has finished the command it is running."""
+        if self.process is None:
+            return
+        self._commands.close()
+        os.close(self._statuses)
+        self.process.wait()
+        self.process = None
+        self.command = None
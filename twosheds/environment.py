@@ -0,0 +1,114 @@
+"""
+twosheds.environment
+~~~~~~~~~~~~~~~~~~~~
+
+This module implements the environment of the shell, which keeps track of
+when it changes so that what is derived from it need only be recomputed then.
+"""
+import os
+try:
+    from collections.abc import MutableMapping
+except ImportError:  # Python 2
+    from collections import MutableMapping
+
+
+class Environment(MutableMapping):
+    """A mapping of environmental variables with a version.
+
+    Changes are written through to ``backing`` and increase :attr:`version`,
+    so anything derived from the environment can be reused for as long as the
+    version stays the same. A table of the names of the variables holding each
+    value is kept up to date as variables change, rather than being rebuilt.
+
+    >>> env = Environment({'HOME': '/Users/arthurjackson'})
+    >>> env.name_of('/Users/arthurjackson')
+    'HOME'
+    >>> env['HOME'] = '/home/arthurjackson'
+    >>> env.version
+    1
+
+    Changes made directly to ``backing`` go unnoticed until :meth:`refresh`
+    is called.
+
+    :param backing: (optional) the mapping to read variables from and write
+                    them to. Defaults to :data:`os.environ`.
+    """
+    def __init__(self, backing=None):
+        self.backing = os.environ if backing is None else backing
+        self.version = 0
+        self._data = dict(self.backing)
+        self._names = None
+
+    def _index(self):
+        names = {}
+        for name, value in self._data.items():
+            names.setdefault(value, set()).add(name)
+        return names
+
+    def _forget(self, name):
+        if self._names is None or name not in self._data:
+            return
+        value = self._data[name]
+        names = self._names[value]
+        names.discard(name)
+        if not names:
+            del self._names[value]
+
+    def __getitem__(self, name):
+        return self._data[name]
+
+    def get(self, name, default=None):
+        return self._data.get(name, default)
+
+    def __contains__(self, name):
+        return name in self._data
+
+    def __setitem__(self, name, value):
+        if name in self._data and self._data[name] == value:
+            return
+        self.backing[name] = value
+        self._forget(name)
+        self._data[name] = value
+        if self._names is not None:
+            self._names.setdefault(value, set()).add(name)
+        self.version += 1
+
+    def __delitem__(self, name):
+        del self.backing[name]
+        self._forget(name)
+        del self._data[name]
+        self.version += 1
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def name_of(self, value):
+        """Get the name of a variable holding ``value``, or ``None`` if there
+        is none.
+
+        If several variables hold the value, the first name in sorted order
+        is chosen.
+
+        :param value: the value to look up
+        """
+        if self._names is None:
+            self._names = self._index()
+        names = self._names.get(value)
+        if not names:
+            return None
+        return min(names)
+
+    def refresh(self):
+        """Take in any changes made directly to ``backing``."""
+        data = dict(self.backing)
+        if data != self._data:
+            self._data = data
+            self._names = None
+            self.version += 1
+
+
+#: the environment of the process
+environ = Environment()
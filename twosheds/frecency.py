@@ -0,0 +1,171 @@
+"""
+twosheds.frecency
+~~~~~~~~~~~~~~~~~
+
+This module implements an index of how frequently and recently paths and
+commands have been used.
+"""
+import fcntl
+import os
+import time
+
+# the total rank above which ranks are aged, so old entries fade away
+MAXRANK = 10000.0
+
+
+def frecency(rank, last, now):
+    """Weigh how often something was used by how recently it was last used.
+
+    :param rank: how often it was used
+    :param last: the time it was last used
+    :param now: the current time
+    """
+    age = now - last
+    if age < 3600:
+        return rank * 4
+    if age < 86400:
+        return rank * 2
+    if age < 604800:
+        return rank / 2
+    return rank / 4
+
+
+class FrecencyIndex(object):
+    """An index of how frequently and recently things have been used.
+
+    The index is kept in a file with a line for each use, so recording a use
+    only appends to it. Each line holds a rank, a time and a key, separated by
+    tabs. When the file grows well past the number of keys, it is rewritten
+    with a single line per key, and if the total rank has grown past
+    ``maxrank``, every rank is aged and keys which fall below 1 are forgotten.
+
+    Several shells can share the file. Appending to it and rewriting it are
+    done under a lock, and the file is read again before it is rewritten, so
+    that the uses other shells recorded are kept.
+
+    :param filename: (optional) the file to keep the index in. Defaults to
+                     keeping it in memory.
+    :param maxrank: (optional) the total rank above which ranks are aged.
+                    Defaults to ``MAXRANK``.
+    """
+    def __init__(self, filename=None, maxrank=MAXRANK):
+        self.filename = filename
+        self.maxrank = maxrank
+        self.entries = {}
+        self.version = 0
+        self._lines = 0
+        self._unsaved = []
+        if filename is not None:
+            self.load()
+
+    def load(self):
+        """Read the index from its file."""
+        self.entries = entries = {}
+        self._lines = 0
+        try:
+            f = open(self.filename)
+        except IOError:
+            return
+        with f:
+            for line in f:
+                try:
+                    rank, last, key = line.rstrip("\n").split("\t", 2)
+                    rank, last = float(rank), float(last)
+                except ValueError:  # a line was cut short
+                    continue
+                try:
+                    entry = entries[key]
+                except KeyError:
+                    entries[key] = [rank, last]
+                else:
+                    entry[0] += rank
+                    entry[1] = max(entry[1], last)
+                self._lines += 1
+        self.version += 1
+
+    def add(self, key, now=None):
+        """Record a use of ``key``.
+
+        :param key: an absolute path or the name of a command
+        :param now: (optional) the time of the use. Defaults to the current
+                    time.
+        """
+        if "\n" in key:  # it could not be read back
+            return
+        if now is None:
+            now = time.time()
+        try:
+            entry = self.entries[key]
+        except KeyError:
+            self.entries[key] = [1.0, now]
+        else:
+            entry[0] += 1
+            entry[1] = now
+        self._unsaved.append((1.0, now, key))
+        self.version += 1
+
+    def score(self, key, now=None):
+        """Get the frecency of ``key``, which is 0 if it has not been used.
+
+        :param key: an absolute path or the name of a command
+        :param now: (optional) the current time
+        """
+        try:
+            rank, last = self.entries[key]
+        except KeyError:
+            return 0
+        return frecency(rank, last, time.time() if now is None else now)
+
+    def save(self):
+        """Append the uses recorded since the index was last saved to its
+        file, compacting the file if it has grown too long."""
+        if self.filename is None or not self._unsaved:
+            return
+        if self._lines + len(self._unsaved) > 2 * len(self.entries) + 100:
+            self.compact()
+            return
+        with self._lock(), open(self.filename, "a") as f:
+            f.writelines("%g\t%f\t%s\n" % use for use in self._unsaved)
+        self._lines += len(self._unsaved)
+        self._unsaved = []
+
+    def _lock(self):
+        """Lock the file against other shells until the returned file is
+        closed."""
+        f = open(self.filename + ".lock", "a")
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    def _age(self):
+        if sum(rank for rank, _ in self.entries.values()) > self.maxrank:
+            for key, entry in list(self.entries.items()):
+                entry[0] *= 0.9
+                if entry[0] < 1:
+                    del self.entries[key]
+            self.version += 1
+
+    def compact(self):
+        """Rewrite the file with a single line per key, aging the ranks if
+        they have grown too large."""
+        unsaved, self._unsaved = self._unsaved, []
+        if self.filename is None:
+            self._age()
+            return
+        with self._lock():
+            # take in what other shells have appended since it was read
+            self.load()
+            for rank, last, key in unsaved:
+                try:
+                    entry = self.entries[key]
+                except KeyError:
+                    self.entries[key] = [rank, last]
+                else:
+                    entry[0] += rank
+                    entry[1] = max(entry[1], last)
+            self._age()
+            tmp = "%s.%d" % (self.filename, os.getpid())
+            with open(tmp, "w") as f:
+                f.writelines("%g\t%f\t%s\n" % (rank, last, key)
+                             for key, (rank, last) in self.entries.items())
+            os.rename(tmp, self.filename)
+        self._lines = len(self.entries)
@@ -0,0 +1,123 @@
+"""
+twosheds.fuzzy
+~~~~~~~~~~~~~~
+
+This module implements fuzzy matching, which finds the strings that contain
+each character of a query in order, though not necessarily next to each other.
+"""
+import bisect
+import re
+
+# separates candidates, and cannot appear in a filename
+SEPARATOR = "\0"
+
+
+def compile_query(query, flags=0):
+    """Compile a regular expression which matches a string containing
+    ``query`` as a subsequence.
+
+    The gap before each character after the first may not contain it, nor a
+    :data:`SEPARATOR`, so its leftmost occurrence is found without
+    backtracking.
+
+    >>> regex = compile_query("mk", re.IGNORECASE)
+    >>> regex.match("Makefile") is None, regex.match("main.c") is None
+    (False, True)
+
+    :param query: the characters to look for
+    :param flags: (optional) flags for the regular expression
+    """
+    pattern = []
+    for i, char in enumerate(query):
+        if i > 0:
+            pattern.append("[^%s]*" % re.escape(SEPARATOR + char))
+        pattern.append(re.escape(char))
+    return re.compile("".join(pattern), flags)
+
+
+def is_case_sensitive(query):
+    """Check if ``query`` should match case-sensitively, which is only if it
+    contains an uppercase character."""
+    return query != query.lower()
+
+
+def quality(match, start, length):
+    """Rate how closely a candidate matches its query. Lower is better.
+
+    Matches are preferred which start at the beginning of the candidate, then
+    which spread over fewer characters, then which are shorter.
+
+    :param match: the match object for the query
+    :param start: the position of the candidate in the searched text
+    :param length: the length of the candidate
+    """
+    span = match.end() - match.start()
+    return (match.start() > start, span, length)
+
+
+class Candidates(object):
+    """A sequence of strings prepared for fuzzy matching.
+
+    The strings are joined into one block of text, so a single search with a
+    compiled regular expression finds each string which matches a query,
+    without looping over all of the strings in Python. A lowercased copy of
+    the text is kept for case-insensitive queries.
+
+    >>> candidates = Candidates(["Makefile", "main.c", "README"])
+    >>> [string for string, _ in candidates.search("mc")]
+    ['main.c']
+
+    :param strings: the strings to match against
+    """
+    def __init__(self, strings):
+        self.strings = list(strings)
+        self.starts = []
+        offset = 0
+        for string in self.strings:
+            self.starts.append(offset)
+            offset += len(string) + len(SEPARATOR)
+        self.text = SEPARATOR.join(self.strings)
+        self._folded = None
+
+    @property
+    def folded(self):
+        """The text in lowercase, or ``None`` if lowercasing changes its
+        length."""
+        if self._folded is None:
+            folded = self.text.lower()
+            self._folded = folded if len(folded) == len(self.text) else False
+        return self._folded or None
+
+    def search(self, query):
+        """Generate ``(string, quality)`` pairs for the strings which contain
+        ``query`` as a subsequence, in order.
+
+        :param query: the characters to look for
+        """
+        if not query:
+            for string in self.strings:
+                yield string, (False, 0, len(string))
+            return
+        text = self.text
+        if is_case_sensitive(query):
+            regex = compile_query(query)
+        elif self.folded is not None:
+            text = self.folded
+            regex = compile_query(query.lower())
+        else:
+            regex = compile_query(query, re.IGNORECASE)
+        search = regex.search
+        starts, strings = self.starts, self.strings
+        pos = 0
+        while True:
+            match = search(text, pos)
+            if match is None:
+                return
+            i = bisect.bisect_right(starts, match.start()) - 1
+            string = strings[i]
+            yield string, quality(match, starts[i], len(string))
+            # skip the rest of the candidate
+            pos = starts[i] + len(string) + len(SEPARATOR)
+
+    def __len__(self):
+        return len(self.strings)
@@ -0,0 +1,312 @@
+"""
+twosheds.index
+~~~~~~~~~~~~~~
+
+This module implements indexes of directory contents for use by completion.
+"""
+import bisect
+import collections
+import itertools
+import os
+import threading
+import time
+try:
+    from os import scandir
+except ImportError:
+    from scandir import scandir
+
+from .fuzzy import Candidates
+
+
+class Listing(object):
+    """A sorted snapshot of the names in a directory.
+
+    >>> listing = Listing(["food", "foo", "bar"])
+    >>> list(listing.startingwith("fo"))
+    ['foo', 'food']
+
+    :param names: the names of the entries in the directory
+    :param stamp: (optional) identifies the state of the directory when it
+                  was listed
+    :param directories: (optional) the names which are known to be
+                        directories
+    :param links: (optional) the names which are symbolic links, and so
+                  whose type is unknown until they are resolved
+    """
+    def __init__(self, names, stamp=None, directories=(), links=None):
+        self.names = sorted(names)
+        self.stamp = stamp
+        self.directories = frozenset(directories)
+        # without type information every name must be resolved
+        self.links = None if links is None else frozenset(links)
+        self._candidates = None
+
+    @classmethod
+    def from_entries(cls, entries, stamp=None):
+        """Make a listing from a sequence of ``(name, isdir)`` pairs.
+
+        ``isdir`` is ``None`` for names of unknown type.
+
+        :param entries: the entries in the directory
+        :param stamp: (optional) identifies the state of the directory when it
+                      was listed
+        """
+        names = [name for name, _ in entries]
+        directories = [name for name, isdir in entries if isdir]
+        links = [name for name, isdir in entries if isdir is None]
+        return cls(names, stamp, directories, links)
+
+    def isdir(self, name):
+        """Check if ``name`` is a directory.
+
+        Returns ``None`` if that cannot be known without resolving the name.
+
+        :param name: the name of an entry in the listing
+        """
+        if name in self.directories:
+            return True
+        if self.links is None or name in self.links:
+            return None
+        return False
+
+    @property
+    def candidates(self):
+        """The names as :class:`Candidates <twosheds.fuzzy.Candidates>` for
+        fuzzy matching, which are prepared the first time they are needed."""
+        if self._candidates is None:
+            self._candidates = Candidates(self.names)
+        return self._candidates
+
+    def startingwith(self, prefix):
+        """Generate the names which begin with ``prefix`` in sorted order.
+
+        :param prefix: the prefix to look up
+        """
+        if not prefix:
+            return iter(self.names)
+        start = bisect.bisect_left(self.names, prefix)
+        return itertools.takewhile(lambda name: name.startswith(prefix),
+                                   itertools.islice(self.names, start, None))
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+
+def stamp(path):
+    """Get a value which changes whenever the directory at ``path`` does.
+
+    :param path: the path to the directory
+    """
+    st = os.stat(path)
+    return (st.st_dev, st.st_ino, st.st_mtime)
+
+
+class DirectoryIndex(object):
+    """A cache of directory listings.
+
+    Listings are keyed on the absolute path of the directory and are reused
+    until the device, inode or modification time of the directory changes.
+
+    If a :class:`Pool <twosheds.pool.Pool>` is given, directories are read by
+    its threads. Should reading a directory take longer than ``deadline``
+    seconds, whatever is known of it so far is returned instead, and the
+    directory is marked as slow. The directory continues to be read in the
+    background, and until that finishes, requests for it return immediately
+    rather than reading it again, so a directory which hangs only ever holds
+    up one of the threads.
+
+    :param maxsize: (optional) the maximum number of directories to remember
+    :param pool: (optional) the :class:`Pool <twosheds.pool.Pool>` with which
+                 to read directories. Defaults to reading them directly.
+    :param deadline: (optional) the number of seconds to wait for a directory
+                     to be read by the pool. Defaults to waiting for as long
+                     as it takes.
+    """
+    def __init__(self, maxsize=64, pool=None, deadline=None):
+        self.maxsize = maxsize
+        self.pool = pool
+        self.deadline = deadline
+        self.slow = set()
+        self._listings = collections.OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def gen_entries(self, path):
+        """Generate ``(name, isdir)`` pairs for the directory at ``path``.
+
+        The type of each entry is taken from the directory itself, so only
+        entries of unknown type are stat'd. ``isdir`` is ``None`` for
+        symbolic links.
+
+        :param path: the path to the directory
+        """
+        for entry in scandir(path):
+            if entry.is_symlink():
+                yield entry.name, None
+            else:
+                yield entry.name, entry.is_dir(follow_symlinks=False)
+
+    def scan(self, path, entries=None):
+        """Read the directory at ``path``.
+
+        :param path: the path to the directory
+        :param entries: (optional) a list to add entries to as they are read
+        """
+        if entries is None:
+            entries = []
+        for entry in self.gen_entries(path):
+            entries.append(entry)
+        return Listing.from_entries(entries)
+
+    def _refresh(self, path, entries):
+        current = stamp(path)
+        with self._lock:
+            listing = self._listings.pop(path, None)
+        if listing is None or listing.stamp != current:
+            listing = self.scan(path, entries)
+            listing.stamp = current
+        with self._lock:
+            self._listings[path] = listing
+            while len(self._listings) > self.maxsize:
+                self._listings.popitem(last=False)
+        return listing
+
+    def _submit(self, path):
+        with self._lock:
+            task = self._pending.get(path)
+            if task is not None:
+                # however slow a directory is, it is only read once at a time
+                if not task.done():
+                    return task
+                # it finished after it was last looked up, and what it read
+                # may have changed since
+                self.slow.discard(path)
+            entries = []
+            task = self.pool.submit(self._refresh, path, entries)
+            task.entries = entries
+            self._pending[path] = task
+            return task
+
+    def _collect(self, path, task, timeout):
+        if path in self.slow:
+            timeout = 0
+        if task.wait(timeout):
+            with self._lock:
+                if self._pending.get(path) is task:
+                    del self._pending[path]
+            self.slow.discard(path)
+            return task.get()
+        self.slow.add(path)
+        with self._lock:
+            listing = self._listings.get(path)
+        entries = listing_entries(listing) if listing else list(task.entries)
+        # resolving symbolic links could block too
+        return Listing.from_entries([(name, bool(isdir))
+                                     for name, isdir in entries])
+
+    def listing(self, path):
+        """Get an up-to-date listing of the directory at ``path``.
+
+        :param path: the path to the directory
+        """
+        for _, listing in self.listings([path], errors=True):
+            return listing
+
+    def listings(self, paths, errors=False):
+        """Generate ``(path, listing)`` pairs for several directories.
+
+        The directories are read at once, and all of them are given the same
+        deadline.
+
+        :param paths: the paths to the directories
+        :param errors: (optional) ``True`` to raise errors from reading the
+                       directories, rather than skipping them. Defaults to
+                       ``False``.
+        """
+        paths = [os.path.abspath(path) for path in paths]
+        if self.pool is None:
+            for path in paths:
+                try:
+                    yield path, self._refresh(path, [])
+                except OSError:
+                    if errors:
+                        raise
+            return
+        tasks = [self._submit(path) for path in paths]
+        if self.deadline is not None:
+            end = time.time() + self.deadline
+        for path, task in zip(paths, tasks):
+            timeout = None
+            if self.deadline is not None:
+                timeout = max(0, end - time.time())
+            try:
+                yield path, self._collect(path, task, timeout)
+            except OSError:
+                if errors:
+                    raise
+
+    def clear(self):
+        """Forget every listing."""
+        with self._lock:
+            self._listings.clear()
+
+
+def listing_entries(listing):
+    """Get the ``(name, isdir)`` pairs of ``listing``.
+
+    :param listing: a :class:`Listing`
+    """
+    return [(name, listing.isdir(name)) for name in listing]
+
+
+class ExecutableIndex(DirectoryIndex):
+    """A cache of the executables in directories.
+
+    .. note::
+
+        Making a file executable does not change the modification time of its
+        directory, so this is not noticed until the directory changes.
+    """
+    def gen_entries(self, path):
+        for entry in scandir(path):
+            # only symbolic links are stat'd to find what they point to
+            if entry.is_file() and os.access(entry.path, os.X_OK):
+                yield entry.name, False
+
+
+class CommandIndex(object):
+    """An index of the executables in the directories on the search path.
+
+    Each directory is read through an :class:`ExecutableIndex`, so it is only
+    read again when it changes. Since the executables in each directory are
+    remembered, changing the search path only requires the directories which
+    are new to it to be read.
+
+    :param directories: (optional) the :class:`ExecutableIndex` used to read
+                        the directories on the search path
+    """
+    def __init__(self, directories=None):
+        self.directories = directories or ExecutableIndex()
+        self._search_path = None
+        self._commands = Listing([], directories=(), links=())
+
+    def listing(self, search_path=None):
+        """Get a :class:`Listing` of the commands on the search path.
+
+        :param search_path: (optional) a list of directories separated by
+                            :data:`os.pathsep`. Defaults to ``$PATH``.
+        """
+        if search_path is None:
+            search_path = os.environ.get("PATH", os.defpath)
+        paths = [path or "." for path in search_path.split(os.pathsep)]
+        executables = [listing for _, listing
+                       in self.directories.listings(paths)]
+        # unchanged directories give the very same listings, so this is cheap
+        if executables != self._search_path:
+            commands = frozenset().union(*executables)
+            self._commands = Listing(commands, directories=(), links=())
+            self._search_path = executables
+        return self._commands
@@ -0,0 +1,468 @@
+"""
+twosheds.job
+~~~~~~~~~~~~
+
+This module implements jobs, which run each stage of a pipeline at the same
+time, joined by pipes, without starting a shell to join them, and the table of
+jobs running in the background.
+
+A stage whose command is a builtin is run on a thread of the shell rather than
+in a new process. The thread reads from and writes to its pipes through
+:data:`sys.stdin` and :data:`sys.stdout`, which each thread may redirect for
+itself.
+"""
+import errno
+import os
+import signal
+import sys
+import threading
+import traceback
+
+from .kernel import Kernel
+from .sentence import Sentence
+from .token import LParen, RParen, Word
+
+PIPE = "|"
+# the operators which only sh can act on
+OPERATORS = frozenset(["||", "&&", "&", ";;", ";"])
+
+
+def split_pipeline(sentence):
+    """Split ``sentence`` into the sentence of each stage of a pipeline.
+
+    Returns ``None`` if the sentence uses anything but pipes to join its
+    commands, or a stage is empty, so that only sh could run it.
+
+    >>> from twosheds.lexer import gen_tokens
+    >>> split_pipeline(Sentence(list(gen_tokens("ls -a | wc -l"))))
+    [Sentence([ls, -a]), Sentence([wc, -l])]
+
+    :param sentence: the :class:`Sentence <twosheds.sentence.Sentence>`
+    """
+    stages = [[]]
+    for token in sentence.tokens:
+        if isinstance(token, Word):
+            text = token.text
+            if text == PIPE:
+                stages.append([])
+                continue
+            if text in OPERATORS:
+                return None
+        elif isinstance(token, (LParen, RParen)):
+            return None
+        stages[-1].append(token)
+    if not all(stages):
+        return None
+    return [Sentence(stage) for stage in stages]
+
+
+class ThreadStream(object):
+    """A standard stream which each thread may redirect for itself.
+
+    :param default: the stream of threads which have not redirected it
+    """
+    def __init__(self, default):
+        self.default = default
+        self._local = threading.local()
+
+    @property
+    def stream(self):
+        """The stream of the current thread."""
+        return getattr(self._local, "stream", self.default)
+
+    def redirect(self, stream):
+        """Redirect the stream of the current thread to ``stream``."""
+        self._local.stream = stream
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    def __iter__(self):
+        return iter(self.stream)
+
+
+def thread_stream(name):
+    """Get the standard stream ``name`` of :mod:`sys`, replacing it with a
+    :class:`ThreadStream` first if need be.
+
+    :param name: ``"stdin"`` or ``"stdout"``
+    """
+    stream = getattr(sys, name)
+    if not isinstance(stream, ThreadStream):
+        stream = ThreadStream(stream)
+        setattr(sys, name, stream)
+    return stream
+
+
+def read_records(stream):
+    """Generate the lines of ``stream``, without their newlines, as
+    records.
+
+    Each line is read as it is needed, rather than as much of the stream as
+    can be read at once, so that records from a pipe are passed on as they
+    come.
+    """
+    for line in iter(stream.readline, ""):
+        yield line[:-1] if line.endswith("\n") else line
+
+
+def write_records(records, stream):
+    """Write each record to ``stream`` as a line of text.
+
+    :param records: an iterable of records
+    :param stream: the file to write to
+    """
+    write = stream.write
+    for record in records:
+        write("%s\n" % (record,))
+
+
+def run_stages(stages):
+    """Run streaming stages one after another on the current thread.
+
+    The first reads the lines of :data:`sys.stdin` as records, and the
+    records of the last are written to :data:`sys.stdout`. In between,
+    records are passed on as they are, one at a time.
+
+    :param stages: a list of each :class:`Stage` and its arguments
+    """
+    records = read_records(sys.stdin)
+    for stage, args in stages:
+        records = stage.func(records, *args)
+    write_records(records, sys.stdout)
+
+
+class Stage(object):
+    """A builtin which streams records, rather than text, to the next stage
+    of a pipeline.
+
+    A record can be any Python object. Records are only made into lines of
+    text at a pipe to or from a process, so a run of streaming stages passes
+    them from one to the next without copying them, one at a time.
+
+    >>> def grep(records, pattern):
+    ...     return (record for record in records if pattern in record)
+    >>> list(Stage(grep).func(iter(["ab", "bc", "cd"]), "c"))
+    ['bc', 'cd']
+
+    :param func: a function of an iterator of the records of the previous
+                 stage, followed by the arguments of the command, which
+                 returns an iterable of records
+    """
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, *args):
+        run_stages([(self, args)])
+
+
+class StageThread(object):
+    """A builtin run on a thread as a stage of a pipeline, which can be
+    waited for like a :class:`subprocess.Popen`.
+
+    The thread reads from the file descriptor ``stdin`` and writes to
+    ``stdout``, and closes them when it is done.
+
+    :param func: the builtin
+    :param args: the arguments to call it with
+    :param stdin: (optional) the file descriptor to read from
+    :param stdout: (optional) the file descriptor to write to
+    """
+    pid = None
+
+    def __init__(self, func, args, stdin=None, stdout=None):
+        self.func = func
+        self.args = args
+        #: the exit status, once the thread has finished
+        self.returncode = None
+        self._streams = []
+        if stdin is not None:
+            self._streams.append((thread_stream("stdin"),
+                                  os.fdopen(stdin, "r")))
+        if stdout is not None:
+            self._streams.append((thread_stream("stdout"),
+                                  os.fdopen(stdout, "w")))
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        for stream, f in self._streams:
+            stream.redirect(f)
+        status = 1
+        try:
+            status = self.func(*self.args)
+            sys.stdout.flush()
+            if status is None:
+                status = 0
+        except IOError as e:
+            if e.errno != errno.EPIPE:
+                traceback.print_exc()
+            else:  # the next stage stopped reading
+                status = -signal.SIGPIPE
+        except Exception:
+            traceback.print_exc()
+        finally:
+            for stream, f in self._streams:
+                try:
+                    f.close()
+                except IOError:
+                    pass
+                stream.redirect(stream.default)
+            self.returncode = status
+
+    def poll(self):
+        """Get the exit status, or ``None`` if the thread is running."""
+        if self._thread.is_alive():
+            return None
+        return self.returncode
+
+    def wait(self):
+        """Wait for the thread to finish, and get the exit status."""
+        self._thread.join()
+        return self.returncode
+
+
+class Job(object):
+    """The stages of a pipeline, run at the same time.
+
+    The exit status of a job is that of its last stage.
+
+    :param stages: the :class:`Sentence <twosheds.sentence.Sentence>` of
+                   each stage
+    :param commands: (optional) dictionary of builtins, which are run on
+                     threads
+    :param kernel: (optional) the :class:`Kernel <twosheds.kernel.Kernel>`
+                   with which to start the other stages
+    """
+    def __init__(self, stages, commands=None, kernel=None):
+        self.stages = stages
+        self.commands = commands or {}
+        self.kernel = kernel or Kernel()
+        #: the process or :class:`StageThread` of each stage
+        self.processes = []
+        #: the process group of a job in the background
+        self.pgid = None
+
+    @property
+    def text(self):
+        """The text of the pipeline."""
+        return " | ".join(str(stage) for stage in self.stages)
+
+    def _units(self):
+        """Get the sentence, builtin and arguments of each thread or process
+        to start, with each run of streaming stages joined into one."""
+        units = []
+        for stage in self.stages:
+            func = self.commands.get(stage.command)
+            if not isinstance(func, Stage):
+                units.append((stage, func, stage.args))
+            elif units and units[-1][1] is run_stages:
+                units[-1][2][0].append((func, stage.args))
+            else:
+                units.append((stage, run_stages, [[(func, stage.args)]]))
+        return units
+
+    def start(self, background=False, stdout=None, stdin=None):
+        """Start every stage.
+
+        Each run of streaming stages is started as a single thread, which
+        passes records from one to the next.
+
+        :param background: (optional) set True to start the processes of the
+                           job in a process group of their own, so that they
+                           are not interrupted along with the shell, reading
+                           from ``/dev/null`` rather than the terminal
+        :param stdout: (optional) the file descriptor for the last stage to
+                       write to, which is left open
+        :param stdin: (optional) the file descriptor for the first stage to
+                      read from, which is left open
+        """
+        units = self._units()
+        pipes = [os.pipe() for _ in units[1:]]
+        if stdout is not None:
+            pipes.append((None, os.dup(stdout)))
+        first = None if stdin is None else os.dup(stdin)
+        unused = set(fd for pipe in pipes for fd in pipe if fd is not None)
+        if first is not None:
+            unused.add(first)
+        devnull = None
+        if background:
+            devnull = os.open(os.devnull, os.O_RDONLY)
+            unused.add(devnull)
+        try:
+            for i, (stage, func, args) in enumerate(units):
+                r = pipes[i - 1][0] if i > 0 else first
+                w = pipes[i][1] if i < len(pipes) else None
+                if func is not None:
+                    self.processes.append(StageThread(func, args, r, w))
+                    unused.difference_update([r, w])
+                    continue
+                if background:
+                    if r is None:
+                        r = devnull
+                    pgroup = 0 if self.pgid is None else self.pgid
+                else:
+                    pgroup = None
+                process = self.kernel.launch(stage, r, w, pgroup)
+                self.processes.append(process)
+                if background and self.pgid is None:
+                    self.pgid = process.pid
+                for fd in (r, w):
+                    if fd is not None and fd != devnull:
+                        os.close(fd)
+                        unused.discard(fd)
+        except BaseException:
+            for fd in unused:
+                os.close(fd)
+            self.wait()
+            raise
+        if devnull is not None:
+            os.close(devnull)
+
+    def poll(self):
+        """Get the exit status, or ``None`` if any stage is running."""
+        statuses = [process.poll() for process in self.processes]
+        if None in statuses:
+            return None
+        return statuses[-1] if statuses else None
+
+    def wait(self):
+        """Wait for every stage to finish.
+
+        Returns the exit status of the last stage.
+        """
+        statuses = [process.wait() for process in self.processes]
+        return statuses[-1] if statuses else None
+
+    def run(self):
+        """Run every stage, and wait for them to finish.
+
+        Returns the exit status of the last stage.
+        """
+        self.start()
+        return self.wait()
+
+    def signal(self, signum):
+        """Send ``signum`` to the processes of a job in the background.
+
+        :param signum: the number of the signal
+        """
+        if self.pgid is None:
+            return
+        try:
+            os.killpg(self.pgid, signum)
+        except OSError as e:
+            if e.errno != errno.ESRCH:
+                raise
+
+
+def describe_status(status):
+    """Describe the state of a job with the exit status ``status`` as sh
+    does.
+
+    >>> [describe_status(status) for status in [None, 0, 2, -15]]
+    ['Running', 'Done', 'Exit 2', 'Terminated']
+    """
+    if status is None:
+        return "Running"
+    if status == 0:
+        return "Done"
+    if status < 0:
+        if -status == signal.SIGTERM:
+            return "Terminated"
+        return "Signal %d" % -status
+    return "Exit %d" % status
+
+
+class JobTable(object):
+    """The jobs running in the background, numbered from 1 in the order they
+    were started.
+
+    Jobs are reaped as soon as their processes exit, when the shell is sent
+    ``SIGCHLD``, rather than by polling. Finished jobs stay in the table
+    until they have been reported.
+    """
+    def __init__(self):
+        #: each job, by number
+        self.jobs = {}
+        self._handling = False
+
+    def _handle(self, signum, frame):
+        self.reap()
+
+    def add(self, job):
+        """Add a job which has been started in the background.
+
+        Returns the number of the job.
+
+        :param job: the :class:`Job`
+        """
+        if not self._handling:
+            try:
+                signal.signal(signal.SIGCHLD, self._handle)
+            except ValueError:  # only the main thread may handle signals
+                pass
+            else:
+                # let interrupted system calls carry on
+                signal.siginterrupt(signal.SIGCHLD, False)
+                self._handling = True
+        number = max(self.jobs) + 1 if self.jobs else 1
+        self.jobs[number] = job
+        # it may have exited before it could be reaped
+        job.poll()
+        return number
+
+    def get(self, spec=None):
+        """Get the number of a job and the job.
+
+        Raises :class:`KeyError` if there is no such job.
+
+        :param spec: (optional) the number of the job, which may start with
+                     ``%``. Defaults to the most recent job.
+        """
+        if spec is None:
+            if not self.jobs:
+                raise KeyError(spec)
+            number = max(self.jobs)
+        else:
+            try:
+                number = int(spec[1:] if spec.startswith("%") else spec)
+            except ValueError:
+                raise KeyError(spec)
+        return number, self.jobs[number]
+
+    def reap(self):
+        """Reap the processes of every job which have exited."""
+        for job in list(self.jobs.values()):
+            job.poll()
+
+    def remove(self, number):
+        """Remove a job from the table.
+
+        :param number: the number of the job
+        """
+        self.jobs.pop(number, None)
+
+    def notify(self):
+        """Get a notice of each job which has finished since the last call,
+        and remove the jobs from the table."""
+        notices = []
+        for number in sorted(self.jobs):
+            job = self.jobs[number]
+            status = job.poll()
+            if status is not None:
+                notices.append("[%d]  %-12s %s" % (
+                    number, describe_status(status), job.text))
+                self.remove(number)
+        return notices
+
+    def __iter__(self):
+        return ((number, self.jobs[number]) for number in sorted(self.jobs))
+
+    def __len__(self):
+        return len(self.jobs)
+
+
+#: the jobs of the shell
+job_table = JobTable()
@@ -1,7 +1,352 @@
+"""
+twosheds.kernel
+~~~~~~~~~~~~~~~
+
+This module implements the Kernel, which runs commands as new processes.
+
+Simple commands are run directly, without a shell. Anything which needs a
+shell, such as a pipeline, a redirection or a pattern, is handed to
+``/bin/sh``.
+"""
+import errno
+import os
+import re
+import signal
 import subprocess
 
+from .environment import environ
+from .token import DoubleQuote, Token
+
+# the characters which mean nothing to sh in a word
+SAFE_PATTERN = re.compile(r"[\w@%+,./:=-]+\Z")
+# the characters which sh still acts on between double quotes
+UNSAFE_QUOTED_PATTERN = re.compile(r'[$`\\"]')
+
+# the commands which sh runs itself, or which could change sh, and so mean
+# something different when run directly
+SH_ONLY = frozenset("""
+    . : [[ ]] { } ! alias bg break case cd command continue do done elif else
+    esac eval exec exit export fc fg fi for function getopts hash if in jobs
+    local newgrp pwd read readonly return select set shift then time times
+    trap type ulimit umask unalias unset until wait while
+""".split())
+
+
+def gen_words(sentence):
+    """Generate the words sh would make of each token in ``sentence``.
+
+    Raises :class:`ValueError` if any token could mean more to sh than the
+    word it spells, so that only sh could run the sentence.
+
+    :param sentence: the :class:`Sentence <twosheds.sentence.Sentence>`
+    """
+    for token in sentence.tokens:
+        if isinstance(token, DoubleQuote):
+            text = token.text
+            if UNSAFE_QUOTED_PATTERN.search(text):
+                raise ValueError(text)
+        elif isinstance(token, Token):
+            text = token.text
+            # sh is given escaped blanks, so they do not split words
+            if not SAFE_PATTERN.match(text.replace(" ", "_")):
+                raise ValueError(text)
+        elif isinstance(token, str) and SAFE_PATTERN.match(token):
+            text = token
+        else:
+            raise ValueError(token)
+        yield text
+
+
+def find_executable(command, path=None):
+    """Get the path of the executable file for ``command``, or ``None`` if
+    there is none.
+
+    :param command: the name or path of the command
+    :param path: (optional) a list of directories separated by
+                 :data:`os.pathsep`. Defaults to ``$PATH``.
+    """
+    if os.sep in command:
+        candidates = [command]
+    else:
+        if path is None:
+            path = os.environ.get("PATH", os.defpath)
+        candidates = [os.path.join(directory or ".", command)
+                      for directory in path.split(os.pathsep)]
+    for candidate in candidates:
+        if (os.access(candidate, os.X_OK) and
+                not os.path.isdir(candidate)):
+            return candidate
+    return None
+
+
+def default_sigpipe():
+    """Let a child die of ``SIGPIPE`` once its reader is gone, as it would
+    under sh, rather than inherit Python's ignoring it."""
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
+
+def exit_status(status):
+    """Convert a status from :func:`os.waitpid` into an exit status, which is
+    negative if the process was killed by a signal, as :mod:`subprocess`
+    reports it."""
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+class Process(object):
+    """A child process started with :func:`os.posix_spawn`, which can be
+    waited for like a :class:`subprocess.Popen`.
+
+    :param pid: the process ID
+    """
+    def __init__(self, pid):
+        self.pid = pid
+        #: the exit status, once the process has been reaped
+        self.returncode = None
+
+    def _reap(self, options):
+        try:
+            pid, status = os.waitpid(self.pid, options)
+        except OSError as e:
+            if e.errno != errno.ECHILD:
+                raise
+            return  # it has been reaped elsewhere in the meantime
+        if pid:
+            self.returncode = exit_status(status)
+
+    def poll(self):
+        """Get the exit status, or ``None`` if the process is running."""
+        if self.returncode is None:
+            self._reap(os.WNOHANG)
+        return self.returncode
+
+    def wait(self):
+        """Wait for the process to exit, and get the exit status."""
+        if self.returncode is None:
+            self._reap(0)
+        return self.returncode
+
+
+class CommandHash(object):
+    """A table of where commands were found on the search path, and how
+    many times each has been used, so that the search path need not be
+    searched each time a command is run.
+
+    The table is emptied whenever ``$PATH`` changes. Commands given by path,
+    or found in relative directories on the search path, are not
+    remembered.
+    """
+    def __init__(self):
+        #: the path of the executable for each command
+        self.paths = {}
+        #: the number of times each command has been looked up
+        self.hits = {}
+        self._search_path = None
+
+    def find(self, command):
+        """Get the path of the executable file for ``command``, or ``None``
+        if there is none.
+
+        :param command: the name or path of the command
+        """
+        if os.sep in command:
+            return find_executable(command)
+        search_path = environ.get("PATH", os.defpath)
+        if search_path != self._search_path:
+            self.clear()
+            self._search_path = search_path
+        try:
+            path = self.paths[command]
+        except KeyError:
+            path = find_executable(command, search_path)
+            if path is None or not os.path.isabs(path):
+                return path
+            self.paths[command] = path
+            self.hits[command] = 0
+        self.hits[command] += 1
+        return path
+
+    def forget(self, command):
+        """Forget where ``command`` was found.
+
+        :param command: the name of the command
+        """
+        self.paths.pop(command, None)
+        self.hits.pop(command, None)
+
+    def clear(self):
+        """Forget every command."""
+        self.paths.clear()
+        self.hits.clear()
+
+
+#: the table of commands shared by every :class:`Kernel`
+command_hash = CommandHash()
+
+#: the :class:`Launcher <twosheds.launcher.Launcher>` with which every
+#: :class:`Kernel` starts processes, if one is in use
+default_launcher = None
+
+
+def use_launcher(launcher):
+    """Start processes with ``launcher`` from now on, rather than forking the
+    shell.
+
+    :param launcher: the :class:`Launcher <twosheds.launcher.Launcher>`, or
+                     ``None`` to stop using one
+    """
+    global default_launcher
+    default_launcher = launcher
+
+
+#: the :class:`Coprocess <twosheds.coprocess.Coprocess>` with which every
+#: :class:`Kernel` runs commands which need sh, if one is in use
+default_coprocess = None
+
+
+def use_coprocess(coprocess):
+    """Run commands which need sh with ``coprocess`` from now on, rather
+    than starting a new sh for each.
+
+    :param coprocess: the :class:`Coprocess <twosheds.coprocess.Coprocess>`,
+                      or ``None`` to stop using one
+    """
+    global default_coprocess
+    default_coprocess = coprocess
+
 
 class Kernel(object):
+    """Runs commands.
+
+    :param hash: (optional) the :class:`CommandHash` with which to find
+                 commands. Defaults to :data:`command_hash`.
+    :param launcher: (optional) the :class:`Launcher
+                     <twosheds.launcher.Launcher>` with which to start
+                     processes. Defaults to :data:`default_launcher`.
+    :param coprocess: (optional) the :class:`Coprocess
+                      <twosheds.coprocess.Coprocess>` with which to run
+                      commands which need sh, when it is free. Defaults to
+                      :data:`default_coprocess`.
+    """
+    def __init__(self, hash=None, launcher=None, coprocess=None):
+        self.hash = command_hash if hash is None else hash
+        self.launcher = default_launcher if launcher is None else launcher
+        self.coprocess = (default_coprocess if coprocess is None else
+                          coprocess)
+
     def respond(self, text):
+        """Run ``text`` with sh.
+
+        Returns the exit status.
+
+        :param text: the command to run
+        """
+        if self.coprocess is not None:
+            status = self.coprocess.run(text)
+            if status is not None:
+                return status
+        if self.launcher is not None:
+            return self.start("/bin/sh", ["sh", "-c", text]).wait()
         process = subprocess.Popen(text, shell=True)
         process.communicate()
+        return process.returncode
+
+    def resolve(self, sentence):
+        """Get the path of the executable and the arguments to run
+        ``sentence`` with, or ``None`` if only sh can run it.
+
+        :param sentence: the :class:`Sentence <twosheds.sentence.Sentence>`
+        """
+        try:
+            argv = list(gen_words(sentence))
+        except ValueError:
+            return None
+        if not argv:
+            return None
+        command = argv[0]
+        if command in SH_ONLY or "=" in command:
+            return None
+        path = self.hash.find(command)
+        if path is None:  # let sh say so
+            return None
+        return path, argv
+
+    def start(self, path, argv, stdin=None, stdout=None, pgroup=None):
+        """Start the executable at ``path`` directly.
+
+        Returns the process, which can be polled and waited for like a
+        :class:`subprocess.Popen`.
+
+        :param path: the path of the executable
+        :param argv: the arguments, starting with the command
+        :param stdin: (optional) the file descriptor to read from
+        :param stdout: (optional) the file descriptor to write to
+        :param pgroup: (optional) the process group to put the process in,
+                       or 0 to put it in a new group of its own
+        """
+        if self.launcher is not None:
+            return self.launcher.start(path, argv, stdin, stdout, pgroup)
+        try:
+            posix_spawn = os.posix_spawn
+        except AttributeError:
+            def preexec():
+                default_sigpipe()
+                if pgroup is not None:
+                    os.setpgid(0, pgroup)
+            return subprocess.Popen(argv, executable=path, stdin=stdin,
+                                    stdout=stdout, close_fds=True,
+                                    preexec_fn=preexec)
+        actions = [(os.POSIX_SPAWN_DUP2, fd, target)
+                   for fd, target in [(stdin, 0), (stdout, 1)]
+                   if fd is not None]
+        options = {} if pgroup is None else {"setpgroup": pgroup}
+        return Process(posix_spawn(path, argv, os.environ,
+                                   file_actions=actions,
+                                   setsigdef=[signal.SIGPIPE], **options))
+
+    def spawn(self, path, argv):
+        """Run the executable at ``path`` directly.
+
+        Returns the exit status.
+
+        :param path: the path of the executable
+        :param argv: the arguments, starting with the command
+        """
+        return self.start(path, argv).wait()
+
+    def launch(self, sentence, stdin=None, stdout=None, pgroup=None):
+        """Start ``sentence``, without a shell if it does not need one.
+
+        Returns the process, as :meth:`start` does.
+
+        :param sentence: the :class:`Sentence <twosheds.sentence.Sentence>`
+        :param stdin: (optional) the file descriptor to read from
+        :param stdout: (optional) the file descriptor to write to
+        :param pgroup: (optional) the process group to put the process in,
+                       or 0 to put it in a new group of its own
+        """
+        resolved = self.resolve(sentence)
+        if resolved is not None:
+            path, argv = resolved
+            try:
+                return self.start(path, argv, stdin, stdout, pgroup)
+            except OSError:
+                # the executable may have moved since it was found
+                self.hash.forget(argv[0])
+        if (self.coprocess is not None and stdin is None and
+                stdout is None and pgroup is None):
+            command = self.coprocess.submit(str(sentence))
+            if command is not None:
+                return command
+        return self.start("/bin/sh", ["sh", "-c", str(sentence)], stdin,
+                          stdout, pgroup)
+
+    def execute(self, sentence):
+        """Run ``sentence``, without a shell if it does not need one.
+
+        Returns the exit status.
+
+        :param sentence: the :class:`Sentence <twosheds.sentence.Sentence>`
+        """
+        return self.launch(sentence).wait()
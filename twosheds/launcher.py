@@ -0,0 +1,445 @@
+"""
+twosheds.launcher
+~~~~~~~~~~~~~~~~~
+
+This module implements the launcher, a small process started alongside the
+shell which starts commands for it.
+
+Forking a process takes longer the more memory it has, so a shell embedded in
+a large Python program is slow to start commands itself. The launcher is a
+fresh interpreter, which only imports what it needs, and is sent the path,
+arguments, environment, working directory and file descriptors of each
+command over a Unix socket. It forks and reaps the commands, and reports
+their exit statuses back, so the time taken to start a command stays the
+same however large the shell grows.
+
+File descriptors are passed over the socket where Python can, and otherwise
+opened again by the launcher through ``/proc``.
+
+This module only uses the standard library, so that the launcher can run it
+without importing the rest of twosheds.
+"""
+import array
+import errno
+import fcntl
+import marshal
+import os
+import select
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+
+# how long to wait for the launcher to start, in seconds
+TIMEOUT = 10
+# how long to wait before looking again for the exit status of a command
+# which another thread may have been sent
+POLL_INTERVAL = 0.05
+HEADER = struct.Struct("!I")
+# True if file descriptors can be sent over a socket
+PASS_FDS = hasattr(socket, "CMSG_SPACE")
+# the signals which the launcher ignores or handles, and commands should not
+DEFAULT_SIGNALS = [signal.SIGINT, signal.SIGQUIT, signal.SIGTSTP,
+                   signal.SIGPIPE, signal.SIGCHLD]
+
+# the kinds of message sent back by the launcher
+STARTED, FAILED, EXITED = "started", "failed", "exited"
+
+
+def set_cloexec(fd):
+    """Have ``fd`` closed when a command is executed."""
+    flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+    fcntl.fcntl(fd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+
+
+def set_blocking(fd, blocking):
+    """Set whether reads from and writes to ``fd`` wait."""
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    if blocking:
+        flags &= ~os.O_NONBLOCK
+    else:
+        flags |= os.O_NONBLOCK
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags)
+
+
+def exit_status(status):
+    """Convert a status from :func:`os.waitpid` into an exit status, which is
+    negative if the process was killed by a signal."""
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+class Channel(object):
+    """Messages, and the file descriptors which go with them, sent over a
+    socket.
+
+    A message is anything :mod:`marshal` can write, sent after its length.
+
+    :param sock: the connected socket
+    """
+    def __init__(self, sock):
+        self.sock = sock
+        #: the file descriptors received, in order
+        self.fds = []
+        self._buffer = b""
+
+    def send(self, message, fds=()):
+        """Send ``message``, along with ``fds``.
+
+        :param message: the message
+        :param fds: (optional) the file descriptors to send
+        """
+        data = marshal.dumps(message)
+        data = HEADER.pack(len(data)) + data
+        if fds:
+            rights = array.array("i", fds)
+            sent = self.sock.sendmsg(
+                [data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, rights)])
+            data = data[sent:]
+        self.sock.sendall(data)
+
+    def _recv(self):
+        if not PASS_FDS:
+            return self.sock.recv(2 ** 16)
+        itemsize = array.array("i").itemsize
+        data, ancillary, _, _ = self.sock.recvmsg(
+            2 ** 16, socket.CMSG_SPACE(2 * itemsize))
+        for level, kind, rights in ancillary:
+            if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                fds = array.array("i")
+                fds.frombytes(rights[:len(rights) - len(rights) % itemsize])
+                self.fds.extend(fds)
+        return data
+
+    def receive(self, block=True):
+        """Get the next message.
+
+        Returns ``None`` if ``block`` is False and no whole message has been
+        received yet. Raises :class:`EOFError` once the other end has closed
+        the socket.
+
+        :param block: (optional) set False to return rather than wait for a
+                      message
+        """
+        while True:
+            if len(self._buffer) >= HEADER.size:
+                size = HEADER.unpack(self._buffer[:HEADER.size])[0]
+                end = HEADER.size + size
+                if len(self._buffer) >= end:
+                    message = marshal.loads(self._buffer[HEADER.size:end])
+                    self._buffer = self._buffer[end:]
+                    return message
+            if not block and not select.select([self.sock], [], [], 0)[0]:
+                return None
+            data = self._recv()
+            if not data:
+                raise EOFError
+            self._buffer += data
+
+
+class LaunchedProcess(object):
+    """A command started by a :class:`Launcher`, which can be waited for like
+    a :class:`subprocess.Popen`.
+
+    :param launcher: the :class:`Launcher`
+    :param pid: the process ID
+    """
+    def __init__(self, launcher, pid):
+        self.launcher = launcher
+        self.pid = pid
+        #: the exit status, once the command has exited
+        self.returncode = None
+
+    def poll(self):
+        """Get the exit status, or ``None`` if the command is running."""
+        if self.returncode is None:
+            self.returncode = self.launcher.poll(self.pid)
+        return self.returncode
+
+    def wait(self):
+        """Wait for the command to exit, and get the exit status."""
+        if self.returncode is None:
+            self.returncode = self.launcher.wait(self.pid)
+        return self.returncode
+
+
+class Launcher(object):
+    """Starts commands from a small process of its own, rather than forking
+    the shell.
+
+    The launcher sends the shell ``SIGCHLD`` whenever it reports that a
+    command has exited, so the shell is woken as it would be for a child of
+    its own. Commands which are not given file descriptors to read from or
+    write to share those the launcher was started with.
+
+    Raises :class:`OSError` if this Python can neither send file descriptors
+    over a socket nor open those of another process.
+    """
+    def __init__(self):
+        if not PASS_FDS and not os.path.isdir("/proc/self/fd"):
+            raise OSError(errno.ENOSYS,
+                          "cannot pass file descriptors to a launcher")
+        #: the exit status of each command which has exited, by process ID,
+        #: until the ID is used again
+        self.statuses = {}
+        self._lock = threading.Lock()
+        directory = tempfile.mkdtemp(prefix="twosheds-")
+        path = os.path.join(directory, "launcher")
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            server.bind(path)
+            server.listen(1)
+            script = os.path.splitext(os.path.abspath(__file__))[0] + ".py"
+            #: the launcher process
+            self.process = subprocess.Popen(
+                [sys.executable, "-S", script, path], close_fds=True)
+            server.settimeout(TIMEOUT)
+            sock = server.accept()[0]
+        finally:
+            server.close()
+            if os.path.exists(path):
+                os.remove(path)
+            os.rmdir(directory)
+        sock.setblocking(True)
+        set_cloexec(sock.fileno())
+        self.channel = Channel(sock)
+
+    def _take(self, message):
+        """Keep the exit status in ``message``, and get any other message."""
+        if message[0] != EXITED:
+            return message
+        self.statuses[message[1]] = message[2]
+        return None
+
+    def start(self, path, argv, stdin=None, stdout=None, pgroup=None):
+        """Start the executable at ``path`` in the current working directory
+        and environment.
+
+        Returns the :class:`LaunchedProcess`. Raises :class:`OSError` if it
+        could not be executed.
+
+        :param path: the path of the executable
+        :param argv: the arguments, starting with the command
+        :param stdin: (optional) the file descriptor to read from
+        :param stdout: (optional) the file descriptor to write to
+        :param pgroup: (optional) the process group to put the process in,
+                       or 0 to put it in a new group of its own
+        """
+        request = {"path": path, "argv": list(argv), "env": dict(os.environ),
+                   "cwd": os.getcwd(), "stdin": stdin, "stdout": stdout,
+                   "pgroup": pgroup, "pid": os.getpid()}
+        fds = []
+        if PASS_FDS:
+            fds = [fd for fd in (stdin, stdout) if fd is not None]
+        with self._lock:
+            try:
+                self.channel.send(request, fds)
+                reply = None
+                while reply is None:
+                    reply = self._take(self.channel.receive())
+            except (EOFError, socket.error):
+                raise OSError(errno.EPIPE, "the launcher has exited")
+            if reply[0] == FAILED:
+                raise OSError(reply[1], os.strerror(reply[1]))
+            # the status is kept, rather than taken by the first to poll, as
+            # a signal handler may poll in the middle of another poll
+            self.statuses.pop(reply[1], None)
+        return LaunchedProcess(self, reply[1])
+
+    def poll(self, pid):
+        """Get the exit status of the command ``pid``, or ``None`` if it is
+        running.
+
+        :param pid: the process ID
+        """
+        # this may be called by a signal handler while the lock is held
+        if self._lock.acquire(False):
+            try:
+                while True:
+                    message = self.channel.receive(block=False)
+                    if message is None:
+                        break
+                    self._take(message)
+            except EOFError:
+                pass
+            finally:
+                self._lock.release()
+        return self.statuses.get(pid)
+
+    def wait(self, pid):
+        """Wait for the command ``pid`` to exit, and get the exit status.
+
+        :param pid: the process ID
+        """
+        while True:
+            status = self.poll(pid)
+            if status is not None:
+                return status
+            if self.process.poll() is not None:
+                raise OSError(errno.ECHILD, "the launcher has exited")
+            # another thread may take the status first, so look again soon
+            try:
+                select.select([self.channel.sock], [], [], POLL_INTERVAL)
+            except (select.error, OSError) as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+
+    def close(self):
+        """Stop the launcher, leaving the commands it started running."""
+        self.channel.sock.close()
+        self.process.wait()
+
+
+def take_fd(channel, request, name, flags):
+    """Get the file descriptor ``name`` of ``request`` in the launcher, or
+    ``None`` if there is none."""
+    fd = request[name]
+    if fd is None:
+        return None
+    if PASS_FDS:
+        fd = channel.fds.pop(0)
+    else:
+        # opening a pipe by name would wait for its other end, which may
+        # already be closed
+        fd = os.open("/proc/%d/fd/%d" % (request["pid"], fd),
+                     flags | os.O_NONBLOCK)
+        set_blocking(fd, True)
+    set_cloexec(fd)
+    return fd
+
+
+def spawn(request, stdin, stdout):
+    """Fork and execute the command of ``request``.
+
+    Returns the process ID. Raises :class:`OSError` if the command could not
+    be executed.
+    """
+    pgroup = request["pgroup"]
+    r, w = os.pipe()
+    set_cloexec(w)
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(r)
+            for signum in DEFAULT_SIGNALS:
+                signal.signal(signum, signal.SIG_DFL)
+            if pgroup is not None:
+                os.setpgid(0, pgroup)
+            if stdin is not None:
+                os.dup2(stdin, 0)
+            if stdout is not None:
+                os.dup2(stdout, 1)
+            os.chdir(request["cwd"])
+            os.execve(request["path"], request["argv"], request["env"])
+        except OSError as e:
+            os.write(w, str(e.errno).encode())
+        finally:
+            os._exit(127)
+    os.close(w)
+    if pgroup is not None:
+        # as the child does, so that the next stage may join the group
+        try:
+            os.setpgid(pid, pgroup or pid)
+        except OSError:  # it has already executed the command
+            pass
+    try:
+        error = os.read(r, 64)
+    finally:
+        os.close(r)
+    if error:
+        os.waitpid(pid, 0)
+        number = int(error)
+        raise OSError(number, os.strerror(number))
+    return pid
+
+
+def handle(channel, request):
+    """Start the command of ``request``, and send back its process ID or why
+    it could not be started."""
+    fds = []
+    try:
+        stdin = take_fd(channel, request, "stdin", os.O_RDONLY)
+        fds.append(stdin)
+        stdout = take_fd(channel, request, "stdout", os.O_WRONLY)
+        fds.append(stdout)
+        pid = spawn(request, stdin, stdout)
+    except OSError as e:
+        channel.send((FAILED, e.errno or errno.EIO))
+    else:
+        channel.send((STARTED, pid))
+    finally:
+        for fd in fds:
+            if fd is not None:
+                os.close(fd)
+
+
+def reap(channel, parent):
+    """Send back the exit status of each command which has exited."""
+    reaped = False
+    while True:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except OSError as e:
+            if e.errno != errno.ECHILD:
+                raise
+            break
+        if not pid:
+            break
+        channel.send((EXITED, pid, exit_status(status)))
+        reaped = True
+    if reaped:
+        try:
+            os.kill(parent, signal.SIGCHLD)
+        except OSError:
+            pass
+
+
+def serve(path):
+    """Start commands for the shell listening at ``path`` until it closes
+    the connection.
+
+    :param path: the path of the Unix socket
+    """
+    # the terminal's signals are meant for the shell and its commands
+    for signum in (signal.SIGINT, signal.SIGQUIT, signal.SIGTSTP):
+        signal.signal(signum, signal.SIG_IGN)
+    parent = os.getppid()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    set_cloexec(sock.fileno())
+    channel = Channel(sock)
+    r, w = os.pipe()
+    for fd in (r, w):
+        set_cloexec(fd)
+        set_blocking(fd, False)
+    signal.set_wakeup_fd(w)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+    signal.siginterrupt(signal.SIGCHLD, False)
+    while True:
+        reap(channel, parent)
+        try:
+            readable = select.select([sock, r], [], [])[0]
+        except (select.error, OSError) as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            continue
+        if r in readable:
+            try:
+                while os.read(r, 4096):
+                    pass
+            except OSError as e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    raise
+        if sock in readable:
+            try:
+                handle(channel, channel.receive())
+            except (EOFError, socket.error):
+                break
+
+
+if __name__ == "__main__":
+    serve(sys.argv[1])
@@ -0,0 +1,471 @@
+"""
+twosheds.lexer
+~~~~~~~~~~~~~~
+
+This module implements the lexer, which breaks text into tokens.
+
+Rather than looking at one character at a time, the lexer scans the text with
+a single regular expression, so a whole run of ordinary characters, or a whole
+quotation, is taken in a single step.
+"""
+import itertools
+import re
+
+from .token import (DOUBLE_QUOTE, ESCAPE, HERE_DOCUMENT, LPAREN, RPAREN,
+                    WORD, DoubleQuote, HereDocument, LParen, RParen, Token,
+                    TokenStream, Word, unescape)
+
+# characters which end a word
+SEPARATORS = " \t\n|&;()"
+COMMENT = "#"
+NEWLINE = "\n"
+# the redirection which opens a here-document, and that which strips the
+# leading tabs of its lines
+HERE_OPERATOR = "<<"
+HERE_STRIP_OPERATOR = "<<-"
+
+TOKEN_PATTERN = re.compile(r"""
+    [\ \t]*  # blanks only separate tokens
+    (?:
+        (?P<word>  # ordinary or escaped characters, not starting a comment
+            (?:[^\\'"|&;()\ \t\n\#]|\\[^\n])(?:[^\\'"|&;()\ \t\n]|\\.)*
+        )
+        (?:  # which run into a quotation
+            '(?P<single>[^']*)'
+          | "(?P<double>[^"]*)"
+          | (?P<unclosed>['"\\])
+        )?
+      | (?P<continuation>\\\n)  # an escaped newline, which is dropped
+      | '(?P<bare_single>[^']*)'
+      | "(?P<bare_double>[^"]*)"
+      | (?P<operator>\|\|?|&&?|;;?|\n)
+      | (?P<lparen>\()
+      | (?P<rparen>\))
+      | (?P<comment>\#[^\n]*)
+      | (?P<bare_unclosed>['"\\])
+    )
+""", re.VERBOSE | re.DOTALL)
+
+# the rest of a word carried on from the last piece of text
+CONTINUED_WORD_PATTERN = re.compile(r"""(?:[^\\'"|&;()\ \t\n]|\\.)*""",
+                                    re.DOTALL)
+
+
+def note_here_document(documents, strip, text):
+    """Add the delimiter of the here-document opened by the word ``text``,
+    if it opens one, to ``documents``, along with whether the leading tabs of
+    its lines are stripped.
+
+    Returns whether the leading tabs are stripped if the delimiter is the
+    word after ``text``, and ``None`` otherwise.
+
+    >>> documents = []
+    >>> note_here_document(documents, None, "<<EOF")
+    >>> note_here_document(documents, None, "<<-")
+    True
+    >>> note_here_document(documents, True, "END")
+    >>> documents
+    [('EOF', False), ('END', True)]
+
+    :param documents: the delimiters of the here-documents opened so far
+    :param strip: what was returned for the word before ``text``
+    :param text: the text of the word
+    """
+    if strip is not None:
+        documents.append((text, strip))
+        return None
+    if not text.startswith(HERE_OPERATOR) or text.startswith("<<<"):
+        return None
+    strip = text.startswith(HERE_STRIP_OPERATOR)
+    delimiter = text[3:] if strip else text[2:]
+    if not delimiter:
+        return strip
+    documents.append((delimiter, strip))
+    return None
+
+
+def is_delimiter(line, document):
+    """Check whether ``line`` ends the here-document ``document``, given as
+    its delimiter and whether leading tabs are stripped."""
+    delimiter, strip = document
+    return (line.lstrip("\t") if strip else line) == delimiter
+
+
+def find_here_documents_end(text, pos, documents):
+    """Get the offset of the newline after the line which ends the last of
+    ``documents`` in ``text``, or of the end of ``text`` if it ends first.
+
+    :param text: the text
+    :param pos: the offset of the first line of the here-documents
+    :param documents: the delimiters of the here-documents, in order
+    """
+    documents = list(documents)
+    while True:
+        newline = text.find(NEWLINE, pos)
+        end = len(text) if newline < 0 else newline
+        if is_delimiter(text[pos:end], documents[0]):
+            documents.pop(0)
+            if not documents:
+                return end
+        if newline < 0:
+            return end
+        pos = newline + 1
+
+
+class Lexer(object):
+    """A lexer which can be fed text a piece at a time.
+
+    The state in which one piece of text leaves off, such as an open
+    quotation, an escape character awaiting the character it escapes, a
+    comment, or a word or operator which may go on, is kept so that the next
+    piece carries on from it. Each character is scanned just once, however
+    many pieces the text comes in.
+
+    The lines of a here-document, which follow the line that opens it, are
+    not broken into tokens, but kept as they are for sh, in a
+    :class:`HereDocument <twosheds.token.HereDocument>` which ends the
+    sentence.
+
+    >>> lexer = Lexer()
+    >>> [str(t) for t in lexer.feed("echo 'a")]
+    ['echo']
+    >>> lexer.complete
+    False
+    >>> [str(t) for t in lexer.feed("b' c")]
+    ['"ab"']
+    >>> [str(t) for t in lexer.close()]
+    ['c']
+    """
+    def __init__(self):
+        #: the characters of the token being read, as far as the end of the
+        #: piece which opened any quotation
+        self.pending = ""
+        #: the character which opened the current quotation, if any
+        self.quote = None
+        #: ``True`` if the next character is escaped
+        self.escape = False
+        #: an operator which may yet be doubled
+        self.operator = None
+        #: ``True`` if a comment has yet to end
+        self.comment = False
+        #: the delimiters of the here-documents opened on the current line,
+        #: or being read, and whether the leading tabs of their lines are
+        #: stripped
+        self.here_documents = []
+        # whether the tabs are stripped for a here-document whose delimiter
+        # is the next word
+        self._strip = None
+        # whether the lines of here-documents are being read, those read so
+        # far, and the start of the next
+        self._reading = False
+        self._lines = []
+        self._line = ""
+        # the offset to go on from once the here-documents have been read
+        self._resume = None
+        # the pieces of an open quotation after the first
+        self._quoted = []
+
+    @property
+    def complete(self):
+        """``True`` unless a quotation, an escape or a here-document is left
+        open."""
+        return self.quote is None and not self.escape and not self._reading
+
+    def feed(self, text):
+        """Generate the tokens completed by ``text``.
+
+        :param text: the text which follows that fed so far
+        """
+        if (self._reading or self.here_documents or self._strip is not None
+                or "<" in self.pending or "<" in text):
+            return self._feed_here_documents(text)
+        # nothing here can open a here-document
+        return self._lex(text, 0)
+
+    def _feed_here_documents(self, text):
+        """Generate the tokens completed by ``text``, which may open or hold
+        here-documents."""
+        pos = 0
+        while True:
+            if self._reading:
+                pos = self._read_here_documents(text, pos)
+                if pos < 0:
+                    return
+                yield self._here_document()
+            self._resume = None
+            for token in self._lex(text, pos):
+                if self._strip is not None or (
+                        isinstance(token, Token) and
+                        token.text.startswith(HERE_OPERATOR)):
+                    self._strip = note_here_document(
+                        self.here_documents, self._strip,
+                        getattr(token, "text", ""))
+                yield token
+            if self._resume is None:
+                return
+            pos = self._resume
+
+    def _read_here_documents(self, text, pos):
+        """Read the lines of the here-documents from ``text``, starting at
+        ``pos``.
+
+        Returns the offset of the newline after the line which ends the last
+        of them, or -1 if ``text`` ends first.
+        """
+        documents = self.here_documents
+        while True:
+            newline = text.find(NEWLINE, pos)
+            if newline < 0:
+                self._line += text[pos:]
+                return -1
+            line = self._line + text[pos:newline]
+            self._line = ""
+            self._lines.append(line)
+            if is_delimiter(line, documents[0]):
+                documents.pop(0)
+                if not documents:
+                    return newline
+            pos = newline + 1
+
+    def _here_document(self):
+        """Make the token of the lines read, from the newline before them."""
+        token = HereDocument(NEWLINE + NEWLINE.join(self._lines))
+        self._lines = []
+        self._reading = False
+        return token
+
+    def _lex(self, text, pos):
+        """Generate the tokens completed by ``text`` from ``pos``, stopping
+        at the end of a line which opens here-documents."""
+        end = len(text)
+        if self.comment:
+            pos = text.find("\n", pos)
+            if pos < 0:
+                return
+            self.comment = False
+        if self.operator is not None and pos < end:
+            operator, self.operator = self.operator, None
+            if text[pos] == operator:
+                operator += text[pos]
+                pos += 1
+            yield Word(operator)
+        if self.escape and pos < end:
+            if text[pos] != "\n":  # an escaped newline is dropped
+                self.pending += text[pos]
+            self.escape = False
+            pos += 1
+        if self.quote is not None:
+            close = text.find(self.quote, pos)
+            if close < 0:
+                self._quoted.append(text[pos:])
+                return
+            self._quoted.append(text[pos:close])
+            quoted = self.pending + "".join(self._quoted)
+            self.pending = ""
+            self._quoted = []
+            self.quote = None
+            pos = close + 1
+            if quoted:
+                yield DoubleQuote(quoted)
+        prefix, self.pending = self.pending, ""
+        if prefix:
+            # the rest of the word, which may hold a "#", since a word does
+            # not start a comment partway through, or an escaped newline
+            m = CONTINUED_WORD_PATTERN.match(text, pos)
+            prefix += unescape(m.group())
+            pos = m.end()
+            if pos == end:
+                self.pending = prefix
+                return
+            if text[pos] in SEPARATORS:
+                yield Word(prefix)
+                prefix = ""
+        for m in TOKEN_PATTERN.finditer(text, pos):
+            kind = m.lastgroup
+            if kind == "word":
+                word = m.group(kind)
+                if ESCAPE in word:
+                    word = unescape(word)
+                if m.end() == end:  # the word may go on in the next text
+                    self.pending = prefix + word
+                    return
+                yield Word(prefix + word if prefix else word)
+            elif kind == "operator":
+                operator = m.group(kind)
+                if operator == NEWLINE and self.here_documents:
+                    # the lines which follow are the here-documents
+                    self._reading = True
+                    self._resume = m.end()
+                    return
+                if m.end() == end and operator in "|&;":  # it may be doubled
+                    self.operator = operator
+                    return
+                yield Word(operator)
+            elif kind == "single" or kind == "double":
+                yield DoubleQuote(prefix + unescape(m.group("word")) +
+                                  m.group(kind))
+            elif kind == "bare_single" or kind == "bare_double":
+                quoted = prefix + m.group(kind)
+                if quoted:
+                    yield DoubleQuote(quoted)
+            elif kind == "lparen":
+                yield LParen()
+            elif kind == "rparen":
+                yield RParen()
+            elif kind == "continuation":
+                continue
+            elif kind == "comment":
+                if m.end() == end:  # it may go on in the next text
+                    self.comment = True
+                    return
+            else:  # an open quotation or escape
+                if kind == "unclosed":
+                    prefix += unescape(m.group("word"))
+                char = m.group(kind)
+                if char == ESCAPE:
+                    self.escape = True
+                    self.pending = prefix
+                else:
+                    self.quote = char
+                    self.pending = prefix + text[m.end():]
+                return
+            prefix = ""
+
+    def close(self):
+        """Generate the last token once all of the text has been fed.
+
+        Raises :class:`ValueError` if a quotation is not closed or the text
+        ends with an escape character.
+        """
+        if self._reading:
+            # the end of the text ends the here-documents, as it does for sh
+            if self._line:
+                self._lines.append(self._line)
+                self._line = ""
+            yield self._here_document()
+        self.here_documents = []
+        self._strip = None
+        if self.quote is not None:
+            raise ValueError("No closing quotation")
+        if self.escape:
+            raise ValueError("No escaped character")
+        if self.operator is not None:
+            yield Word(self.operator)
+            self.operator = None
+        if self.pending:
+            yield Word(self.pending)
+            self.pending = ""
+
+
+def gen_tokens(text):
+    """Generate the tokens in ``text``.
+
+    Words are separated by blanks and operators. A quoted string, together
+    with any characters right before it, makes a :class:`DoubleQuote
+    <twosheds.token.DoubleQuote>`. ``;;``, ``&&`` and ``||`` are single
+    operators, and a newline is an operator too, unless it is escaped, in
+    which case the line carries on and both are dropped. A ``#`` at the start
+    of a token starts a comment, which runs to the end of the line. The lines
+    of a here-document make a single :class:`HereDocument
+    <twosheds.token.HereDocument>`.
+
+    >>> [str(t) for t in gen_tokens("cd /; echo 'a b'")]
+    ['cd', '/', ';', 'echo', '"a b"']
+
+    Raises :class:`ValueError` once the tokens before it have been generated
+    if a quotation is not closed or the text ends with an escape character.
+
+    :param text: the text to break into tokens
+    """
+    lexer = Lexer()
+    return itertools.chain(lexer.feed(text), lexer.close())
+
+
+def gen_chunked_tokens(chunks):
+    """Generate the tokens of a text which comes a piece at a time.
+
+    The tokens of each piece are generated before the next piece is taken.
+
+    >>> [str(t) for t in gen_chunked_tokens(["echo 'a", " b'; l", "s"])]
+    ['echo', '"a b"', ';', 'ls']
+
+    Raises :class:`ValueError` once the tokens before it have been generated
+    if a quotation is not closed or the text ends with an escape character.
+
+    :param chunks: an iterable of the pieces of the text
+    """
+    lexer = Lexer()
+    for chunk in chunks:
+        for token in lexer.feed(chunk):
+            yield token
+    for token in lexer.close():
+        yield token
+
+
+def lex(text):
+    """Lex ``text`` into a :class:`TokenStream <twosheds.token.TokenStream>`.
+
+    The tokens are the same as those generated by :func:`gen_tokens`, but
+    they are kept as offsets into ``text``, and all of it is lexed before
+    anything is returned.
+
+    >>> [str(t) for t in lex("cd /; echo 'a b'")]
+    ['cd', '/', ';', 'echo', '"a b"']
+
+    Raises :class:`ValueError` if a quotation is not closed or the text ends
+    with an escape character.
+
+    :param text: the text to break into tokens
+    """
+    stream = TokenStream(text)
+    kinds = stream.kinds.append
+    starts = stream.starts.append
+    ends = stream.ends.append
+    quotes = stream.quotes
+    # only look for here-documents in text which may have them
+    here = HERE_OPERATOR in text
+    documents = []
+    strip = None
+    pos = 0
+    while True:
+        for m in TOKEN_PATTERN.finditer(text, pos):
+            kind = m.lastgroup
+            if kind == "word" or kind == "operator":
+                start, end = m.span(kind)
+                if documents and kind == "operator" and text[start] == NEWLINE:
+                    # the lines which follow are the here-documents
+                    pos = find_here_documents_end(text, end, documents)
+                    documents = []
+                    kinds(HERE_DOCUMENT)
+                    starts(start)
+                    ends(pos)
+                    break
+                kinds(WORD)
+            elif kind == "single" or kind == "double":
+                quotes[len(stream.kinds)] = m.start(kind) - 1
+                kinds(DOUBLE_QUOTE)
+                start, end = m.start("word"), m.end()
+            elif kind == "bare_single" or kind == "bare_double":
+                start, end = m.span(kind)
+                if start == end:  # nothing was quoted
+                    continue
+                quotes[len(stream.kinds)] = start - 1
+                kinds(DOUBLE_QUOTE)
+                start -= 1
+                end += 1
+            elif kind == "lparen" or kind == "rparen":
+                kinds(LPAREN if kind == "lparen" else RPAREN)
+                start, end = m.span(kind)
+            elif kind == "comment" or kind == "continuation":
+                continue
+            elif m.group(kind) == ESCAPE:
+                raise ValueError("No escaped character")
+            else:
+                raise ValueError("No closing quotation")
+            starts(start)
+            ends(end)
+            if here and kind != "lparen" and kind != "rparen":
+                strip = note_here_document(documents, strip,
+                                           stream.text(len(stream) - 1))
+        else:
+            return stream
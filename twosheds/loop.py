@@ -0,0 +1,356 @@
+"""
+twosheds.loop
+~~~~~~~~~~~~~
+
+This module implements the event loop, which lets the shell get on with other
+work, such as hooks and waiting for children, rather than blocking on each in
+turn.
+
+Coroutines are generators, run by the loop as :class:`Task` objects. A
+coroutine may yield:
+
+- ``None``, to let other work run before it carries on
+- a number of seconds to sleep for
+- anything with a ``poll`` method, such as a :class:`Job <twosheds.job.Job>`
+  or a process, to wait for it to finish. Its exit status is sent back.
+- another coroutine or a :class:`Task`, to wait for it. Its result is sent
+  back, or its exception raised.
+
+A coroutine returns a value by raising :class:`Return`.
+
+>>> def double(x):
+...     yield 0.01
+...     raise Return(2 * x)
+>>> EventLoop().run_until_complete(double(21))
+42
+"""
+import collections
+import errno
+import fcntl
+import heapq
+import itertools
+import os
+import select
+import signal
+import sys
+import time
+import traceback
+import types
+
+# how long to wait between polls for children when the loop cannot be woken
+# when one exits
+POLL_INTERVAL = 0.05
+
+
+# the end of a pipe which is written to whenever the shell is sent a signal
+_wakeup_fd = None
+
+
+def wakeup_fd():
+    """Get a file descriptor which becomes readable whenever a child exits,
+    which every loop shares, or ``False`` if there cannot be one."""
+    global _wakeup_fd
+    if _wakeup_fd is not None:
+        return _wakeup_fd
+    r, w = os.pipe()
+    for fd in (r, w):
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+    try:
+        signal.set_wakeup_fd(w)
+    except ValueError:  # only the main thread may handle signals
+        os.close(r)
+        os.close(w)
+        return False
+    if signal.getsignal(signal.SIGCHLD) == signal.SIG_DFL:
+        # the pipe is only written to for signals with a handler
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+    # let interrupted system calls carry on
+    signal.siginterrupt(signal.SIGCHLD, False)
+    _wakeup_fd = r
+    return r
+
+
+class Return(Exception):
+    """Raised by a coroutine to return ``value``."""
+    def __init__(self, value=None):
+        super(Return, self).__init__(value)
+        self.value = value
+
+
+def is_coroutine(obj):
+    """``True`` if ``obj`` is a coroutine."""
+    return isinstance(obj, types.GeneratorType)
+
+
+class Task(object):
+    """A coroutine run by an :class:`EventLoop`.
+
+    :param loop: the :class:`EventLoop`
+    :param coroutine: the coroutine
+    """
+    def __init__(self, loop, coroutine):
+        self.loop = loop
+        self.coroutine = coroutine
+        #: ``True`` once the coroutine has returned or raised
+        self.done = False
+        #: what the coroutine is waiting for
+        self.awaiting = None
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+        self._token = None
+        self.loop.call_soon(self._step)
+
+    def _resume(self, token, value=None, exc_info=None):
+        if token is self._token:
+            self._step(value, exc_info)
+
+    def _step(self, value=None, exc_info=None):
+        if self.done:
+            return
+        self.awaiting = None
+        self._token = None
+        try:
+            if exc_info is not None:
+                yielded = self.coroutine.throw(*exc_info)
+            else:
+                yielded = self.coroutine.send(value)
+        except StopIteration:
+            self._finish(None)
+        except Return as e:
+            self._finish(e.value)
+        except BaseException:
+            self._finish(None, sys.exc_info())
+        else:
+            self._token = token = object()
+            self.awaiting = self.loop._await(
+                yielded, lambda value=None, exc_info=None:
+                self._resume(token, value, exc_info))
+
+    def _finish(self, result, exc_info=None):
+        self.done = True
+        self._result = result
+        self._exc_info = exc_info
+        for callback in self._callbacks:
+            self.loop.call_soon(callback, self)
+        self._callbacks = []
+
+    def add_done_callback(self, callback):
+        """Call ``callback`` with the task once it is done.
+
+        :param callback: a function of one argument
+        """
+        if self.done:
+            self.loop.call_soon(callback, self)
+        else:
+            self._callbacks.append(callback)
+
+    def result(self):
+        """Get what the coroutine returned, or raise what it raised."""
+        if not self.done:
+            raise RuntimeError("the task is not done")
+        if self._exc_info is not None:
+            raise self._exc_info[1]
+        return self._result
+
+    def throw(self, exc_info):
+        """Raise an exception in the coroutine where it is waiting, and in
+        whatever it is waiting for.
+
+        :param exc_info: the exception, as :func:`sys.exc_info` gives it
+        """
+        if isinstance(self.awaiting, Task) and not self.awaiting.done:
+            self.awaiting.throw(exc_info)
+        else:
+            self._step(None, exc_info)
+
+
+class EventLoop(object):
+    """A loop which runs callbacks and coroutines as timers go off, files
+    become readable, and children exit.
+
+    When it can, the loop is woken by ``SIGCHLD`` to reap children rather
+    than polling for them.
+    """
+    def __init__(self):
+        self._ready = collections.deque()
+        self._timers = []
+        self._sequence = itertools.count()
+        self._readers = {}
+        self._waiting = []
+        self._wakeup = None
+        self._input_hook = None
+
+    def call_soon(self, callback, *args):
+        """Call ``callback`` with ``args`` on the next pass of the loop."""
+        self._ready.append((callback, args))
+
+    def call_later(self, delay, callback, *args):
+        """Call ``callback`` with ``args`` after ``delay`` seconds."""
+        heapq.heappush(self._timers, (time.time() + delay,
+                                      next(self._sequence), callback, args))
+
+    def add_reader(self, fd, callback, *args):
+        """Call ``callback`` with ``args`` whenever ``fd`` is readable."""
+        self._readers[fd] = (callback, args)
+
+    def remove_reader(self, fd):
+        """Stop watching ``fd``."""
+        self._readers.pop(fd, None)
+
+    def spawn(self, coroutine):
+        """Start running ``coroutine``, and get its :class:`Task`."""
+        return Task(self, coroutine)
+
+    def _await(self, yielded, resume):
+        """Call ``resume`` once what a coroutine yielded is done, and get
+        what the coroutine is waiting for."""
+        if yielded is None:
+            self.call_soon(resume)
+        elif (isinstance(yielded, (int, float)) and
+              not isinstance(yielded, bool)):
+            self.call_later(yielded, resume)
+        elif is_coroutine(yielded) or isinstance(yielded, Task):
+            if not isinstance(yielded, Task):
+                yielded = self.spawn(yielded)
+            yielded.add_done_callback(
+                lambda task: resume(task._result, task._exc_info))
+            return yielded
+        elif hasattr(yielded, "poll"):
+            self._watch_children()
+            self._waiting.append((yielded, resume))
+        else:
+            try:
+                raise TypeError("cannot wait for %r" % (yielded,))
+            except TypeError:
+                self.call_soon(resume, None, sys.exc_info())
+        return yielded
+
+    def _watch_children(self):
+        """Have the loop woken when a child exits."""
+        if self._wakeup is None:
+            self._wakeup = wakeup_fd()
+            if self._wakeup:
+                self.add_reader(self._wakeup, self._drain, self._wakeup)
+
+    def _drain(self, fd):
+        try:
+            while os.read(fd, 4096):
+                pass
+        except OSError as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+
+    def _pending(self):
+        return bool(self._ready or self._timers or self._waiting)
+
+    def run_once(self, timeout=None):
+        """Make one pass of the loop, waiting up to ``timeout`` seconds for
+        something to happen if nothing is ready.
+
+        :param timeout: (optional) the most seconds to wait. Defaults to
+                        waiting until something happens.
+        """
+        if self._waiting:
+            waiting, self._waiting = self._waiting, []
+            for waitable, resume in waiting:
+                status = waitable.poll()
+                if status is None:
+                    self._waiting.append((waitable, resume))
+                else:
+                    self._ready.append((resume, (status,)))
+        if self._ready:
+            timeout = 0
+        else:
+            if self._timers:
+                due = max(0, self._timers[0][0] - time.time())
+                timeout = due if timeout is None else min(timeout, due)
+            if self._waiting and not self._wakeup:
+                timeout = (POLL_INTERVAL if timeout is None else
+                           min(timeout, POLL_INTERVAL))
+        if self._readers:
+            if timeout is None and not self._pending():
+                return
+            try:
+                readable = select.select(list(self._readers), [], [],
+                                         timeout)[0]
+            except (select.error, OSError) as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+                readable = []
+            for fd in readable:
+                if fd in self._readers:
+                    callback, args = self._readers[fd]
+                    callback(*args)
+        elif timeout:
+            time.sleep(timeout)
+        now = time.time()
+        while self._timers and self._timers[0][0] <= now:
+            _, _, callback, args = heapq.heappop(self._timers)
+            self._ready.append((callback, args))
+        for _ in range(len(self._ready)):
+            if not self._ready:  # a nested pass got to them first
+                break
+            callback, args = self._ready.popleft()
+            callback(*args)
+
+    def run_until_complete(self, coroutine):
+        """Run the loop until ``coroutine`` is done, and get its result.
+
+        An interrupt is raised in the coroutine where it is waiting, so that
+        it may clean up, before it is raised here.
+
+        :param coroutine: the coroutine or :class:`Task`
+        """
+        task = coroutine if isinstance(coroutine, Task) else \
+            self.spawn(coroutine)
+        try:
+            while not task.done:
+                if not self._pending():
+                    raise RuntimeError("the task can never finish")
+                self.run_once()
+        except KeyboardInterrupt:
+            if task.done:
+                raise
+            exc_info = sys.exc_info()
+            task.throw(exc_info)
+            while not task.done and self._pending():
+                self.run_once()
+            if not task.done:
+                raise exc_info[1]
+        return task.result()
+
+    def _on_input_hook(self):
+        try:
+            if self._pending():
+                self.run_once(0)
+        except KeyboardInterrupt:
+            # it cannot be raised through readline, so have it sent again
+            os.kill(os.getpid(), signal.SIGINT)
+        except Exception:
+            traceback.print_exc()
+        return 0
+
+    def install_input_hook(self):
+        """Run the loop while :func:`raw_input` waits for the user to type a
+        line with readline.
+
+        Returns ``False`` if this Python cannot do so.
+        """
+        try:
+            import ctypes
+            hook = ctypes.c_void_p.in_dll(ctypes.pythonapi, "PyOS_InputHook")
+        except (ImportError, AttributeError, ValueError):
+            return False
+        self._input_hook = ctypes.CFUNCTYPE(ctypes.c_int)(self._on_input_hook)
+        hook.value = ctypes.cast(self._input_hook, ctypes.c_void_p).value
+        return True
+
+    def remove_input_hook(self):
+        """Stop running the loop while :func:`raw_input` waits."""
+        if self._input_hook is None:
+            return
+        import ctypes
+        ctypes.c_void_p.in_dll(ctypes.pythonapi, "PyOS_InputHook").value = None
+        self._input_hook = None
@@ -0,0 +1,246 @@
+"""
+twosheds.parallel
+~~~~~~~~~~~~~~~~~
+
+This module implements the ``parallel`` builtin, which runs a command once
+for each of a list of inputs, several at a time.
+"""
+import errno
+import os
+import select
+import sys
+
+from .coprocess import quote
+from .job import Job, split_pipeline
+from .kernel import SAFE_PATTERN
+from .lexer import lex
+from .sentence import Sentence
+from .token import Token, Word
+from .transform import Pipeline
+
+USAGE = "usage: parallel [-j jobs] [-k] command [args...] [::: inputs...]\n"
+PLACEHOLDER = "{}"
+INPUTS = ":::"
+# the exit status for as many failed commands or more
+MAX_FAILED = 101
+
+
+def cpu_count():
+    """Get the number of CPUs online."""
+    try:
+        return max(1, os.sysconf("SC_NPROCESSORS_ONLN"))
+    except (AttributeError, ValueError, OSError):
+        return 1
+
+
+def parse_args(args):
+    """Get the number of jobs, whether to keep the order of the inputs, the
+    arguments of the command and the inputs, or ``None`` for the inputs if
+    they are to be read from the standard input.
+
+    Raises :class:`ValueError` if the arguments are not understood.
+
+    >>> parse_args(["-j", "2", "-k", "gzip", ":::", "a", "b"])
+    (2, True, ['gzip'], ['a', 'b'])
+
+    :param args: the arguments of ``parallel``
+    """
+    args = list(args)
+    jobs = cpu_count()
+    keep_order = False
+    while args and args[0].startswith("-"):
+        option = args.pop(0)
+        if option == "-k":
+            keep_order = True
+        elif option == "-j" and args:
+            try:
+                jobs = int(args.pop(0))
+            except ValueError:
+                raise ValueError("-j: expected a number")
+            if jobs < 1:
+                raise ValueError("-j: expected a positive number")
+        elif option == "--":
+            break
+        else:
+            raise ValueError("%s: unknown option" % option)
+    inputs = None
+    if INPUTS in args:
+        split = args.index(INPUTS)
+        args, inputs = args[:split], args[split + 1:]
+    if not args:
+        raise ValueError("no command")
+    return jobs, keep_order, args, inputs
+
+
+def substitute(tokens, value):
+    """Put ``value`` in place of each ``{}`` in ``tokens``, or after them if
+    there is none.
+
+    The input is taken as it is. If sh could make more of it than its
+    characters, such as a variable or a pattern, each token it is put in is
+    quoted for sh.
+
+    >>> [str(t) for t in substitute([Word("echo"), Word("{}.txt")], "$x")]
+    ['echo', "'$x.txt'"]
+
+    :param tokens: the tokens of the command, already transformed
+    :param value: the input
+    """
+    safe = SAFE_PATTERN.match(value.replace(" ", "_")) is not None
+    if not any(PLACEHOLDER in str(token) for token in tokens):
+        return list(tokens) + [Word(value) if safe else quote(value)]
+    substituted = []
+    for token in tokens:
+        if isinstance(token, Token) and PLACEHOLDER in token.text:
+            text = token.text.replace(PLACEHOLDER, value)
+            token = type(token)(text) if safe else quote(text)
+        elif isinstance(token, str) and PLACEHOLDER in token:
+            token = token.replace(PLACEHOLDER, value)
+            if not safe:
+                token = quote(token)
+        substituted.append(token)
+    return substituted
+
+
+def read_inputs(stream):
+    """Generate each line of ``stream``, without its newline.
+
+    Each line is read as it is needed, rather than as much of the stream as
+    can be read at once, so that a pipe is not read ahead of the commands.
+    """
+    for line in iter(stream.readline, ""):
+        yield line[:-1] if line.endswith("\n") else line
+
+
+class Parallel(object):
+    """The ``parallel`` builtin::
+
+        parallel [-j JOBS] [-k] COMMAND [ARGS...] [::: INPUTS...]
+
+    Each input takes the place of ``{}`` in the command, or is added to its
+    end. Without ``:::``, each line of the standard input is an input, and
+    lines are only read as commands are ready to be started. The commands
+    read from ``/dev/null``, so that they do not take the inputs. The command
+    goes through the aliases and transforms of the shell once, as though it
+    had been typed, and may be a pipeline. The inputs are put into it
+    afterwards, as they are.
+
+    Up to ``JOBS`` commands are run at once, by default one for each CPU.
+    The output of each command is kept until the command finishes and then
+    written as a whole, in the order the commands finish or, with ``-k``,
+    in the order of the inputs. The exit status is the number of commands
+    which failed, up to 101.
+
+    :param cli: the :class:`CommandLineInterface
+                <twosheds.cli.CommandLineInterface>` of the shell, whose
+                aliases, transforms and builtins are looked up each time the
+                builtin is run, so that it sees any changes made to them
+    """
+    def __init__(self, cli):
+        self.cli = cli
+
+    def parse(self, args):
+        """Get the tokens of the command given by ``args``, with any alias
+        for it expanded.
+
+        The arguments have been transformed already, as those of any builtin
+        are, so only the tokens an alias expands to are transformed.
+
+        :param args: the arguments of the command
+        """
+        tokens = list(lex(" ".join(args)))
+        try:
+            expansion = self.cli.aliases.expansion(str(tokens[0]))
+        except (KeyError, IndexError):
+            return tokens
+        pipeline = Pipeline(self.cli.transforms)
+        return pipeline(Sentence(list(expansion))).tokens + tokens[1:]
+
+    def start(self, tokens, value, stdin):
+        """Start the command for the input ``value``.
+
+        Returns the :class:`Job <twosheds.job.Job>` and the file descriptor
+        its output can be read from.
+
+        :param tokens: the tokens of the command
+        :param value: the input
+        :param stdin: the file descriptor for the command to read from
+        """
+        sentence = Sentence(substitute(tokens, value))
+        job = Job(split_pipeline(sentence) or [sentence], self.cli.commands)
+        r, w = os.pipe()
+        try:
+            job.start(stdout=w, stdin=stdin)
+        except BaseException:
+            os.close(r)
+            raise
+        finally:
+            os.close(w)
+        return job, r
+
+    def __call__(self, *args):
+        try:
+            jobs, keep_order, command, inputs = parse_args(args)
+            tokens = self.parse(command)
+        except ValueError as e:
+            sys.stderr.write("parallel: %s\n" % e)
+            sys.stderr.write(USAGE)
+            return 255
+        if inputs is None:
+            inputs = read_inputs(sys.stdin)
+        inputs = iter(inputs)
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        # the index, job and output so far of each running command, by the
+        # file descriptor of its output
+        running = {}
+        finished = {}
+        next_index = 0
+        failed = 0
+        count = 0
+        try:
+            while True:
+                while len(running) < jobs:
+                    try:
+                        value = next(inputs)
+                    except StopIteration:
+                        break
+                    job, fd = self.start(tokens, value, devnull)
+                    running[fd] = (count, job, [])
+                    count += 1
+                if not running:
+                    break
+                try:
+                    readable = select.select(list(running), [], [])[0]
+                except (select.error, OSError) as e:
+                    if e.args[0] != errno.EINTR:
+                        raise
+                    continue
+                for fd in readable:
+                    data = os.read(fd, 2 ** 16)
+                    index, job, output = running[fd]
+                    if data:
+                        output.append(data)
+                        continue
+                    del running[fd]
+                    os.close(fd)
+                    if job.wait() != 0:
+                        failed += 1
+                    if not keep_order:
+                        self.write(output)
+                        continue
+                    finished[index] = output
+                    while next_index in finished:
+                        self.write(finished.pop(next_index))
+                        next_index += 1
+        finally:
+            for fd, (index, job, output) in running.items():
+                os.close(fd)
+                job.wait()
+            os.close(devnull)
+        return min(failed, MAX_FAILED)
+
+    def write(self, output):
+        """Write the output of a command to the standard output."""
+        stdout = sys.stdout
+        stdout.write("".join(output))
+        stdout.flush()
@@ -0,0 +1,87 @@
+"""
+twosheds.pool
+~~~~~~~~~~~~~
+
+This module implements a pool of threads for work which might block, so that
+the user is not kept waiting on it.
+"""
+import Queue
+import threading
+
+
+class Task(object):
+    """A call which is run by a :class:`Pool`.
+
+    :param func: the function to call
+    :param args: the arguments to call it with
+    """
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+        self.result = None
+        self.exception = None
+        self._done = threading.Event()
+
+    def run(self):
+        try:
+            self.result = self.func(*self.args)
+        except Exception as e:
+            self.exception = e
+        finally:
+            self._done.set()
+
+    def done(self):
+        """Check if the call has returned."""
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Wait for the call to return.
+
+        Returns ``True`` if it returned before ``timeout`` seconds passed.
+
+        :param timeout: (optional) the number of seconds to wait for. Defaults
+                        to waiting for as long as it takes.
+        """
+        return self._done.wait(timeout)
+
+    def get(self):
+        """Get the result of the call, raising what it raised if anything."""
+        if self.exception is not None:
+            raise self.exception
+        return self.result
+
+
+class Pool(object):
+    """A fixed number of daemon threads which run tasks in turn.
+
+    Threads are only started once there is work for them to do, and do not
+    keep the interpreter alive.
+
+    :param size: (optional) the number of threads. Defaults to 8.
+    """
+    def __init__(self, size=8):
+        self.size = size
+        self._tasks = Queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def _work(self):
+        while True:
+            self._tasks.get().run()
+
+    def submit(self, func, *args):
+        """Schedule ``func(*args)`` to be called.
+
+        Returns the :class:`Task` for the call.
+
+        :param func: the function to call
+        """
+        task = Task(func, args)
+        self._tasks.put(task)
+        with self._lock:
+            if len(self._workers) < self.size:
+                worker = threading.Thread(target=self._work)
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+        return task
@@ -5,13 +5,18 @@ twosheds.program
 
 This module implements the Program object which represents Bash programs.
 """
+from .alias import as_aliases
+from .job import Job, job_table, split_pipeline
 from .kernel import Kernel
+from .lexer import gen_tokens
 from .sentence import Sentence
-from .transform import transform
-import token
+from .token import Word
+from .transform import Pipeline
 
-
-QUOTES = ("'", '"')
+BACKGROUND = "&"
+NEWLINE = "\n"
+# the operators after which a sentence goes on to the next line
+CONTINUATIONS = frozenset(["|", "&&", "||"])
 
 
 class Program(object):
@@ -25,16 +30,11 @@ class Program(object):
     """
     def __init__(self, text, transforms=None, echo=False):
         self.text = text
-
-        # Token recognition variables
-        self.blanks = {' ', '\t'}
-        self.escape_chars = {'\\'}
-        self.metacharacters = {"|", "&", ";", "(", ")"} | self.blanks
-        self.whitespace = self.blanks | {'\r', '\n'}
-
         self.transforms = transforms or []
 
         self.echo = echo
+        # the aliases last expanded, and their wrapper
+        self._aliases = None
 
     def gen_tokens(self):
         """
@@ -47,90 +47,112 @@ class Program(object):
         >>> list(Program("'cd /; pwd'").gen_tokens())
         ['cd /; pwd']
         """
-        current_token = []
-        escape = False
-        quote = None
-        skip = 0
-        for char, peek in zip(self.text, self.text[1:] + " "):
-            if skip > 0:
-                skip -= 1
-                continue
-            if quote is None:
-                if escape:
-                    current_token.append(char)
-                    escape = False
-                elif char in self.escape_chars:
-                    escape = True
-                elif char in QUOTES:
-                    quote = char
-                elif char in self.metacharacters:
-                    if current_token:
-                        yield token.Word(''.join(current_token))
-                    current_token = []
-                    if char == "(":
-                        yield token.LParen()
-                    elif char == ")":
-                        yield token.RParen()
-                    elif char in "|&;":
-                        if peek == char:
-                            yield token.Word(char + peek)
-                            skip += 1
-                        else:
-                            yield token.Word(char)
-                else:
-                    current_token.append(char)
-            elif char == quote:
-                if current_token:
-                    yield token.DoubleQuote(''.join(current_token))
-                current_token = []
-                quote = None
-            else:
-                current_token.append(char)
-        if quote is not None:
-            raise ValueError("No closing quotation")
-        if escape:
-            raise ValueError("No escaped character")
-        if current_token:
-            yield token.Word(''.join(current_token))
+        return gen_tokens(self.text)
 
     def _gen_sentences(self, tokens):
         sentence = []
         for token in tokens:  # noqa
-            if str(token) == ";":
+            text = str(token)
+            if text == NEWLINE and sentence and \
+                    str(sentence[-1]) in CONTINUATIONS:
+                # a pipeline or list goes on past the end of the line
+                continue
+            if text == ";" or text == NEWLINE:
+                yield sentence
+                sentence = []
+            elif (text == BACKGROUND and
+                  not (sentence and str(sentence[-1]).endswith(("<", ">")))):
+                # a sentence run in the background keeps its "&"
+                sentence.append(token)
                 yield sentence
                 sentence = []
             else:
                 sentence.append(token)
         yield sentence
 
-    def gen_sentences(self, tokens, aliases=None):
-        """
-        Generate a sequence of sentences from stream of tokens.
+    def expand_aliases(self, tokens, aliases=None):
+        """Generate the tokens of each sentence in a stream of tokens, with
+        any alias for its command expanded.
+
+        :param tokens: the tokens of the program
+        :param aliases: (optional) an :class:`Aliases
+                        <twosheds.alias.Aliases>` or dictionary of aliases
         """
-        if aliases is None:
-            aliases = {}
+        if self._aliases is None or self._aliases[0] is not aliases:
+            self._aliases = (aliases, as_aliases(aliases))
+        expansion = self._aliases[1].expansion
         for sentence in self._gen_sentences(tokens):
             try:
-                alias = aliases[str(sentence[0])]
+                sentence[0:1] = expansion(str(sentence[0]))
             except KeyError:
                 # do nothing if no alias is found
                 pass
             except IndexError:
                 pass
-            else:
-                sentence[0:1] = list(Program(alias).gen_tokens())
-            yield transform(Sentence(sentence), self.transforms)
+            yield sentence
+
+    def gen_sentences(self, tokens, aliases=None):
+        """
+        Generate a sequence of sentences from stream of tokens.
+        """
+        pipeline = Pipeline(self.transforms)
+        for sentence in self.expand_aliases(tokens, aliases):
+            yield pipeline(Sentence(sentence))
+
+    def job(self, sentence, environ=None):
+        """Get a :class:`Job <twosheds.job.Job>` to run ``sentence`` in the
+        foreground, or ``None`` if :meth:`interpret` must run it in place,
+        as it does an empty sentence, a builtin or a job in the background.
+
+        :param sentence: the :class:`Sentence <twosheds.sentence.Sentence>`
+        :param environ: (optional) dictionary of builtins
+        """
+        if environ is None:
+            environ = {}
+        tokens = sentence.tokens
+        if not tokens or (isinstance(tokens[-1], Word) and
+                          tokens[-1].text == BACKGROUND):
+            return None
+        stages = split_pipeline(sentence)
+        if stages is not None and len(stages) > 1:
+            return Job(stages, environ)
+        if sentence.command in environ:
+            return None
+        return Job([sentence])
 
     def interpret(self, sentence, environ=None):
         if environ is None:
             environ = {}
+        tokens = sentence.tokens
+        if (tokens and isinstance(tokens[-1], Word) and
+                tokens[-1].text == BACKGROUND):
+            return self.background(Sentence(tokens[:-1]), environ)
+        stages = split_pipeline(sentence)
+        if stages is not None and len(stages) > 1:
+            return Job(stages, environ).run()
         try:
             return environ[sentence.command](*sentence.args)
         except KeyError:
-            return Kernel().respond(str(sentence))
+            return Kernel().execute(sentence)
         except IndexError:
             return None
 
+    def background(self, sentence, environ=None):
+        """Start ``sentence`` in the background, and add it to the table of
+        jobs.
+
+        :param sentence: the :class:`Sentence <twosheds.sentence.Sentence>`,
+                         without its ``&``
+        :param environ: (optional) dictionary of builtins
+        """
+        if not sentence.tokens:
+            return None
+        job = Job(split_pipeline(sentence) or [sentence], environ)
+        job.start(background=True)
+        number = job_table.add(job)
+        print("[%d] %s" % (number, job.pgid or ""))
+        return 0
+
     def run(self, aliases=None, environ=None):
         tokens = self.gen_tokens()
         for sentence in self.gen_sentences(tokens, aliases):
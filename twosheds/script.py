@@ -0,0 +1,104 @@
+"""
+twosheds.script
+~~~~~~~~~~~~~~~
+
+This module implements running twosheds from the command line, either
+interactively or on a script or a command given as an argument::
+
+    $ twosheds -c 'echo hello'
+    $ twosheds script.sh
+
+Scripts and commands are run without setting up readline, history or
+completion, which are only imported for an interactive shell.
+"""
+import mmap
+import os
+import sys
+
+from .cli import CommandLineInterface
+
+USAGE = "usage: twosheds [-c command | script | -]\n"
+# the size of the pieces a script is read in
+CHUNK_SIZE = 2 ** 16
+# the size from which a script is mapped into memory rather than read
+MMAP_THRESHOLD = 2 ** 24
+
+
+def read_chunks(fd, size=CHUNK_SIZE):
+    """Generate the text of the file open at ``fd`` a piece at a time.
+
+    A large regular file is mapped into memory rather than read. Otherwise,
+    each piece is as much as can be read at once, so that text from a pipe
+    is taken as soon as it comes.
+
+    :param fd: the file descriptor
+    :param size: (optional) the most characters in a piece
+    """
+    if os.fstat(fd).st_size >= MMAP_THRESHOLD:
+        m = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        try:
+            for start in range(0, len(m), size):
+                yield m[start:start + size]
+        finally:
+            m.close()
+        return
+    while True:
+        chunk = os.read(fd, size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def exit_code(status):
+    """Convert the exit status of a sentence into one for the shell to exit
+    with, which is 128 plus the signal for a process killed by one.
+
+    :param status: the exit status
+    """
+    return 128 - status if status < 0 else status
+
+
+def main(argv=None):
+    """Run twosheds with the arguments ``argv``.
+
+    With no arguments, interact with the user. With ``-c`` and a command, run
+    the command. With the path of a script, or ``-`` for the standard input,
+    run the script. Any further arguments are not understood, and are a usage
+    error.
+
+    Returns the exit status.
+
+    :param argv: (optional) the arguments. Defaults to those of the process.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    if not argv:
+        from .shell import Shell
+        Shell({}).serve_forever()
+        return 0
+    if argv[0] == "-c":
+        if len(argv) < 2:
+            sys.stderr.write("twosheds: -c: option requires an argument\n")
+            sys.stderr.write(USAGE)
+            return 2
+        extra = argv[2:]
+    else:
+        extra = argv[1:]
+    if extra:
+        sys.stderr.write("twosheds: %s: unexpected argument\n" % extra[0])
+        sys.stderr.write(USAGE)
+        return 2
+    cli = CommandLineInterface({}, None)
+    if argv[0] == "-c":
+        return exit_code(cli.run([argv[1]]))
+    if argv[0] == "-":
+        return exit_code(cli.run(read_chunks(sys.stdin.fileno())))
+    try:
+        fd = os.open(argv[0], os.O_RDONLY)
+    except OSError as e:
+        sys.stderr.write("twosheds: %s: %s\n" % (argv[0], e.strerror))
+        return 127
+    try:
+        return exit_code(cli.run(read_chunks(fd)))
+    finally:
+        os.close(fd)
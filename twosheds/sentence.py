@@ -1,19 +1,38 @@
+class Sentence(object):
+    """A command and its arguments.
 
+    The strings of the command and its arguments are only built when they are
+    first needed, and are kept until :attr:`tokens` is replaced.
+    """
+    __slots__ = ("_tokens", "_args", "_text")
 
-class Sentence(object):
     def __init__(self, tokens):
         self.tokens = tokens
 
+    @property
+    def tokens(self):
+        return self._tokens
+
+    @tokens.setter
+    def tokens(self, tokens):
+        self._tokens = tokens
+        self._args = None
+        self._text = None
+
     @property
     def command(self):
         return str(self.tokens[0])
 
     @property
     def args(self):
-        return [str(t) for t in self.tokens[1:]]
+        if self._args is None:
+            self._args = [str(t) for t in self.tokens[1:]]
+        return self._args
 
     def __str__(self):
-        return " ".join(str(token) for token in self.tokens)
+        if self._text is None:
+            self._text = " ".join(str(token) for token in self.tokens)
+        return self._text
 
     def __repr__(self):
         return "Sentence(%s)" % self.tokens
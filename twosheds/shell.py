@@ -9,18 +9,27 @@ from __future__ import absolute_import
 
 import atexit
 import os
-try:
-    import readline
-except ImportError:
-    import pyreadline as readline
 
 from .cli import CommandLineInterface
-from .completer import make_completer
+from .frecency import FrecencyIndex
+from .job import Stage
+from .kernel import use_coprocess, use_launcher
+from .loop import is_coroutine
 from .terminal import Terminal
 
 DEFAULT_HISTFILE = os.path.expanduser("~/.console-history")
 
 
+def import_readline():
+    """Import readline, which is only needed once the shell interacts with
+    a user."""
+    try:
+        import readline
+    except ImportError:
+        import pyreadline as readline
+    return readline
+
+
 class Shell(CommandLineInterface):
     """
     A facade encapsulating the high-level logic of a command language
@@ -41,6 +50,18 @@ class Shell(CommandLineInterface):
                        end of other completed words, to speed typing and
                        provide a visual indicator of successful completion.
     :param exclude: list of regexes to be ignored by completion.
+    :param fuzzy: set True to complete words which no filename or command
+                  starts with to those which contain its characters in order.
+    :param frecencyfile: the location of a file in which to remember how
+                         frequently and recently each path and command is
+                         used, so that completion can rank them. if unset,
+                         completions are not ranked.
+    :param launcher: set True to start commands from a small process of
+                     their own, rather than by forking the shell, so that
+                     starting one stays quick however much memory the
+                     program embedding the shell takes.
+    :param coprocess: set True to run the commands which need sh in one
+                      long-lived sh, rather than starting a new sh for each.
 
     Usage::
 
@@ -56,20 +77,38 @@ class Shell(CommandLineInterface):
                  histfile=None,
                  use_suffix=True,
                  exclude=None,
+                 fuzzy=False,
+                 frecencyfile=None,
+                 launcher=False,
+                 coprocess=False,
                  ):
         super(Shell, self).__init__(aliases, Terminal(environ))
-        self.completer = make_completer(
-            transforms=self.transforms,
-            use_suffix=use_suffix,
-            exclude=exclude
-        )
         self.echo = echo
         self.histfile = histfile or DEFAULT_HISTFILE
         self._before_interaction_funcs = []
         self._after_interaction_funcs = []
+        self.frecency = None
+        if frecencyfile is not None:
+            self.frecency = FrecencyIndex(frecencyfile)
+            self.after_interaction(self._learn)
+        if launcher:
+            from .launcher import Launcher
+            use_launcher(Launcher())
+        if coprocess:
+            from .coprocess import Coprocess
+            use_coprocess(Coprocess())
+        # imported here, so that running a script does not import it
+        from .completer import make_completer
+        self.completer = make_completer(
+            transforms=self.transforms,
+            use_suffix=use_suffix,
+            exclude=exclude,
+            fuzzy=fuzzy,
+            frecency=self.frecency,
+        )
 
     def _save_history(self):
-        readline.write_history_file(self.histfile)
+        import_readline().write_history_file(self.histfile)
 
     def serve_forever(self, banner=None):
         """Interact with the user.
@@ -77,6 +116,7 @@ class Shell(CommandLineInterface):
         :param banner: (optional) the banner to print before the first
                        interaction. Defaults to ``None``.
         """
+        readline = import_readline()
         if hasattr(readline, "read_history_file"):
             try:
                 readline.read_history_file(self.histfile)
@@ -85,19 +125,53 @@ class Shell(CommandLineInterface):
             atexit.register(self._save_history)
         super(Shell, self).serve_forever(banner)
 
-    def interact(self):
+    def interact_async(self):
         for f in self._before_interaction_funcs:
-            f()
-        super(Shell, self).interact()
+            result = f()
+            if is_coroutine(result):
+                yield result
+        yield super(Shell, self).interact_async()
         for f in self._after_interaction_funcs:
-            f()
-
-    def add_command(self, command, func):
+            result = f()
+            if is_coroutine(result):
+                yield result
+
+    def _learn(self):
+        """Record the commands and paths used in the last interaction."""
+        for cwd, sentence in self.sentences:
+            # the words as they were meant, rather than escaped or quoted
+            words = [getattr(token, "text", token)
+                     for token in sentence.tokens]
+            words = [word for word in words if isinstance(word, str)]
+            if not words:
+                continue
+            command = words[0]
+            if os.sep in command:
+                command = os.path.join(cwd, command)
+            self.frecency.add(os.path.normpath(command))
+            for arg in words[1:]:
+                path = os.path.normpath(os.path.join(cwd, arg))
+                if os.path.exists(path):
+                    self.frecency.add(path)
+        self.frecency.save()
+
+    def add_command(self, command, func, stream=False):
+        if stream:
+            func = Stage(func)
         self.commands[command] = func
 
-    def command(self, command):
+    def command(self, command, stream=False):
+        """Register a builtin.
+
+        :param command: the name of the command
+        :param stream: (optional) set True if the builtin streams records:
+            it is called with an iterator of the records of the previous
+            stage of a pipeline, followed by its arguments, and returns an
+            iterable of records for the next. See :class:`Stage
+            <twosheds.job.Stage>`.
+        """
         def decoractor(f):
-            self.add_command(command, f)
+            self.add_command(command, f, stream)
             return f
         return decoractor
 
@@ -106,7 +180,8 @@ class Shell(CommandLineInterface):
 
         :param f:
             The function to run after each interaction. This function must not
-            take any parameters.
+            take any parameters. It may be a coroutine, which is run on
+            :attr:`loop`.
 
         """
         self._before_interaction_funcs.append(f)
@@ -117,7 +192,8 @@ class Shell(CommandLineInterface):
 
         :param f:
             The function to run after each interaction. This function must not
-            take any parameters.
+            take any parameters. It may be a coroutine, which is run on
+            :attr:`loop`.
 
         """
         self._after_interaction_funcs.append(f)
@@ -130,5 +206,9 @@ class Shell(CommandLineInterface):
             A generator which, when invoked with a string representing the word
             the user is trying to complete, should generate strings that the
             user might find relevant.
+
+        Generators are run in their own threads, at the same time as each
+        other. If one takes longer than ``completer.extension_budget``
+        seconds, its matches are left out of that completion.
         """
         self.completer.extensions.append(g)
@@ -1,15 +1,77 @@
+"""
+twosheds.token
+~~~~~~~~~~~~~~
+
+This module implements tokens, and a compact stream of the tokens lexed from
+a text which refers back to the text rather than copying it.
+"""
+import array
+import re
+
+ESCAPE = "\\"
+ESCAPED_PATTERN = re.compile(r"\\(.)", re.DOTALL)
+
+
+def _unescape_char(m):
+    char = m.group(1)
+    # an escaped newline continues the line, and is dropped altogether
+    return "" if char == "\n" else char
+
+
+def unescape(text):
+    r"""Remove the escape characters from ``text``.
+
+    >>> print(unescape(r"a\ b\\c"))
+    a b\c
+    >>> print(unescape("a\\\nb"))
+    ab
+    """
+    if ESCAPE not in text:
+        return text
+    return ESCAPED_PATTERN.sub(_unescape_char, text)
+
 
 class LParen(object):
-    pass
+    __slots__ = ()
 
 
 class RParen(object):
-    pass
+    __slots__ = ()
 
 
 class Token(object):
+    __slots__ = ("_text", "_stream", "_index")
+
     def __init__(self, text):
-        self.text = text
+        self._text = text
+        self._stream = None
+        self._index = None
+
+    @classmethod
+    def view(cls, stream, index):
+        """Make a token whose text is only taken from ``stream`` when it is
+        first needed.
+
+        :param stream: the :class:`TokenStream` the token is in
+        :param index: the position of the token in the stream
+        """
+        token = cls.__new__(cls)
+        token._text = None
+        token._stream = stream
+        token._index = index
+        return token
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = self._stream.text(self._index)
+            self._stream = None
+        return self._text
+
+    @text.setter
+    def text(self, text):
+        self._text = text
+        self._stream = None
 
     def startswith(self, x):
         return self.text.startswith(x)
@@ -28,9 +90,108 @@ class Token(object):
 
 
 class Word(Token):
-    pass
+    __slots__ = ()
 
 
 class DoubleQuote(Token):
+    __slots__ = ()
+
     def __str__(self):
         return '"%s"' % self.text
+
+
+class HereDocument(Token):
+    """The lines of the here-documents of a sentence, from the newline
+    before them to the end of the last delimiter, which are passed to sh as
+    they were written."""
+    __slots__ = ()
+
+    def __str__(self):
+        return self.text
+
+
+# the codes for each kind of token in a stream
+WORD, DOUBLE_QUOTE, LPAREN, RPAREN, HERE_DOCUMENT = range(5)
+
+
+class TokenStream(object):
+    """The tokens lexed from a text, kept as arrays of offsets into it.
+
+    Each token takes a byte for its kind and two offsets for where it starts
+    and ends in the source, and a quotation also the offset of its opening
+    quote. Tokens are only made when the stream is indexed or iterated over,
+    and their text is only taken from the source when it is needed.
+
+    >>> stream = TokenStream("echo 'a b'")
+    >>> stream.append(WORD, 0, 4)
+    >>> stream.append(DOUBLE_QUOTE, 5, 10, 5)
+    >>> list(stream)
+    [echo, "a b"]
+
+    :param source: the text the tokens were lexed from
+    """
+    __slots__ = ("source", "kinds", "starts", "ends", "quotes")
+
+    def __init__(self, source):
+        self.source = source
+        offset = "i" if len(source) < 2 ** 31 else "l"
+        self.kinds = array.array("b")
+        self.starts = array.array(offset)
+        self.ends = array.array(offset)
+        #: the offsets of the opening quotes of quotations, by index
+        self.quotes = {}
+
+    def append(self, kind, start, end, quote=None):
+        """Add a token to the end of the stream.
+
+        :param kind: the code for the kind of the token
+        :param start: the offset of the start of the token in the source
+        :param end: the offset of the end of the token in the source
+        :param quote: (optional) the offset of the opening quote of a
+                      quotation
+        """
+        if quote is not None:
+            self.quotes[len(self.kinds)] = quote
+        self.kinds.append(kind)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def text(self, index):
+        """Get the text of the token at ``index``.
+
+        :param index: the position of the token in the stream
+        """
+        source = self.source
+        start, end = self.starts[index], self.ends[index]
+        if self.kinds[index] == HERE_DOCUMENT:
+            return source[start:end]
+        quote = self.quotes.get(index)
+        if quote is None:
+            text = source[start:end]
+            return unescape(text) if ESCAPE in text else text
+        return unescape(source[start:quote]) + source[quote + 1:end - 1]
+
+    def __getitem__(self, index):
+        kind = self.kinds[index]
+        if kind == WORD:
+            return Word.view(self, index)
+        if kind == DOUBLE_QUOTE:
+            return DoubleQuote.view(self, index)
+        if kind == HERE_DOCUMENT:
+            return HereDocument.view(self, index)
+        return LParen() if kind == LPAREN else RParen()
+
+    def __iter__(self):
+        word, quotation = Word.view, DoubleQuote.view
+        for index, kind in enumerate(self.kinds):
+            if kind == WORD:
+                yield word(self, index)
+            elif kind == DOUBLE_QUOTE:
+                yield quotation(self, index)
+            elif kind == HERE_DOCUMENT:
+                yield HereDocument.view(self, index)
+            else:
+                yield LParen() if kind == LPAREN else RParen()
+
+    def __len__(self):
+        return len(self.kinds)
@@ -12,12 +12,21 @@ from .sentence import Sentence
 
 
 def transform(sentence, transforms, word=False, inverse=False):
+    """Apply ``transforms`` to ``sentence`` in turn.
+
+    :param sentence: the :class:`Sentence <twosheds.sentence.Sentence>` to
+                     transform, or a single token if ``word`` is set
+    :param transforms: a list of transforms, or a :class:`Pipeline` compiled
+                       from them
+    :param word: (optional) set True to transform a single token
+    :param inverse: (optional) set True to undo the transforms, in reverse
+                    order. Ignored if ``transforms`` is a :class:`Pipeline`.
+    """
     if word:
         sentence = Sentence([sentence])
-    if inverse:
-        transforms = reversed(transforms)
-    for t in transforms:
-        sentence = t(sentence, inverse)
+    if not isinstance(transforms, Pipeline):
+        transforms = Pipeline(transforms, inverse)
+    sentence = transforms(sentence)
     if word:
         return sentence.tokens[0]
     return sentence
@@ -27,6 +36,94 @@ class Transform(object):
     def __call__(self, sentence, inverse=False):
         raise NotImplementedError("Transformations must be callable.")
 
+    def token_transform(self, inverse=False):
+        """Describe the transform as a function of each token, so that it can
+        be fused with others into a single pass over a sentence.
+
+        Returns a pair ``(prefixes, func)``. ``prefixes`` is a tuple of strings
+        such that tokens starting with none of them are left as they are, or
+        ``None`` if any token might change. ``func`` takes a token starting
+        with one of them and returns what it becomes. Returns ``None`` if the
+        transform cannot be applied one token at a time, which is the
+        default.
+
+        The pair may capture the state of the transform, and is asked for
+        again whenever a :class:`Pipeline` is compiled.
+
+        :param inverse: (optional) set True to describe the inverse transform
+        """
+        return None
+
+
+def fuse(steps):
+    """Fuse ``(prefixes, func)`` pairs into a function which applies each of
+    them to every token of a sentence, in a single pass.
+
+    Tokens which start with none of the prefixes are passed over without
+    calling any of the functions.
+
+    :param steps: the pairs returned by :meth:`Transform.token_transform`
+    """
+    if any(prefixes is None for prefixes, _ in steps):
+        prefixes = None
+    else:
+        prefixes = tuple(prefix for p, _ in steps for prefix in p)
+    if len(steps) == 1:
+        func = steps[0][1]
+    else:
+        def func(token):
+            for p, f in steps:
+                if p is None or token.startswith(p):
+                    token = f(token)
+            return token
+
+    def apply(sentence):
+        if prefixes is None:
+            sentence.tokens = [func(token) for token in sentence.tokens]
+        else:
+            sentence.tokens = [func(token) if token.startswith(prefixes)
+                               else token for token in sentence.tokens]
+        return sentence
+    return apply
+
+
+class Pipeline(object):
+    """A list of transforms compiled for applying to many sentences.
+
+    Consecutive transforms which describe themselves through
+    :meth:`Transform.token_transform` are fused into a single pass, which
+    builds one new list of tokens. Any others are called as usual.
+
+    :param transforms: the transforms to apply, in order
+    :param inverse: (optional) set True to undo the transforms instead, in
+                    reverse order
+    """
+    def __init__(self, transforms, inverse=False):
+        self.inverse = inverse
+        self.stages = []
+        if inverse:
+            transforms = reversed(transforms)
+        steps = []
+        for t in transforms:
+            try:
+                step = t.token_transform(inverse)
+            except AttributeError:  # a transform which predates the protocol
+                step = None
+            if step is not None:
+                steps.append(step)
+                continue
+            if steps:
+                self.stages.append(fuse(steps))
+                steps = []
+            self.stages.append(lambda sentence, t=t: t(sentence, inverse))
+        if steps:
+            self.stages.append(fuse(steps))
+
+    def __call__(self, sentence):
+        for stage in self.stages:
+            sentence = stage(sentence)
+        return sentence
+
 
 def is_variable(token):
     """Check if a token is a variable."""
@@ -45,24 +142,40 @@ class VariableTransform(Transform):
     >>> t('cd /Users/arthurjackson', inverse=True)
     'cd $HOME'
 
+    Given an :class:`Environment <twosheds.environment.Environment>`, the
+    names of the variables holding each value are looked up in a table it
+    keeps up to date, rather than one built for each sentence.
+
     :param environment: dictionary of variables to expand
     """
     def __init__(self, environment=None):
         self.environment = environment or {}
 
-    @property
-    def _inverse_environment(self):
-        # NOTE: This will be unreliable if two variables have the same value.
-        return {v: k for k, v in self.environment.items()}
+    def _name_of(self):
+        try:
+            # an Environment keeps its own table of names
+            return self.environment.name_of
+        except AttributeError:
+            # NOTE: This will be unreliable if two variables have the same
+            # value.
+            return {v: k for k, v in self.environment.items()}.get
+
+    def token_transform(self, inverse=False):
+        if inverse:
+            name_of = self._name_of()
+
+            def func(token):
+                name = name_of(token)
+                return token if name is None else "$" + name
+            return None, func
+        get = self.environment.get
+        return ("$",), lambda token: get(token[1:], token)
 
     def _transform(self, tokens, inverse=False):
-        inverse_environment = self._inverse_environment
         if inverse:
+            _, func = self.token_transform(inverse)
             for token in tokens:
-                try:
-                    yield "$" + inverse_environment[token]
-                except KeyError:
-                    yield token
+                yield func(token)
         else:
             for token in tokens:
                 if is_variable(token):
@@ -91,6 +204,11 @@ class TildeTransform(Transform):
     def __init__(self, home):
         self.home = home
 
+    def token_transform(self, inverse=False):
+        TILDE = "~"
+        source, target = (self.home, TILDE) if inverse else (TILDE, self.home)
+        return (source,), lambda token: token.replace(source, target)
+
     def _transform(self, sentence, inverse=False):
         TILDE = "~"
         source, target = (self.home, TILDE) if inverse else (TILDE, self.home)